@@ -34,7 +34,7 @@ SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'django-insecure-9u!3=(o5vzh_6yaw-8&
 
 # SECURITY WARNING: don't run with debug turned on in production!
 # In settings.py
-DEBUG = True
+DEBUG = os.getenv('DJANGO_DEBUG', 'True') == 'True'
 
 # For development, add this:
 if DEBUG:
@@ -165,9 +165,85 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Fichiers statiques de production (STATIC_MANIFEST, activé par défaut quand DEBUG est faux) :
+# `manage.py build_assets` collecte les fichiers sous des noms hachés avec leur variante .gz
+# (core/staticfiles.py) et compresse hors ligne les blocs {% compress %} (lots CACHE/ hachés
+# et précompressés, anciens lots supprimés). Il doit avoir tourné avant le premier rendu.
+# Sans STATIC_MANIFEST (développement, tests), les fichiers sources sont servis tels quels.
+STATIC_MANIFEST = os.getenv('STATIC_MANIFEST', str(not DEBUG)) == 'True'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'compressor': {'BACKEND': 'compressor.storage.GzipCompressorFileStorage'},
+}
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'compressor.finders.CompressorFinder',
+]
+# Lots générés au build (COMPRESS_ROOT = STATIC_ROOT par défaut), uniquement avec STATIC_MANIFEST
+COMPRESS_ENABLED = COMPRESS_OFFLINE = STATIC_MANIFEST
+
+# Service de STATIC_ROOT par Django (core.staticfiles.serve_static) : à désactiver quand un
+# serveur web ou un CDN sert STATIC_ROOT. Les noms hachés sont mis en cache un an
+# (immutable), les autres STATIC_MAX_AGE secondes.
+STATIC_SERVE = os.getenv('STATIC_SERVE', 'True') == 'True'
+STATIC_MAX_AGE = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Clé AES pour le chiffrement (à changer en production !)
 AES_SECRET_KEY = os.getenv('AES_SECRET_KEY', 'ma-cle-secrete-32-caractères!!')
+
+# Mode de chiffrement des nouveaux messages : 'GCM', 'CTR', 'CBC' ou 'LEGACY'
+# (ancien format sans en-tête). Le déchiffrement reconnaît tous les formats.
+AES_CIPHER_MODE = os.getenv('AES_CIPHER_MODE', 'GCM')
+
+# Stockage des messages chiffrés en binaire brut (BinaryField) plutôt qu'en base64
+CRYPTO_BINARY_STORAGE = True
+
+# Compression avant chiffrement des messages ('zlib', 'lzma' ou vide pour désactiver),
+# ignorée quand elle ne réduit pas la taille ou que le texte dépasse CRYPTO_MAX_DECOMPRESSED_SIZE.
+# Le déchiffrement la détecte tout seul.
+CRYPTO_COMPRESSION = os.getenv('CRYPTO_COMPRESSION') or None
+# Taille maximale d'un texte décompressé au déchiffrement (octets) : au-delà, l'enveloppe
+# est rejetée (protection contre les bombes de décompression)
+CRYPTO_MAX_DECOMPRESSED_SIZE = 4 * 1024 * 1024
+
+# Dérivation des clés personnalisées par KDF : 'pbkdf2', 'scrypt' ou vide pour l'ancienne
+# troncature ; la clé du serveur n'est pas dérivée. Le coût (log2 des itérations PBKDF2 ou
+# du paramètre N de scrypt, défaut 19 ou 14) et le sel sont inscrits dans l'enveloppe : le
+# coût peut évoluer sans rendre les anciens messages illisibles (jusqu'au maximum, 24 ou 18),
+# et ceux sans sel restent déchiffrables. Seules les enveloppes fournies par un client (vues
+# de déchiffrement, API) d'un coût supérieur au coût configuré sont refusées.
+CRYPTO_KDF = os.getenv('CRYPTO_KDF', 'pbkdf2') or None
+CRYPTO_KDF_COST = int(os.getenv('CRYPTO_KDF_COST', '0')) or None
+# Cache des clés dérivées par processus : nombre d'entrées et durée de vie (secondes).
+# Un même sel sert aux chiffrements sous une clé tant que son entrée n'a pas expiré.
+CRYPTO_KDF_CACHE_SIZE = 1024
+CRYPTO_KDF_CACHE_TTL = 3600
+
+# Pool de workers pour les traitements par lot ('thread', 'process' ou 'serial')
+CRYPTO_EXECUTOR = os.getenv('CRYPTO_EXECUTOR', 'thread')
+CRYPTO_MAX_WORKERS = int(os.getenv('CRYPTO_MAX_WORKERS', '0')) or None
+
+# Vues async (encrypt, decrypt, messages) pour un déploiement ASGI (core.asgi)
+CRYPTO_ASYNC_VIEWS = os.getenv('CRYPTO_ASYNC_VIEWS', 'False') == 'True'
+
+# Écriture différée des messages de encrypt_view : file en mémoire vidée par lots
+# par un thread d'écriture (voir crypto_app/writebehind.py)
+CRYPTO_WRITE_BEHIND = os.getenv('CRYPTO_WRITE_BEHIND', 'False') == 'True'
+CRYPTO_WRITE_BEHIND_MAX_SIZE = 10000
+
+# Durée de conservation des messages par formule, en jours (None : illimitée),
+# appliquée par `manage.py purge_messages --by-tier`
+CRYPTO_RETENTION_DAYS = {
+    'free': 30,
+    'premium': 365,
+    'enterprise': None,
+}
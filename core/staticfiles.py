@@ -0,0 +1,125 @@
+# core/staticfiles.py
+"""Fichiers statiques de production : noms hachés, variantes gzip et service avec cache long.
+
+`collectstatic` (CompressedManifestStaticFilesStorage) copie les fichiers dans
+STATIC_ROOT sous un nom contenant le hachage de leur contenu (staticfiles.json)
+et écrit à côté des fichiers texte une variante .gz précompressée. Les lots
+de django-compressor (CACHE/) sont hachés et précompressés de la même façon
+par GzipCompressorFileStorage (voir `manage.py build_assets`).
+
+`serve_static` sert STATIC_ROOT : variante .gz quand le client accepte gzip,
+cache d'un an `immutable` pour les noms hachés (leur contenu ne change
+jamais), revalidation courte (ETag / Last-Modified) pour les autres.
+"""
+import gzip
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+
+from compressor.cache import flush_offline_manifest, get_offline_manifest
+from compressor.conf import settings as compressor_settings
+from compressor.storage import default_storage as compressor_storage
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+# Extensions précompressées et taille en dessous de laquelle gzip ne fait rien gagner
+GZIP_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico')
+GZIP_MIN_SIZE = 256
+
+# Durée de cache des noms hachés (un an) ; STATIC_MAX_AGE pour les autres
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Nom contenant un hachage de 12 caractères : ManifestStaticFilesStorage et django-compressor
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+
+def write_gzip_variant(path):
+    """Écrit `path`.gz (niveau 9) si le fichier s'y prête et y gagne ; retourne True si écrit"""
+    path = Path(path)
+    variant = path.with_name(path.name + '.gz')
+    if not path.name.endswith(GZIP_EXTENSIONS) or path.stat().st_size < GZIP_MIN_SIZE:
+        return False
+    data = path.read_bytes()
+    # mtime=0 : variante identique d'un build à l'autre pour un même contenu
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) >= len(data):
+        variant.unlink(missing_ok=True)
+        return False
+    variant.write_bytes(compressed)
+    return True
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage qui précompresse en gzip les fichiers collectés"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if self.exists(name):
+                write_gzip_variant(self.path(name))
+
+
+def prune_compressed_bundles():
+    """Supprime les lots CACHE/ (et leur .gz) absents du manifeste hors ligne ; retourne leurs noms"""
+    flush_offline_manifest()
+    rendered = ''.join(get_offline_manifest().values())
+    removed = []
+    for kind in ('css', 'js'):
+        directory = f"{compressor_settings.COMPRESS_OUTPUT_DIR}/{kind}"
+        if not compressor_storage.exists(directory):
+            continue
+        for filename in compressor_storage.listdir(directory)[1]:
+            name = f"{directory}/{filename}"
+            if name.removesuffix('.gz') not in rendered:
+                compressor_storage.delete(name)
+                removed.append(name)
+    return removed
+
+
+def _static_headers(response, name, stat, etag):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    if HASHED_NAME.search(name):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'STATIC_MAX_AGE', 60))
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def serve_static(request, path):
+    """Sert un fichier de STATIC_ROOT, en variante .gz quand elle existe et que le client l'accepte"""
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(settings.STATIC_ROOT, name))
+    except SuspiciousFileOperation:
+        raise Http404("Fichier introuvable")
+    if not fullpath.is_file():
+        raise Http404("Fichier introuvable")
+
+    served = fullpath
+    variant = fullpath.with_name(fullpath.name + '.gz')
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and variant.is_file():
+        served = variant
+
+    stat = fullpath.stat()
+    served_stat = served.stat() if served is not fullpath else stat
+    # ETag propre à chaque variante (taille et date de la variante servie)
+    etag = f'"{served_stat.st_mtime_ns:x}-{served_stat.st_size:x}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return _static_headers(not_modified, name, stat, etag)
+
+    content_type, _ = mimetypes.guess_type(fullpath.name)
+    response = FileResponse(served.open('rb'), content_type=content_type or 'application/octet-stream')
+    if served is not fullpath:
+        response.headers['Content-Encoding'] = 'gzip'
+    return _static_headers(response, name, stat, etag)
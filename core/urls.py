@@ -14,11 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from .views import index,dechiffrement
+from .staticfiles import serve_static
 from django.conf import settings
-from django.conf.urls.static import static
 from django.views.generic import TemplateView
 
 urlpatterns = [
@@ -33,5 +35,8 @@ urlpatterns = [
     path('contact/', TemplateView.as_view(template_name='contact.html'), name='contact'),
     ###########################################################
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+if getattr(settings, 'STATIC_SERVE', settings.DEBUG):
+    # Sous runserver (DEBUG), l'application staticfiles sert les fichiers sources avant ce motif
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static),
+    ]
@@ -0,0 +1,305 @@
+# crypto_app/accounting.py
+"""Compteurs par utilisateur maintenus à chaque insertion et suppression de message.
+
+Les mises à jour sont agrégées (une requête par compteur touché, pas par
+message) et doivent être appelées dans la transaction qui écrit les messages.
+Le volume stocké (UserProfile.bytes_used) est tenu de la même façon, ce qui
+rend la vérification de quota indépendante du nombre de messages. Un nouveau
+message réserve sa place (reserve_quota) avant d'être écrit : vérification et
+décompte se font dans un même UPDATE conditionnel, et les messages encore dans
+la file d'écriture différée sont déjà comptés.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import EncryptedMessage, KeyUsage, MessageCountBucket, UserMessageStats, UserProfile
+
+
+class QuotaExceeded(Exception):
+    """Le message ne tient pas dans le quota de stockage de l'utilisateur"""
+
+
+def message_entry(message):
+    """(utilisateur, jour, identifiant de clé) d'un message ou d'un AccountingState, ou None s'il n'est pas compté"""
+    if message.user_id is None:
+        return None
+    return (message.user_id, timezone.localdate(message.created_at), message.key_id)
+
+
+def message_size(message):
+    """Octets comptés dans le quota : texte original et texte chiffré stockés"""
+    return message.original_length + message.encrypted_length
+
+
+def _sizes(messages, sign=1):
+    sizes = Counter()
+    for message in messages:
+        if message.user_id is not None:
+            sizes[message.user_id] += sign * message_size(message)
+    return sizes
+
+
+def record_created(messages):
+    """Ajoute des messages (instances déjà enregistrées) aux compteurs"""
+    messages = list(messages)
+    # Volume des messages passés par reserve_quota déjà compté
+    unreserved = [message for message in messages if not getattr(message, '_quota_reserved', False)]
+    apply_changes(Counter(filter(None, map(message_entry, messages))), _sizes(unreserved))
+
+
+def record_deleted(messages):
+    """Retire des messages (instances) des compteurs"""
+    messages = list(messages)
+    changes = Counter(filter(None, map(message_entry, messages)))
+    apply_changes({entry: -count for entry, count in changes.items()}, _sizes(messages, -1))
+
+
+def record_updated(previous, message):
+    """Reporte la modification d'un message (`previous` : AccountingState avant modification)"""
+    record_updated_many([(previous, message)])
+
+
+def record_updated_many(pairs):
+    """Reporte la modification de plusieurs messages [(AccountingState précédent, message)] en une fois"""
+    changes = Counter()
+    sizes = Counter()
+    for previous, message in pairs:
+        old_entry, new_entry = message_entry(previous), message_entry(message)
+        if old_entry != new_entry:
+            if old_entry:
+                changes[old_entry] -= 1
+            if new_entry:
+                changes[new_entry] += 1
+        sizes.update(_sizes([message]))
+        sizes.update(_sizes([previous], -1))
+    apply_changes(changes, sizes)
+
+
+def record_queryset_deleted(queryset):
+    """Retire des compteurs les messages d'un queryset, agrégés côté base avant suppression"""
+    rows = (
+        queryset.filter(user__isnull=False)
+        .order_by()
+        .values_list('user_id', TruncDate('created_at'), 'key_id')
+        .annotate(count=Count('id'), size=Sum(F('original_length') + F('encrypted_length')))
+    )
+    changes = {}
+    sizes = Counter()
+    for user_id, day, key, count, size in rows:
+        changes[(user_id, day, key)] = -count
+        sizes[user_id] -= size
+    apply_changes(changes, sizes)
+
+
+def record_queryset_resized(queryset, size):
+    """Reporte sur le volume stocké la mise à la même taille (`size` octets) des messages d'un queryset"""
+    rows = (
+        queryset.filter(user__isnull=False)
+        .order_by()
+        .values_list('user_id')
+        .annotate(count=Count('id'), size=Sum(F('original_length') + F('encrypted_length')))
+    )
+    apply_changes({}, {user_id: count * size - current for user_id, count, current in rows})
+
+
+def apply_changes(changes, sizes=None):
+    """Applique des variations {(utilisateur, jour, identifiant de clé): delta} aux tables de
+    statistiques, et {utilisateur: octets} au volume stocké"""
+    sizes = {user_id: delta for user_id, delta in (sizes or {}).items() if delta}
+    changes = {entry: delta for entry, delta in changes.items() if delta}
+    totals = Counter()
+    buckets = Counter()
+    keys = Counter()
+    for (user_id, day, key_id), delta in changes.items():
+        totals[user_id] += delta
+        buckets[(user_id, MessageCountBucket.DAY, day)] += delta
+        buckets[(user_id, MessageCountBucket.MONTH, day.replace(day=1))] += delta
+        if key_id:
+            keys[(user_id, key_id)] += delta
+
+    if not totals and not sizes:
+        return
+
+    with transaction.atomic():
+        for user_id, delta in sizes.items():
+            _increment(UserProfile, {'user_id': user_id}, 'bytes_used', delta)
+
+        for user_id, delta in totals.items():
+            _increment(UserMessageStats, {'user_id': user_id}, 'total_messages', delta)
+
+        for (user_id, period, start), delta in buckets.items():
+            if delta:
+                _increment(MessageCountBucket, {'user_id': user_id, 'period': period, 'start': start}, 'count', delta)
+
+        for (user_id, key_id), delta in keys.items():
+            if delta:
+                _increment(KeyUsage, {'user_id': user_id, 'key_id': key_id}, 'message_count', delta)
+
+        # Le nombre de clés distinctes ne change que pour les utilisateurs dont une clé a bougé
+        touched_users = {user_id for user_id, _ in keys}
+        if touched_users:
+            KeyUsage.objects.filter(user_id__in=touched_users, message_count__lte=0).delete()
+            for user_id in touched_users:
+                UserMessageStats.objects.filter(user_id=user_id).update(
+                    distinct_keys=KeyUsage.objects.filter(user_id=user_id).count()
+                )
+
+
+def _increment(model, lookup, field, delta):
+    if not delta:
+        model.objects.get_or_create(**lookup)
+        return
+    updated = model.objects.filter(**lookup).update(**{field: F(field) + delta})
+    if not updated:
+        model.objects.get_or_create(**lookup)
+        model.objects.filter(**lookup).update(**{field: F(field) + delta})
+
+
+def remaining_quota(user):
+    """Octets encore disponibles pour l'utilisateur (lecture d'une ligne, O(1)), réservations comprises"""
+    profile = UserProfile.objects.filter(user=user).values_list('bytes_used', 'storage_limit').first()
+    if profile is None:
+        return UserProfile._meta.get_field('storage_limit').default
+    bytes_used, storage_limit = profile
+    return storage_limit - bytes_used
+
+
+def _reserve(user_id, size):
+    """Ajoute `size` octets à bytes_used si le quota le permet, en un UPDATE conditionnel"""
+    profiles = UserProfile.objects.filter(user_id=user_id, bytes_used__lte=F('storage_limit') - size)
+    if profiles.update(bytes_used=F('bytes_used') + size):
+        return True
+    # Premier message de l'utilisateur : profil créé avec le quota par défaut
+    _, created = UserProfile.objects.get_or_create(user_id=user_id)
+    return created and bool(profiles.update(bytes_used=F('bytes_used') + size))
+
+
+def reserve_quota(message):
+    """Réserve dans le quota la place d'un nouveau message avant son écriture ; lève QuotaExceeded
+    s'il ne tient pas (sans rien réserver)"""
+    size = message_size(message)
+    if not _reserve(message.user_id, size):
+        remaining = remaining_quota(message.user_id)
+        raise QuotaExceeded(f"Quota de stockage dépassé ({size} octets demandés, {max(remaining, 0)} disponibles)")
+    message._quota_reserved = True
+
+
+def reserve_quota_many(messages):
+    """Réserve la place de nouveaux messages ; retourne ceux qui ne tiennent pas dans le quota.
+
+    Un seul UPDATE par utilisateur quand tout tient, sinon un par message (dans l'ordre).
+    """
+    by_user = defaultdict(list)
+    for message in messages:
+        by_user[message.user_id].append(message)
+    refused = []
+    for user_id, user_messages in by_user.items():
+        if _reserve(user_id, sum(map(message_size, user_messages))):
+            reserved = user_messages
+        else:
+            reserved = []
+            for message in user_messages:
+                (reserved if _reserve(user_id, message_size(message)) else refused).append(message)
+        for message in reserved:
+            message._quota_reserved = True
+    return refused
+
+
+def release_quota(messages):
+    """Rend au quota la place réservée de messages finalement non écrits"""
+    messages = [message for message in messages if getattr(message, '_quota_reserved', False)]
+    apply_changes({}, _sizes(messages, -1))
+    for message in messages:
+        message._quota_reserved = False
+
+
+def reconcile_storage(user_ids=None):
+    """Recalcule bytes_used depuis la table des messages ; retourne [(user_id, ancien, nouveau)] corrigés"""
+    messages = EncryptedMessage.objects.filter(user__isnull=False)
+    profiles = UserProfile.objects.all()
+    if user_ids is not None:
+        messages = messages.filter(user_id__in=user_ids)
+        profiles = profiles.filter(user_id__in=user_ids)
+
+    corrected = []
+    with transaction.atomic():
+        actual = dict(
+            messages.order_by()
+            .values_list('user_id')
+            .annotate(size=Sum(F('original_length') + F('encrypted_length')))
+        )
+        recorded = dict(profiles.values_list('user_id', 'bytes_used'))
+        for user_id in set(actual) | set(recorded):
+            expected = actual.get(user_id, 0)
+            if recorded.get(user_id) == expected:
+                continue
+            UserProfile.objects.update_or_create(user_id=user_id, defaults={'bytes_used': expected})
+            corrected.append((user_id, recorded.get(user_id, 0), expected))
+    return corrected
+
+
+def get_message_stats(user, today=None):
+    """Statistiques du tableau de bord en deux requêtes, quel que soit le nombre de messages"""
+    today = today or timezone.localdate()
+    stats = UserMessageStats.objects.filter(user=user).first()
+    counts = dict(
+        MessageCountBucket.objects.filter(user=user)
+        .filter(_dashboard_buckets(today))
+        .values_list('period', 'count')
+    )
+    return _dashboard(stats, counts)
+
+
+async def aget_message_stats(user, today=None):
+    """Version async de get_message_stats"""
+    today = today or timezone.localdate()
+    stats = await UserMessageStats.objects.filter(user=user).afirst()
+    counts = {
+        period: count
+        async for period, count in MessageCountBucket.objects.filter(user=user)
+        .filter(_dashboard_buckets(today))
+        .values_list('period', 'count')
+    }
+    return _dashboard(stats, counts)
+
+
+def _dashboard_buckets(today):
+    return (
+        Q(period=MessageCountBucket.DAY, start=today)
+        | Q(period=MessageCountBucket.MONTH, start=today.replace(day=1))
+    )
+
+
+def _dashboard(stats, counts):
+    return {
+        'total_messages': stats.total_messages if stats else 0,
+        'unique_keys': stats.distinct_keys if stats else 0,
+        'messages_today': counts.get(MessageCountBucket.DAY, 0),
+        'messages_this_month': counts.get(MessageCountBucket.MONTH, 0),
+    }
+
+
+def rebuild(user_ids=None):
+    """Recalcule entièrement les statistiques (toutes ou pour certains utilisateurs)"""
+    messages = EncryptedMessage.objects.filter(user__isnull=False)
+    if user_ids is not None:
+        messages = messages.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        for model in (UserMessageStats, MessageCountBucket, KeyUsage):
+            existing = model.objects.all()
+            if user_ids is not None:
+                existing = existing.filter(user_id__in=user_ids)
+            existing.delete()
+
+        rows = (
+            messages.order_by()
+            .values_list('user_id', TruncDate('created_at'), 'key_id')
+            .annotate(count=Count('id'))
+            .iterator()
+        )
+        apply_changes(Counter({(user_id, day, key): count for user_id, day, key, count in rows}))
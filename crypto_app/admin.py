@@ -1,87 +1,218 @@
 # crypto_app/admin.py
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.utils.html import format_html
 from django.utils import timezone
-from datetime import timedelta
-from django.http import HttpResponse
-import json
+import time
+from django.http import StreamingHttpResponse
+from django.contrib.auth.models import User
+from django.db.models import Q
 from .models import EncryptedMessage
-from .utils.crypto import decrypt_text
+from .pagination import KeysetPaginator
+from .retention import delete_in_chunks, older_than
+from .search import text_filter
+from .utils.crypto import decrypt_text, decrypt_many
+from .utils.streams import chunked, csv_lines, json_array_lines, ndjson_lines
 
 # Actions personnalisées
 def delete_old_messages(modeladmin, request, queryset):
-    """Action pour supprimer les messages de plus de 30 jours"""
-    cutoff_date = timezone.now() - timedelta(days=30)
-    old_messages = queryset.filter(created_at__lt=cutcutoff_date)
-    count = old_messages.count()
-    old_messages.delete()
+    """Action pour supprimer les messages de plus de 30 jours (par lots, voir retention.py)"""
+    count = delete_in_chunks(older_than(queryset, 30))
     modeladmin.message_user(request, f"{count} messages anciens ont été supprimés.")
 delete_old_messages.short_description = "🗑️ Supprimer les messages de plus de 30 jours"
 
-def export_messages_json(modeladmin, request, queryset):
-    """Action pour exporter les messages sélectionnés"""
-    data = []
-    for message in queryset:
-        data.append({
+# Lignes lues par requête lors des exports en flux
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = ['id', 'user', 'original_text', 'encrypted_text', 'encryption_key', 'created_at']
+
+def _export_rows(queryset):
+    """Messages sélectionnés lus par paquets (utilisateur joint), un dict par message"""
+    for message in queryset.select_related('user').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
             'id': message.id,
             'user': message.user.username if message.user else 'Anonyme',
             'original_text': message.original_text,
-            'encrypted_text': message.encrypted_text,
+            'encrypted_text': message.get_encrypted_text(),
             'encryption_key': message.encryption_key or 'Défaut',
             'created_at': message.created_at.isoformat(),
-        })
-    
-    response = HttpResponse(json.dumps(data, indent=2, ensure_ascii=False), content_type='application/json')
-    response['Content-Disposition'] = 'attachment; filename="messages_export.json"'
+        }
+
+def _export_response(lines, content_type, extension):
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="messages_export.{extension}"'
     return response
+
+def export_messages_json(modeladmin, request, queryset):
+    """Action pour exporter les messages sélectionnés (tableau JSON en flux)"""
+    return _export_response(
+        json_array_lines(_export_rows(queryset), indent=2), 'application/json', 'json'
+    )
 export_messages_json.short_description = "📤 Exporter en JSON"
 
+def export_messages_ndjson(modeladmin, request, queryset):
+    """Action pour exporter les messages sélectionnés (un objet JSON par ligne)"""
+    return _export_response(
+        ndjson_lines(_export_rows(queryset)), 'application/x-ndjson', 'ndjson'
+    )
+export_messages_ndjson.short_description = "📤 Exporter en NDJSON"
+
+def export_messages_csv(modeladmin, request, queryset):
+    """Action pour exporter les messages sélectionnés en CSV"""
+    return _export_response(
+        csv_lines(_export_rows(queryset), EXPORT_FIELDS), 'text/csv; charset=utf-8', 'csv'
+    )
+export_messages_csv.short_description = "📤 Exporter en CSV"
+
 def anonymize_messages(modeladmin, request, queryset):
-    """Action pour anonymiser le contenu des messages"""
-    for message in queryset:
-        message.original_text = "[CONTENU ANONYMISÉ]"
-        message.encrypted_text = "[CHIFFRÉ ANONYMISÉ]"
-        message.save()
-    modeladmin.message_user(request, f"{queryset.count()} messages ont été anonymisés.")
+    """Action pour anonymiser le contenu des messages (un seul UPDATE)"""
+    count = queryset.anonymize()
+    modeladmin.message_user(request, f"{count} messages ont été anonymisés.")
 anonymize_messages.short_description = "🎭 Anonymiser le contenu"
 
-def decrypt_selected_messages(modeladmin, request, queryset):
-    """Action pour déchiffrer les messages sélectionnés"""
-    results = []
-    for message in queryset:
-        try:
-            decrypted_text = decrypt_text(message.encrypted_text, message.encryption_key or None)
-            results.append({
-                'id': message.id,
-                'status': '✅ Succès',
-                'decrypted_text': decrypted_text
-            })
-        except Exception as e:
-            results.append({
-                'id': message.id,
-                'status': '❌ Erreur',
-                'error': str(e)
-            })
+# Messages déchiffrés ensemble (un appel à decrypt_many) dans le rapport de déchiffrement
+DECRYPT_CHUNK_SIZE = 1000
+
+def _decryption_report(queryset):
+    """Rapport de déchiffrement produit paquet par paquet, suivi d'un résumé"""
+    yield "RAPPORT DE DÉCHIFFREMENT\n" + "=" * 50 + "\n\n"
+    
+    start = time.monotonic()
+    total = errors = processed_bytes = 0
+    # select_related(None) : l'utilisateur joint par get_queryset n'est pas lu ici
+    messages = queryset.select_related(None).only('id', 'encrypted_text', 'encrypted_data', 'key').iterator(
+        chunk_size=DECRYPT_CHUNK_SIZE
+    )
+    for chunk in chunked(messages, DECRYPT_CHUNK_SIZE):
+        # Enveloppes binaires telles que stockées : pas d'aller-retour par le base64
+        outcomes, readable = {}, []
+        for message in chunk:
+            try:
+                readable.append((message, message.ciphertext))
+            except ValueError as e:
+                # Texte chiffré illisible (ex: message anonymisé)
+                outcomes[message.pk] = (0, None, f"Erreur lors du déchiffrement: {str(e)}")
+        # Déchiffrement du paquet en parallèle (groupé par clé, voir decrypt_many)
+        decrypted = decrypt_many(
+            ((payload, message.encryption_key or None) for message, payload in readable), binary=True
+        )
+        for (message, payload), (value, error) in zip(readable, decrypted):
+            if error is None:
+                try:
+                    value = value.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    value, error = None, f"Texte déchiffré invalide: {str(e)}"
+            outcomes[message.pk] = (len(payload), value, error)
+        
+        lines = []
+        for message in chunk:
+            size, value, error = outcomes[message.pk]
+            processed_bytes += size
+            lines.append(f"Message ID: {message.id}\n")
+            if error is None:
+                lines.append("Status: ✅ Succès\n")
+                lines.append(f"Texte déchiffré: {value}\n")
+            else:
+                errors += 1
+                lines.append("Status: ❌ Erreur\n")
+                lines.append(f"Erreur: {error}\n")
+            lines.append("-" * 30 + "\n")
+        total += len(chunk)
+        yield ''.join(lines)
     
-    # Créer un rapport de déchiffrement
-    response = HttpResponse(content_type='text/plain')
+    elapsed = time.monotonic() - start
+    rate = total / elapsed if elapsed else 0
+    yield (
+        "\n" + "=" * 50 + "\nRÉSUMÉ\n"
+        f"Messages traités: {total}\n"
+        f"Succès: {total - errors}\n"
+        f"Erreurs: {errors}\n"
+        f"Durée: {elapsed:.2f} s\n"
+        f"Débit: {rate:.0f} messages/s, {processed_bytes / elapsed / 1e6 if elapsed else 0:.2f} Mo/s\n"
+    )
+
+def decrypt_selected_messages(modeladmin, request, queryset):
+    """Action pour déchiffrer les messages sélectionnés (rapport envoyé au fil du déchiffrement)"""
+    response = StreamingHttpResponse(_decryption_report(queryset), content_type='text/plain; charset=utf-8')
     response['Content-Disposition'] = 'attachment; filename="rapport_dechiffrement.txt"'
+    return response
+decrypt_selected_messages.short_description = "🔓 Déchiffrer et exporter"
+
+# Paramètres de la pagination par curseur de la liste admin (voir EncryptedMessageChangeList)
+CURSOR_VARS = ('after', 'before')
+
+class EncryptedMessageChangeList(ChangeList):
+    """Liste admin sans les colonnes volumineuses (aperçus précalculés à la place), paginée par curseur.
+
+    Seule la page affichée est allégée : les actions reçoivent un queryset complet.
+    Dans l'ordre par défaut (-created_at, -id), les pages sont lues par
+    KeysetPaginator : ni COUNT(*) ni OFFSET, même coût à toute profondeur. Un tri
+    sur une autre colonne ou « Tout afficher » repasse par la pagination de Django.
+    """
+    def __init__(self, request, *args, **kwargs):
+        self.cursors = {name: request.GET.get(name) for name in CURSOR_VARS}
+        self.keyset_page = None
+        super().__init__(request, *args, **kwargs)
+        # Liens de filtre, de tri et de recherche : retour à la première page
+        for name in CURSOR_VARS:
+            self.params.pop(name, None)
+            self.filter_params.pop(name, None)
     
-    content = "RAPPORT DE DÉCHIFFREMENT\n"
-    content += "=" * 50 + "\n\n"
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in CURSOR_VARS:
+            lookup_params.pop(name, None)
+        return lookup_params
     
-    for result in results:
-        content += f"Message ID: {result['id']}\n"
-        content += f"Status: {result['status']}\n"
-        if 'decrypted_text' in result:
-            content += f"Texte déchiffré: {result['decrypted_text']}\n"
-        else:
-            content += f"Erreur: {result['error']}\n"
-        content += "-" * 30 + "\n"
+    def get_results(self, request):
+        self.queryset = self.queryset.defer(*EncryptedMessage.LARGE_FIELDS)
+        if self.show_all or ORDER_VAR in self.params:
+            super().get_results(request)
+            return
+        
+        self.paginator = KeysetPaginator(self.queryset, self.list_per_page)
+        self.keyset_page = self.paginator.get_page(self.cursors['after'], self.cursors['before'])
+        self.result_list = self.keyset_page.object_list
+        # Pas de total : seule la page affichée est comptée, le nombre de résultats n'est pas affiché
+        self.result_count = self.full_result_count = len(self.result_list)
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.keyset_page.has_other_pages()
     
-    response.write(content)
-    return response
-decrypt_selected_messages.short_description = "🔓 Déchiffrer et exporter"
+    @property
+    def next_page_url(self):
+        return self.get_query_string({'after': self.keyset_page.next_cursor})
+    
+    @property
+    def previous_page_url(self):
+        return self.get_query_string({'before': self.keyset_page.previous_cursor})
+
+class UserFilter(admin.SimpleListFilter):
+    """Filtre par nom d'utilisateur saisi dans un champ de recherche (la liste des comptes ne tient pas dans la barre latérale)"""
+    title = 'utilisateur'
+    parameter_name = 'user'
+    template = 'admin/crypto_app/user_filter.html'
+    
+    def lookups(self, request, model_admin):
+        # Aucun choix listé : une entrée factice pour que le filtre soit affiché (has_output)
+        return [(None, None)]
+    
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Tous',
+            'parameter_name': self.parameter_name,
+            'value': self.value() or '',
+            # Autres paramètres de la liste (recherche, filtres, tri) conservés par le formulaire
+            'query_parts': [(key, value) for key, value in changelist.params.items() if key != self.parameter_name],
+        }
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            # Nom exact : index unique de auth_user, pas de parcours des messages
+            return queryset.filter(user__username=self.value().strip())
+        return queryset
 
 @admin.register(EncryptedMessage)
 class EncryptedMessageAdmin(admin.ModelAdmin):
@@ -90,6 +221,8 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
         decrypt_selected_messages,
         delete_old_messages, 
         export_messages_json, 
+        export_messages_ndjson,
+        export_messages_csv,
         anonymize_messages
     ]
     
@@ -103,21 +236,34 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
         'quick_decrypt'
     ]
     
-    list_filter = ['created_at', 'user']
-    search_fields = ['original_text', 'encrypted_text', 'user__username', 'user__email']
+    # Utilisateur joint dans la requête de la liste (user_info)
+    list_select_related = ['user']
+    list_filter = ['created_at', UserFilter]
+    # Recherche via l'index plein texte (voir get_search_results), pas sur le texte chiffré
+    search_fields = ['original_text', 'user__username', 'user__email']
+    # Sélection de l'utilisateur par recherche plutôt qu'une liste de tous les comptes
+    autocomplete_fields = ['user']
     readonly_fields = [
         'created_at', 
+        'key',
+        'user_info_detailed',
         'encrypted_text_preview',
         'decryption_status',
+        'manual_decryption',
+        'key_type_display',
         'security_info'
     ]
-    ordering = ['-created_at']
+    # Même ordre que l'index (user, -created_at, -id) : tri sans passe supplémentaire
+    ordering = ['-created_at', '-id']
     list_per_page = 25
+    # Pas de second COUNT(*) sur toute la table quand la liste est filtrée
+    show_full_result_count = False
     
     # Champs affichés dans le détail
     fieldsets = (
         ('Informations du Message', {
             'fields': (
+                'user',
                 'user_info_detailed',
                 'original_text',
                 'encrypted_text_preview',
@@ -132,7 +278,7 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
         }),
         ('Configuration', {
             'fields': (
-                'encryption_key',
+                'key',
                 'key_type_display',
             )
         }),
@@ -144,6 +290,32 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Page de détail : utilisateur chargé avec le message (user_info_detailed, security_info)
+        return super().get_queryset(request).select_related('user')
+    
+    def get_changelist(self, request, **kwargs):
+        return EncryptedMessageChangeList
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Texte original via l'index FTS5, utilisateur via la table des comptes (pas de LIKE sur les messages)"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        users = User.objects.filter(
+            Q(username__icontains=search_term) | Q(email__icontains=search_term)
+        ).values('pk')
+        return queryset.filter(text_filter(search_term, queryset.db) | Q(user__in=users)), False
+    
+    def _decrypt(self, obj):
+        """Déchiffre le message une seule fois par instance (donc par requête) : (texte, erreur)"""
+        if not hasattr(obj, '_admin_decryption'):
+            try:
+                obj._admin_decryption = (decrypt_text(obj.get_encrypted_text(), obj.encryption_key or None), None)
+            except Exception as e:
+                obj._admin_decryption = (None, str(e))
+        return obj._admin_decryption
+    
     # Méthodes d'affichage personnalisées
     def user_info(self, obj):
         if obj.user:
@@ -174,16 +346,16 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
     user_info_detailed.short_description = 'Informations Utilisateur'
     
     def truncated_original_text(self, obj):
-        truncated = obj.original_text[:50] + '...' if len(obj.original_text) > 50 else obj.original_text
+        truncated = obj.original_preview[:50] + '...' if len(obj.original_preview) > 50 else obj.original_preview
         return format_html(
             '<div title="{}" style="max-width: 200px;">{}</div>',
-            obj.original_text,
+            obj.original_preview,
             truncated
         )
     truncated_original_text.short_description = 'Message Original'
     
     def key_type_badge(self, obj):
-        if obj.encryption_key:
+        if obj.key_id:
             return format_html(
                 '<span style="background: #10b981; color: white; padding: 4px 8px; border-radius: 12px; font-size: 11px;">🔑 Personnalisée</span>'
             )
@@ -193,7 +365,7 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
     key_type_badge.short_description = 'Type de Clé'
     
     def key_type_display(self, obj):
-        if obj.encryption_key:
+        if obj.key_id:
             return format_html(
                 '<div style="color: #10b981; font-weight: bold;">🔑 Clé personnalisée utilisée</div>'
             )
@@ -203,7 +375,7 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
     key_type_display.short_description = 'Type de Clé'
     
     def encrypted_text_preview(self, obj):
-        preview = obj.encrypted_text[:100] + '...' if len(obj.encrypted_text) > 100 else obj.encrypted_text
+        preview = obj.encrypted_preview + '...' if len(obj.encrypted_preview) >= obj.PREVIEW_LENGTH else obj.encrypted_preview
         return format_html(
             '<div style="font-family: monospace; background: #1f2937; color: #10b981; padding: 10px; border-radius: 5px; overflow-x: auto; font-size: 12px;">{}</div>',
             preview
@@ -228,8 +400,8 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
     quick_decrypt.short_description = 'Test Déchiffrement'
     
     def decryption_status(self, obj):
-        try:
-            decrypted_text = decrypt_text(obj.encrypted_text, obj.encryption_key or None)
+        decrypted_text, error = self._decrypt(obj)
+        if error is None:
             return format_html(
                 '''
                 <div style="padding: 10px; background: #d1fae5; border: 1px solid #10b981; border-radius: 5px;">
@@ -241,21 +413,20 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
                 ''',
                 decrypted_text
             )
-        except Exception as e:
-            return format_html(
-                '''
-                <div style="padding: 10px; background: #fee2e2; border: 1px solid #ef4444; border-radius: 5px;">
-                    <strong style="color: #991b1b;">❌ Erreur de déchiffrement</strong><br>
-                    <small>{}</small>
-                </div>
-                ''',
-                str(e)
-            )
+        return format_html(
+            '''
+            <div style="padding: 10px; background: #fee2e2; border: 1px solid #ef4444; border-radius: 5px;">
+                <strong style="color: #991b1b;">❌ Erreur de déchiffrement</strong><br>
+                <small>{}</small>
+            </div>
+            ''',
+            error
+        )
     decryption_status.short_description = 'Statut Déchiffrement'
     
     def security_info(self, obj):
         key_length = len(obj.encryption_key) if obj.encryption_key else "Défaut"
-        text_length = len(obj.original_text)
+        text_size = obj.original_length
         age_days = (timezone.now() - obj.created_at).days
         
         return format_html(
@@ -263,13 +434,13 @@ class EncryptedMessageAdmin(admin.ModelAdmin):
             <div style="padding: 10px; background: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px;">
                 <strong>🔒 Informations de Sécurité</strong><br>
                 <small>📏 Longueur clé: <strong>{}</strong></small><br>
-                <small>📝 Longueur texte: <strong>{} caractères</strong></small><br>
+                <small>📝 Taille texte: <strong>{} octets</strong></small><br>
                 <small>🕐 Âge: <strong>{} jours</strong></small><br>
                 <small>👤 Utilisateur: <strong>{}</strong></small>
             </div>
             ''',
             key_length,
-            text_length,
+            text_size,
             age_days,
             obj.user.username if obj.user else "Anonyme"
         )
@@ -299,7 +470,7 @@ class SimpleEncryptedMessageAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'truncated_original', 'created_at', 'quick_actions']
     
     def truncated_original(self, obj):
-        return obj.original_text[:50] + '...' if len(obj.original_text) > 50 else obj.original_text
+        return obj.original_preview[:50] + '...' if len(obj.original_preview) > 50 else obj.original_preview
     truncated_original.short_description = 'Message'
     
     def quick_actions(self, obj):
@@ -0,0 +1,179 @@
+# crypto_app/api.py
+import functools
+import json
+
+from django.db import transaction
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .accounting import record_created, reserve_quota_many
+from .models import EncryptedMessage, EncryptionKey
+from .utils.crypto import encrypt_many, decrypt_many
+from .utils.streams import chunked
+from .writebehind import queue_stats
+
+# Nombre d'éléments chiffrés ensemble (un appel à encrypt_many/decrypt_many)
+API_CHUNK_SIZE = 256
+
+JSON_CONTENT_TYPES = ('application/json',)
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class InvalidItem:
+    """Élément illisible du corps de requête, renvoyé tel quel comme erreur"""
+    def __init__(self, error):
+        self.error = error
+
+
+def read_items(request):
+    """Lit les éléments d'un corps JSON (objet, liste ou {"items": [...]}) ou NDJSON (en flux)"""
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        # Lecture ligne par ligne, sans charger tout le corps en mémoire
+        for line in request:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield InvalidItem(f"JSON invalide: {e}")
+        return
+
+    data = json.loads(request.body)
+    if isinstance(data, dict):
+        data = data['items'] if 'items' in data else [data]
+        if not isinstance(data, list):
+            raise TypeError("'items' doit être une liste")
+    elif not isinstance(data, list):
+        raise TypeError("objet ou liste attendu")
+    yield from data
+
+
+def item_error(item, source_field):
+    """Erreur si l'élément n'est ni une chaîne ni un objet {source_field, "key", "id"}, sinon None"""
+    if isinstance(item, InvalidItem):
+        return item.error
+    if isinstance(item, str):
+        return None
+    if not isinstance(item, dict):
+        return "Élément attendu: chaîne ou objet"
+    if not isinstance(item.get(source_field), str):
+        return f"Champ '{source_field}' manquant"
+    if item.get('key') is not None and not isinstance(item['key'], str):
+        return "Champ 'key' invalide: chaîne attendue"
+    return None
+
+
+def process_items(items, operation, user=None):
+    """Traite les éléments par paquets et produit une ligne NDJSON par élément, dans l'ordre"""
+    source_field = 'text' if operation == 'encrypt' else 'encrypted_text'
+    result_field = 'encrypted_text' if operation == 'encrypt' else 'text'
+    # Enveloppes fournies par le client : coût KDF plafonné (voir accepted_kdf_cost)
+    process_many = encrypt_many if operation == 'encrypt' else functools.partial(decrypt_many, untrusted=True)
+
+    index = 0
+    for chunk in chunked(items, API_CHUNK_SIZE):
+        lines = [None] * len(chunk)
+        pending = []
+        for position, item in enumerate(chunk):
+            line = {'index': index + position}
+            error = item_error(item, source_field)
+            if error is not None:
+                line['error'] = error
+            else:
+                if isinstance(item, str):
+                    # Forme courte : la chaîne seule tient lieu du champ source
+                    item = {source_field: item}
+                if 'id' in item:
+                    line['id'] = item['id']
+                pending.append((position, item))
+            lines[position] = line
+
+        results = process_many((item[source_field], item.get('key') or None) for _, item in pending)
+
+        to_store = []
+        for (position, item), result in zip(pending, results):
+            if result.error is not None:
+                lines[position]['error'] = result.error
+                continue
+            lines[position][result_field] = result.value
+            if user is not None:
+                message = EncryptedMessage(
+                    user=user,
+                    original_text=item[source_field],
+                    encrypted_text=result.value,
+                    key=EncryptionKey.objects.for_secret(item['key']) if item.get('key') else None
+                )
+                message.prepare_ciphertext()
+                to_store.append((position, message))
+
+        if to_store:
+            with transaction.atomic():
+                # Quota réservé par UPDATE conditionnel (un seul pour le paquet quand tout tient)
+                refused = {id(message) for message in reserve_quota_many(message for _, message in to_store)}
+                for position, message in to_store:
+                    if id(message) in refused:
+                        lines[position]['error'] = "Quota de stockage dépassé : message non enregistré"
+                stored = [message for _, message in to_store if id(message) not in refused]
+                EncryptedMessage.objects.bulk_create(stored)
+                record_created(stored)
+
+        for line in lines:
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+        index += len(chunk)
+
+
+def api_response(request, operation):
+    if request.content_type not in JSON_CONTENT_TYPES + NDJSON_CONTENT_TYPES:
+        return JsonResponse(
+            {'error': "Content-Type attendu: application/json ou application/x-ndjson"},
+            status=415
+        )
+
+    # ?store=1 : enregistrer les messages chiffrés pour l'utilisateur connecté
+    user = None
+    if operation == 'encrypt' and request.GET.get('store') == '1':
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Authentification requise pour enregistrer"}, status=401)
+        user = request.user
+
+    items = read_items(request)
+    if request.content_type in JSON_CONTENT_TYPES:
+        # Le JSON classique est lu d'un bloc : erreurs de syntaxe signalées avant le flux
+        try:
+            items = list(items)
+        except (ValueError, TypeError) as e:
+            return JsonResponse({'error': f"JSON invalide: {e}"}, status=400)
+        source_field = 'text' if operation == 'encrypt' else 'encrypted_text'
+        for position, item in enumerate(items):
+            error = item_error(item, source_field)
+            if error is not None:
+                return JsonResponse({'error': f"Élément {position}: {error}"}, status=400)
+
+    return StreamingHttpResponse(
+        process_items(items, operation, user),
+        content_type='application/x-ndjson'
+    )
+
+
+@csrf_exempt
+@require_POST
+def api_encrypt(request):
+    """Chiffre un ou plusieurs éléments {"text", "key", "id"} (ou chaînes) et renvoie du NDJSON en flux"""
+    return api_response(request, 'encrypt')
+
+
+@csrf_exempt
+@require_POST
+def api_decrypt(request):
+    """Déchiffre un ou plusieurs éléments {"encrypted_text", "key", "id"} (ou chaînes) et renvoie du NDJSON en flux"""
+    return api_response(request, 'decrypt')
+
+
+@staff_member_required
+@require_GET
+def api_write_queue(request):
+    """Profondeur et compteurs de la file d'écriture différée (CRYPTO_WRITE_BEHIND)"""
+    return JsonResponse(queue_stats())
@@ -40,4 +40,34 @@ class DecryptionForm(forms.Form):
             'placeholder': 'Entrez la clé utilisée pour le chiffrement'
         }),
         max_length=32
-    )
\ No newline at end of file
+    )
+
+class FileEncryptionForm(forms.Form):
+    OPERATIONS = [
+        ('encrypt', 'Chiffrer'),
+        ('decrypt', 'Déchiffrer'),
+    ]
+
+    file = forms.FileField(
+        label="",
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'block w-full text-sm text-gray-900 border border-gray-300 rounded-lg cursor-pointer bg-gray-50 dark:text-gray-400 focus:outline-none dark:bg-gray-700 dark:border-gray-600'
+        })
+    )
+
+    operation = forms.ChoiceField(
+        label="",
+        choices=OPERATIONS,
+        initial='encrypt',
+        widget=forms.RadioSelect()
+    )
+
+    key = forms.CharField(
+        label="",
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'w-full px-3 py-2 border border-gray-300 dark:border-gray-600 rounded-lg shadow-sm focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:text-white',
+            'placeholder': 'Laissez vide pour utiliser la clé par défaut'
+        }),
+        max_length=32
+    )
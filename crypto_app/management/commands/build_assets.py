@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from core.staticfiles import prune_compressed_bundles
+
+# Entrées du build Tailwind (npm run build:css) : seul src/output.css est servi
+SOURCE_PATTERNS = ['src/input.css', 'src/variants.css']
+
+
+class Command(BaseCommand):
+    help = (
+        "Construit les fichiers statiques de production : collectstatic (noms hachés et variantes gzip), "
+        "compression hors ligne des blocs {% compress %} puis suppression des anciens lots de CACHE/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help="Vider STATIC_ROOT avant la collecte")
+
+    def handle(self, *args, **options):
+        # Les clés du manifeste hors ligne dépendent du rendu de {% static %} : hachées
+        # seulement sans DEBUG, elles doivent être produites avec les réglages de production
+        if settings.DEBUG:
+            raise CommandError("build_assets produit les fichiers de production : lancer avec DJANGO_DEBUG=False")
+        if not getattr(settings, 'STATIC_MANIFEST', False):
+            raise CommandError("STATIC_MANIFEST est désactivé : les fichiers produits ne seraient pas utilisés")
+        verbosity = options['verbosity']
+        call_command('collectstatic', interactive=False, clear=options['clear'], ignore_patterns=SOURCE_PATTERNS,
+                     verbosity=verbosity)
+        call_command('compress', force=True, verbosity=verbosity)
+
+        removed = prune_compressed_bundles()
+        if verbosity > 1:
+            for name in removed:
+                self.stdout.write(f"Supprimé: {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(removed)} fichier(s) de lots obsolètes supprimé(s)"))
@@ -0,0 +1,218 @@
+import base64
+import json
+import os
+import platform
+import statistics
+import time
+
+import Crypto
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crypto_app.utils.crypto import AESCipher, KDFS, MODES, encrypt_many, decrypt_many, kdf_cache_stats
+from crypto_app.utils.pool import get_max_workers, shutdown_executors
+
+SIZE_UNITS = {'B': 1, 'K': 1024, 'M': 1024 * 1024}
+DEFAULT_SIZES = ['100B', '1K', '10K', '100K', '1M', '10M', '100M']
+
+
+def parse_size(value):
+    """Convertit '100B', '10K' ou '1M' en nombre d'octets"""
+    value = value.strip().upper()
+    unit = value[-1] if value[-1] in SIZE_UNITS else 'B'
+    number = value[:-1] if value[-1] in SIZE_UNITS else value
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise CommandError(f"Taille invalide: {value}")
+
+
+def make_payload(size):
+    """Texte ASCII aléatoire de `size` caractères (déchiffrable en UTF-8, peu compressible)"""
+    return base64.b64encode(os.urandom(size * 3 // 4 + 3))[:size].decode('ascii')
+
+
+def summarize(durations, size, items=1):
+    """Latence (ms) et débit (Mo/s) d'une série de mesures"""
+    ordered = sorted(durations)
+    median = statistics.median(ordered)
+    return {
+        'runs': len(ordered),
+        'latency_ms': {
+            'min': round(ordered[0] * 1000, 4),
+            'median': round(median * 1000, 4),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        },
+        'throughput_mb_s': round(size * items / median / 1e6, 2) if median else None,
+    }
+
+
+def case_id(case):
+    return f"{case['operation']}/{case['mode']}/{case['key_size']}/{case['size']}/{case['execution']}"
+
+
+class Command(BaseCommand):
+    help = "Mesure le débit et la latence du chiffrement AES et compare à une référence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                            help="Tailles de payload (ex: 100B 10K 1M)")
+        parser.add_argument('--key-sizes', nargs='+', type=int, default=[16, 24, 32],
+                            choices=[16, 24, 32], help="Longueurs de clé en octets")
+        parser.add_argument('--modes', nargs='+', default=['LEGACY', *MODES],
+                            help="Modes de chiffrement à mesurer")
+        parser.add_argument('--kdf', choices=['none', *KDFS], default='none',
+                            help="Dérivation des clés mesurées (par défaut aucune : la longueur de clé "
+                                 "compte ; avec un KDF, la clé dérivée fait toujours 32 octets)")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Nombre de mesures par cas")
+        parser.add_argument('--time-budget', type=float, default=2.0,
+                            help="Durée maximale (s) par cas, réduit les répétitions des gros payloads")
+        parser.add_argument('--batch-items', type=int, default=256,
+                            help="Nombre d'éléments des mesures par lot")
+        parser.add_argument('--batch-max-size', default='100K',
+                            help="Taille maximale des payloads mesurés par lot")
+        parser.add_argument('--executor', default=None,
+                            help="Pool des mesures par lot ('thread', 'process', 'serial')")
+        parser.add_argument('--output', help="Écrit le rapport JSON dans ce fichier")
+        parser.add_argument('--baseline', help="Rapport de référence à comparer")
+        parser.add_argument('--save-baseline', help="Enregistre ce rapport comme référence")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Baisse de débit (en %%) considérée comme une régression")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Code de sortie non nul en cas de régression")
+
+    def handle(self, *args, **options):
+        modes = [mode.upper() for mode in options['modes']]
+        for mode in modes:
+            if mode != 'LEGACY' and mode not in MODES:
+                raise CommandError(f"Mode inconnu: {mode}")
+
+        # '' : dérivation désactivée (CRYPTO_KDF ignoré)
+        options['kdf'] = '' if options['kdf'] == 'none' else options['kdf']
+        key_sizes = options['key_sizes']
+        if options['kdf'] and len(key_sizes) > 1:
+            self.stderr.write("Avec un KDF, la clé dérivée fait 32 octets : seule la clé de 32 octets est mesurée")
+            key_sizes = [32]
+
+        sizes = [parse_size(size) for size in options['sizes']]
+        batch_max_size = parse_size(options['batch_max_size'])
+
+        cases = []
+        try:
+            for size in sizes:
+                payload = make_payload(size)
+                for key_size in key_sizes:
+                    key = os.urandom(key_size)
+                    for mode in modes:
+                        cases.extend(self.bench_serial(payload, key, mode, options))
+                        if size <= batch_max_size:
+                            cases.extend(self.bench_batched(payload, key, mode, options))
+                        self.stderr.write(f"{size} octets, clé {key_size * 8} bits, {mode} : ok")
+        finally:
+            shutdown_executors()
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'pycryptodome': Crypto.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'max_workers': get_max_workers(),
+                'kdf': options['kdf'] or None,
+                'kdf_cost': AESCipher(b'\0' * 32, kdf=options['kdf']).kdf_cost,
+            },
+            'cases': cases,
+            # Dérivations de clé évitées par le cache (processus principal)
+            'kdf_cache': kdf_cache_stats(),
+        }
+
+        regressions = []
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            report['comparison'], regressions = self.compare(cases, baseline, options['threshold'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as f:
+                f.write(output)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} régression(s) détectée(s): {', '.join(regressions)}")
+
+    def runs_for(self, first_duration, options):
+        """Nombre de répétitions restant dans le budget de temps du cas"""
+        if first_duration <= 0:
+            return options['repeat'] - 1
+        return max(0, min(options['repeat'] - 1, int(options['time_budget'] / first_duration)))
+
+    def measure(self, func, options):
+        start = time.perf_counter()
+        result = func()
+        durations = [time.perf_counter() - start]
+        for _ in range(self.runs_for(durations[0], options)):
+            start = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - start)
+        return durations, result
+
+    def bench_serial(self, payload, key, mode, options):
+        """Un appel par message, comme encrypt_text/decrypt_text (préparation de la clé comprise)"""
+        kdf = options['kdf']
+        # Dérivation de la clé (et de son sel) mise en cache hors mesure, comme en régime établi
+        AESCipher(key, mode, kdf=kdf).encrypt('')
+        durations, encrypted = self.measure(lambda: AESCipher(key, mode, kdf=kdf).encrypt(payload), options)
+        base = {'mode': mode, 'key_size': len(key), 'size': len(payload), 'execution': 'serial', 'items': 1}
+        results = [{'operation': 'encrypt', **base, **summarize(durations, len(payload))}]
+
+        durations, _ = self.measure(lambda: AESCipher(key, mode, kdf=kdf).decrypt(encrypted), options)
+        results.append({'operation': 'decrypt', **base, **summarize(durations, len(payload))})
+        return results
+
+    def bench_batched(self, payload, key, mode, options):
+        """Un lot de --batch-items messages via encrypt_many/decrypt_many"""
+        items = options['batch_items']
+        executor = options['executor']
+        kdf = options['kdf']
+        # Préchauffage : pool démarré et clés dérivées en cache (dans chaque worker atteint)
+        encrypt_many([('', key)] * items, executor=executor, mode=mode, kdf=kdf)
+        durations, encrypted = self.measure(
+            lambda: encrypt_many([(payload, key)] * items, executor=executor, mode=mode, kdf=kdf), options
+        )
+        base = {'mode': mode, 'key_size': len(key), 'size': len(payload), 'execution': 'batched', 'items': items}
+        results = [{'operation': 'encrypt', **base, **summarize(durations, len(payload), items)}]
+
+        pairs = [(result.value, key) for result in encrypted]
+        durations, _ = self.measure(lambda: decrypt_many(pairs, executor=executor, mode=mode), options)
+        results.append({'operation': 'decrypt', **base, **summarize(durations, len(payload), items)})
+        return results
+
+    def compare(self, cases, baseline, threshold):
+        """Compare le débit de chaque cas à la référence ; retourne (détails, régressions)"""
+        reference = {case_id(case): case for case in baseline.get('cases', [])}
+        comparison = []
+        regressions = []
+        for case in cases:
+            previous = reference.get(case_id(case))
+            if not previous or not previous.get('throughput_mb_s') or not case['throughput_mb_s']:
+                continue
+            change = (case['throughput_mb_s'] - previous['throughput_mb_s']) / previous['throughput_mb_s'] * 100
+            regression = change < -threshold
+            comparison.append({
+                'case': case_id(case),
+                'baseline_mb_s': previous['throughput_mb_s'],
+                'current_mb_s': case['throughput_mb_s'],
+                'change_percent': round(change, 2),
+                'regression': regression,
+            })
+            if regression:
+                regressions.append(case_id(case))
+        return comparison, regressions
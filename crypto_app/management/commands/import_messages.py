@@ -0,0 +1,68 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from crypto_app.models import EncryptedMessage
+from crypto_app.utils.streams import iter_json_array, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = "Importe des messages depuis un fichier JSON ou NDJSON (chiffrement par lots, bulk_create)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer ('-' pour l'entrée standard)")
+        parser.add_argument('--format', choices=['json', 'ndjson'],
+                            help="Format du fichier (déduit de l'extension par défaut)")
+        parser.add_argument('--user', help="Nom de l'utilisateur propriétaire de tous les messages")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Messages chiffrés et insérés par lot")
+        parser.add_argument('--transaction-size', type=int, default=10000,
+                            help="Messages écrits par transaction")
+        parser.add_argument('--executor', choices=['thread', 'process', 'serial'],
+                            help="Pool utilisé pour le chiffrement")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('json' if path.endswith('.json') else 'ndjson')
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur introuvable: {options['user']}")
+
+        start = time.monotonic()
+
+        def progress(imported):
+            elapsed = time.monotonic() - start
+            rate = imported / elapsed if elapsed else 0
+            self.stderr.write(f"{imported} messages importés ({rate:.0f}/s)")
+
+        source = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            records = iter_json_array(source) if file_format == 'json' else iter_ndjson(source)
+            result = EncryptedMessage.objects.import_messages(
+                records,
+                user=user,
+                batch_size=options['batch_size'],
+                transaction_size=options['transaction_size'],
+                executor=options['executor'],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(f"Fichier invalide: {e}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        for position, error in result.failed[:20]:
+            self.stderr.write(f"Enregistrement {position} rejeté: {error}")
+        if len(result.failed) > 20:
+            self.stderr.write(f"... et {len(result.failed) - 20} autres rejets")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.imported} messages importés, {len(result.failed)} rejetés "
+            f"en {time.monotonic() - start:.1f}s"
+        ))
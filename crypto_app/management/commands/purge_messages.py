@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crypto_app.retention import DELETE_CHUNK_SIZE, delete_in_chunks, retention_segments
+from crypto_app.utils.checkpoint import clear_checkpoint, load_checkpoint, save_checkpoint
+
+
+class Command(BaseCommand):
+    help = "Supprime par lots les messages plus anciens que la durée de conservation (cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='JOURS',
+                            help="Âge (en jours) au-delà duquel les messages sont supprimés")
+        parser.add_argument('--by-tier', action='store_true',
+                            help="Durée par formule (settings.CRYPTO_RETENTION_DAYS), --older-than par défaut")
+        parser.add_argument('--batch-size', type=int, default=DELETE_CHUNK_SIZE,
+                            help="Messages supprimés par transaction")
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help="Pause (secondes) entre deux lots, pour laisser passer le trafic")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Affiche le nombre de messages concernés sans rien supprimer")
+        parser.add_argument('--checkpoint',
+                            help="Fichier de reprise : une purge interrompue repart du dernier lot")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0:
+            raise CommandError("--older-than doit être positif")
+
+        segments = retention_segments(options['older_than'], options['by_tier'])
+
+        if options['dry_run']:
+            total = 0
+            for name, queryset in segments:
+                count = queryset.count()
+                total += count
+                self.stdout.write(f"{name}: {count} messages à supprimer")
+            self.stdout.write(self.style.SUCCESS(f"Simulation : {total} messages seraient supprimés"))
+            return
+
+        try:
+            checkpoint = load_checkpoint(options['checkpoint'])
+        except ValueError as e:
+            raise CommandError(f"Fichier de reprise invalide: {e}")
+        # Reprendre avec d'autres durées sauterait des messages déjà dépassés par le point de reprise
+        retention = {'older_than': options['older_than'], 'by_tier': options['by_tier']}
+        if checkpoint and {name: checkpoint.get(name) for name in retention} != retention:
+            raise CommandError("Le fichier de reprise correspond à d'autres options de conservation")
+        last_pks = checkpoint.get('last_pk', {})
+        start = time.monotonic()
+        total = 0
+        for name, queryset in segments:
+            def progress(deleted, last_pk, name=name):
+                last_pks[name] = last_pk
+                save_checkpoint(options['checkpoint'], {**retention, 'last_pk': last_pks})
+                elapsed = time.monotonic() - start
+                self.stderr.write(f"{name}: {deleted} supprimés (clé {last_pk}, {elapsed:.1f}s)")
+
+            deleted = delete_in_chunks(
+                queryset,
+                chunk_size=options['batch_size'],
+                progress=progress,
+                pause=options['sleep'],
+                start_after=last_pks.get(name, 0),
+            )
+            total += deleted
+            self.stdout.write(f"{name}: {deleted} messages supprimés")
+
+        # Purge terminée : la prochaine exécution repart de zéro
+        clear_checkpoint(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} messages supprimés en {time.monotonic() - start:.1f}s"
+        ))
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from crypto_app.accounting import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recalcule les statistiques de messages par utilisateur à partir de la table des messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users',
+                            help="Limiter à cet utilisateur (option répétable)")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['users']:
+            users = dict(User.objects.filter(username__in=options['users']).values_list('username', 'id'))
+            missing = set(options['users']) - set(users)
+            if missing:
+                raise CommandError(f"Utilisateur introuvable: {', '.join(sorted(missing))}")
+            user_ids = list(users.values())
+
+        rebuild(user_ids)
+        scope = f"{len(user_ids)} utilisateur(s)" if user_ids is not None else "tous les utilisateurs"
+        self.stdout.write(self.style.SUCCESS(f"Statistiques recalculées pour {scope}"))
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from crypto_app.accounting import reconcile_storage
+
+
+class Command(BaseCommand):
+    help = "Recalcule le volume stocké par utilisateur (UserProfile.bytes_used) et corrige les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users',
+                            help="Limiter à cet utilisateur (option répétable)")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['users']:
+            users = dict(User.objects.filter(username__in=options['users']).values_list('username', 'id'))
+            missing = set(options['users']) - set(users)
+            if missing:
+                raise CommandError(f"Utilisateur introuvable: {', '.join(sorted(missing))}")
+            user_ids = list(users.values())
+
+        corrected = reconcile_storage(user_ids)
+        usernames = dict(User.objects.filter(id__in=[user_id for user_id, _, _ in corrected]).values_list('id', 'username'))
+        for user_id, recorded, actual in corrected:
+            self.stdout.write(f"{usernames.get(user_id, user_id)}: {recorded} -> {actual} octets")
+        self.stdout.write(self.style.SUCCESS(f"{len(corrected)} compteur(s) corrigé(s)"))
@@ -0,0 +1,114 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from crypto_app.models import EncryptedMessage, EncryptionKey
+from crypto_app.rotation import ROTATION_BATCH_SIZE, rotate_in_batches
+from crypto_app.utils.checkpoint import clear_checkpoint, load_checkpoint, save_checkpoint
+from crypto_app.utils.crypto import AESCipher
+
+
+class Command(BaseCommand):
+    help = (
+        "Rechiffre les messages avec une nouvelle clé (clé du serveur, ou clé personnalisée avec --custom). "
+        "Pour la clé du serveur : arrêter les écritures, lancer la rotation puis déployer "
+        "AES_SECRET_KEY avec la nouvelle clé."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--new-key', default=os.getenv('AES_NEW_SECRET_KEY'),
+                            help="Nouvelle clé (par défaut la variable d'environnement AES_NEW_SECRET_KEY, "
+                                 "qui n'apparaît pas dans la liste des processus)")
+        parser.add_argument('--old-key',
+                            help="Ancienne clé (par défaut settings.AES_SECRET_KEY)")
+        parser.add_argument('--custom', action='store_true',
+                            help="Rechiffrer les messages dont la clé personnalisée est --old-key "
+                                 "et leur attribuer la nouvelle clé")
+        parser.add_argument('--user', action='append', dest='users',
+                            help="Limiter aux messages de cet utilisateur (option répétable)")
+        parser.add_argument('--batch-size', type=int, default=ROTATION_BATCH_SIZE,
+                            help="Messages rechiffrés et réécrits par transaction")
+        parser.add_argument('--executor', choices=['thread', 'process', 'serial'],
+                            help="Pool utilisé pour le rechiffrement")
+        parser.add_argument('--mode', choices=['GCM', 'CTR', 'CBC', 'LEGACY'],
+                            help="Mode du nouveau chiffrement (par défaut AES_CIPHER_MODE)")
+        parser.add_argument('--checkpoint',
+                            help="Fichier de reprise : une rotation interrompue repart du dernier lot")
+
+    def handle(self, *args, **options):
+        new_key = options['new_key']
+        if not new_key:
+            raise CommandError("Nouvelle clé manquante (--new-key ou AES_NEW_SECRET_KEY)")
+        if options['custom'] and not options['old_key']:
+            raise CommandError("--custom nécessite --old-key")
+        old_key = options['old_key'] or settings.AES_SECRET_KEY
+
+        old_key_id = AESCipher(old_key).key_id.hex()
+        new_key_id = AESCipher(new_key).key_id.hex()
+        if old_key_id == new_key_id:
+            raise CommandError("La nouvelle clé est identique à l'ancienne")
+
+        if options['custom']:
+            messages = EncryptedMessage.objects.filter(key__fingerprint=EncryptionKey.fingerprint_for(old_key))
+        else:
+            messages = EncryptedMessage.objects.filter(key__isnull=True)
+        if options['users']:
+            users = dict(User.objects.filter(username__in=options['users']).values_list('username', 'id'))
+            missing = set(options['users']) - set(users)
+            if missing:
+                raise CommandError(f"Utilisateur introuvable: {', '.join(sorted(missing))}")
+            messages = messages.filter(user_id__in=users.values())
+
+        try:
+            checkpoint = load_checkpoint(options['checkpoint'])
+        except ValueError as e:
+            raise CommandError(f"Fichier de reprise invalide: {e}")
+        if checkpoint and (checkpoint.get('old_key_id'), checkpoint.get('new_key_id')) != (old_key_id, new_key_id):
+            raise CommandError("Le fichier de reprise correspond à d'autres clés")
+        start_after = checkpoint.get('last_pk', 0)
+
+        total = messages.filter(pk__gt=start_after).count()
+        self.stdout.write(f"{total} messages à traiter" + (f" (reprise après la clé {start_after})" if start_after else ""))
+        start = time.monotonic()
+
+        def progress(processed, last_pk):
+            save_checkpoint(options['checkpoint'], {
+                'old_key_id': old_key_id, 'new_key_id': new_key_id, 'last_pk': last_pk,
+            })
+            elapsed = time.monotonic() - start
+            rate = processed / elapsed if elapsed else 0
+            eta = timedelta(seconds=round((total - processed) / rate)) if rate else '?'
+            self.stderr.write(f"{processed}/{total} messages traités ({rate:.0f}/s, reste {eta}, clé {last_pk})")
+
+        result = rotate_in_batches(
+            messages,
+            old_key=old_key,
+            new_key=new_key,
+            store_key=options['custom'],
+            batch_size=options['batch_size'],
+            executor=options['executor'],
+            mode=options['mode'],
+            progress=progress,
+            start_after=start_after,
+        )
+
+        for pk, error in result.failed[:20]:
+            self.stderr.write(f"Message {pk} non rechiffré: {error}")
+        if len(result.failed) > 20:
+            self.stderr.write(f"... et {len(result.failed) - 20} autres échecs")
+
+        # Rotation terminée : une nouvelle exécution repart de zéro (messages déjà rechiffrés ignorés)
+        clear_checkpoint(options['checkpoint'])
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.rotated} messages rechiffrés, {result.skipped} ignorés, {len(result.failed)} en échec "
+            f"en {elapsed:.1f}s"
+        ))
+        if not options['custom'] and result.rotated:
+            self.stdout.write(self.style.WARNING(
+                "Déployer AES_SECRET_KEY avec la nouvelle clé avant de rouvrir les écritures"
+            ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedmessage',
+            name='encrypted_data',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Données chiffrées'),
+        ),
+        migrations.AlterField(
+            model_name='encryptedmessage',
+            name='encrypted_text',
+            field=models.TextField(blank=True, verbose_name='Texte chiffré'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+import base64
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 500
+
+
+def convert_to_binary(apps, schema_editor):
+    """Convertit les textes chiffrés base64 en binaire, par lots de BATCH_SIZE lignes.
+
+    Chaque lot est validé dans sa propre transaction : pendant la conversion,
+    les lignes déjà converties et les autres restent lisibles (double lecture
+    dans EncryptedMessage.ciphertext).
+    """
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    db_alias = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        batch = list(
+            EncryptedMessage.objects.using(db_alias)
+            .filter(pk__gt=last_pk, encrypted_data__isnull=True)
+            .exclude(encrypted_text='')
+            .order_by('pk')
+            .only('pk', 'encrypted_text')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        converted = []
+        for message in batch:
+            try:
+                message.encrypted_data = base64.b64decode(message.encrypted_text, validate=True)
+            except ValueError:
+                # Contenu non base64 (ex: message anonymisé) : laissé tel quel
+                continue
+            message.encrypted_text = ''
+            converted.append(message)
+
+        with transaction.atomic(using=db_alias):
+            EncryptedMessage.objects.using(db_alias).bulk_update(
+                converted, ['encrypted_data', 'encrypted_text']
+            )
+        last_pk = batch[-1].pk
+
+
+def convert_to_base64(apps, schema_editor):
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    db_alias = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        batch = list(
+            EncryptedMessage.objects.using(db_alias)
+            .filter(pk__gt=last_pk, encrypted_data__isnull=False)
+            .order_by('pk')
+            .only('pk', 'encrypted_data')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        for message in batch:
+            message.encrypted_text = base64.b64encode(message.encrypted_data).decode('ascii')
+            message.encrypted_data = None
+
+        with transaction.atomic(using=db_alias):
+            EncryptedMessage.objects.using(db_alias).bulk_update(
+                batch, ['encrypted_data', 'encrypted_text']
+            )
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Une transaction par lot plutôt qu'une seule pour toute la table
+    atomic = False
+
+    dependencies = [
+        ('crypto_app', '0002_encryptedmessage_encrypted_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_to_binary, convert_to_base64),
+    ]
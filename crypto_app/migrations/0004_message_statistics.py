@@ -0,0 +1,102 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:44
+
+import hashlib
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_statistics(apps, schema_editor):
+    """Calcule les compteurs initiaux à partir des messages existants (agrégation en base)"""
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    UserMessageStats = apps.get_model('crypto_app', 'UserMessageStats')
+    MessageCountBucket = apps.get_model('crypto_app', 'MessageCountBucket')
+    KeyUsage = apps.get_model('crypto_app', 'KeyUsage')
+    db_alias = schema_editor.connection.alias
+
+    rows = (
+        EncryptedMessage.objects.using(db_alias)
+        .filter(user__isnull=False)
+        .order_by()
+        .values_list('user_id', TruncDate('created_at'), 'encryption_key')
+        .annotate(count=Count('id'))
+    )
+    totals, buckets, keys = Counter(), Counter(), Counter()
+    for user_id, day, key, count in rows:
+        totals[user_id] += count
+        buckets[(user_id, 'day', day)] += count
+        buckets[(user_id, 'month', day.replace(day=1))] += count
+        if key:
+            keys[(user_id, hashlib.sha256(key.encode('utf-8')).hexdigest())] += count
+
+    distinct_keys = Counter(user_id for user_id, _ in keys)
+    UserMessageStats.objects.using(db_alias).bulk_create(
+        UserMessageStats(user_id=user_id, total_messages=total, distinct_keys=distinct_keys[user_id])
+        for user_id, total in totals.items()
+    )
+    MessageCountBucket.objects.using(db_alias).bulk_create(
+        MessageCountBucket(user_id=user_id, period=period, start=start, count=count)
+        for (user_id, period, start), count in buckets.items()
+    )
+    KeyUsage.objects.using(db_alias).bulk_create(
+        KeyUsage(user_id=user_id, key_fingerprint=fingerprint, message_count=count)
+        for (user_id, fingerprint), count in keys.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0003_convert_encrypted_text_to_binary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMessageStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_messages', models.PositiveIntegerField(default=0)),
+                ('distinct_keys', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='message_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Statistiques Utilisateur',
+                'verbose_name_plural': 'Statistiques Utilisateur',
+            },
+        ),
+        migrations.CreateModel(
+            name='KeyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_fingerprint', models.CharField(max_length=64)),
+                ('message_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='key_usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Utilisation de clé',
+                'verbose_name_plural': 'Utilisations de clés',
+                'constraints': [models.UniqueConstraint(fields=('user', 'key_fingerprint'), name='unique_key_usage')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MessageCountBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Jour'), ('month', 'Mois')], max_length=5)),
+                ('start', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Compteur de messages',
+                'verbose_name_plural': 'Compteurs de messages',
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'start'), name='unique_message_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0004_message_statistics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='encryptedmessage',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Message chiffré', 'verbose_name_plural': 'Messages chiffrés'},
+        ),
+        migrations.AddIndex(
+            model_name='encryptedmessage',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='message_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:47
+
+import base64
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 500
+PREVIEW_LENGTH = 100
+
+
+def fill_previews(apps, schema_editor):
+    """Calcule aperçus et tailles des messages existants, par lots de BATCH_SIZE lignes"""
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    db_alias = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        batch = list(
+            EncryptedMessage.objects.using(db_alias)
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', 'original_text', 'encrypted_text', 'encrypted_data')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        for message in batch:
+            message.original_preview = message.original_text[:PREVIEW_LENGTH]
+            message.original_length = len(message.original_text)
+            if message.encrypted_data is not None:
+                data = bytes(message.encrypted_data)
+                message.encrypted_preview = base64.b64encode(data[:PREVIEW_LENGTH * 3 // 4]).decode('ascii')
+                message.encrypted_length = len(data)
+            else:
+                message.encrypted_preview = message.encrypted_text[:PREVIEW_LENGTH]
+                message.encrypted_length = len(message.encrypted_text)
+
+        with transaction.atomic(using=db_alias):
+            EncryptedMessage.objects.using(db_alias).bulk_update(
+                batch, ['original_preview', 'original_length', 'encrypted_preview', 'encrypted_length']
+            )
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('crypto_app', '0005_message_list_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedmessage',
+            name='encrypted_length',
+            field=models.PositiveIntegerField(default=0, verbose_name='Taille chiffrée'),
+        ),
+        migrations.AddField(
+            model_name='encryptedmessage',
+            name='encrypted_preview',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Aperçu chiffré'),
+        ),
+        migrations.AddField(
+            model_name='encryptedmessage',
+            name='original_length',
+            field=models.PositiveIntegerField(default=0, verbose_name='Longueur du texte'),
+        ),
+        migrations.AddField(
+            model_name='encryptedmessage',
+            name='original_preview',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Aperçu du texte'),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:49
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def fill_bytes_used(apps, schema_editor):
+    """Volume initial par utilisateur, calculé depuis les longueurs stockées des messages"""
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    UserProfile = apps.get_model('crypto_app', 'UserProfile')
+    db_alias = schema_editor.connection.alias
+
+    usage = (
+        EncryptedMessage.objects.using(db_alias)
+        .filter(user__isnull=False)
+        .order_by()
+        .values_list('user_id')
+        .annotate(size=Sum(F('original_length') + F('encrypted_length')))
+    )
+    for user_id, size in usage:
+        UserProfile.objects.using(db_alias).update_or_create(user_id=user_id, defaults={'bytes_used': size})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0006_message_previews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='bytes_used',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_bytes_used, migrations.RunPython.noop),
+    ]
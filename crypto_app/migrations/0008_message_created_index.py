@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0007_userprofile_bytes_used'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='encryptedmessage',
+            index=models.Index(fields=['created_at'], name='message_created_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:55
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Index plein texte SQLite FTS5 sur original_text, en contenu externe : le texte
+# n'est pas dupliqué, les triggers tiennent l'index à jour pour toute écriture
+# (save, bulk_create, update, delete), y compris hors de l'ORM.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE crypto_app_message_fts USING fts5(
+        original_text,
+        content='crypto_app_encryptedmessage',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER crypto_app_message_fts_insert AFTER INSERT ON crypto_app_encryptedmessage BEGIN
+        INSERT INTO crypto_app_message_fts(rowid, original_text) VALUES (new.id, new.original_text);
+    END
+    """,
+    """
+    CREATE TRIGGER crypto_app_message_fts_delete AFTER DELETE ON crypto_app_encryptedmessage BEGIN
+        INSERT INTO crypto_app_message_fts(crypto_app_message_fts, rowid, original_text)
+        VALUES ('delete', old.id, old.original_text);
+    END
+    """,
+    """
+    CREATE TRIGGER crypto_app_message_fts_update AFTER UPDATE OF original_text ON crypto_app_encryptedmessage BEGIN
+        INSERT INTO crypto_app_message_fts(crypto_app_message_fts, rowid, original_text)
+        VALUES ('delete', old.id, old.original_text);
+        INSERT INTO crypto_app_message_fts(rowid, original_text) VALUES (new.id, new.original_text);
+    END
+    """,
+    # Indexation des messages existants
+    "INSERT INTO crypto_app_message_fts(crypto_app_message_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS crypto_app_message_fts_insert",
+    "DROP TRIGGER IF EXISTS crypto_app_message_fts_delete",
+    "DROP TRIGGER IF EXISTS crypto_app_message_fts_update",
+    "DROP TABLE IF EXISTS crypto_app_message_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 n'existe que sous SQLite ; ailleurs la recherche reste en LIKE (voir search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        for statement in CREATE_INDEX:
+            schema_editor.execute(statement)
+    except OperationalError:
+        # SQLite compilé sans FTS5 : ne rien laisser à moitié créé
+        for statement in DROP_INDEX:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_INDEX:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0008_message_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
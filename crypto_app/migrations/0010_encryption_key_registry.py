@@ -0,0 +1,79 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:02
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def register_keys(apps, schema_editor):
+    """Enregistre chaque clé personnalisée une fois et fait pointer les messages vers le registre"""
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    EncryptionKey = apps.get_model('crypto_app', 'EncryptionKey')
+    db_alias = schema_editor.connection.alias
+    messages = EncryptedMessage.objects.using(db_alias).exclude(encryption_key='')
+
+    secrets = set(messages.order_by().values_list('encryption_key', flat=True).distinct())
+    EncryptionKey.objects.using(db_alias).bulk_create([
+        EncryptionKey(fingerprint=hashlib.sha256(secret.encode('utf-8')).hexdigest(), secret=secret)
+        for secret in secrets
+    ])
+    key_ids = dict(EncryptionKey.objects.using(db_alias).values_list('secret', 'pk'))
+
+    # Par lots de clés primaires : un UPDATE par clé présente dans le lot
+    last_pk = 0
+    while True:
+        batch = list(messages.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'encryption_key')[:BATCH_SIZE])
+        if not batch:
+            break
+        by_key = {}
+        for pk, secret in batch:
+            by_key.setdefault(key_ids[secret], []).append(pk)
+        with transaction.atomic(using=db_alias):
+            for key_id, pks in by_key.items():
+                EncryptedMessage.objects.using(db_alias).filter(pk__in=pks).update(key_id=key_id)
+        last_pk = batch[-1][0]
+
+
+def restore_keys(apps, schema_editor):
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    EncryptionKey = apps.get_model('crypto_app', 'EncryptionKey')
+    db_alias = schema_editor.connection.alias
+    for key_id, secret in EncryptionKey.objects.using(db_alias).values_list('pk', 'secret'):
+        EncryptedMessage.objects.using(db_alias).filter(key_id=key_id).update(encryption_key=secret)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('crypto_app', '0009_message_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncryptionKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True, verbose_name='Empreinte')),
+                ('secret', models.CharField(max_length=255, verbose_name='Clé')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+            ],
+            options={
+                'verbose_name': 'Clé de chiffrement',
+                'verbose_name_plural': 'Clés de chiffrement',
+            },
+        ),
+        migrations.AddField(
+            model_name='encryptedmessage',
+            name='key',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='messages', to='crypto_app.encryptionkey', verbose_name='Clé de chiffrement'),
+        ),
+        migrations.RunPython(register_keys, restore_keys),
+        migrations.RemoveField(
+            model_name='encryptedmessage',
+            name='encryption_key',
+        ),
+    ]
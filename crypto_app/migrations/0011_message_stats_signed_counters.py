@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0010_encryption_key_registry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usermessagestats',
+            name='distinct_keys',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='usermessagestats',
+            name='total_messages',
+            field=models.IntegerField(default=0),
+        ),
+    ]
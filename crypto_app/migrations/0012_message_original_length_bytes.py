@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:12
+
+from django.db import migrations, models, transaction
+from django.db.models import F, Sum
+
+BATCH_SIZE = 500
+
+
+def recompute_lengths(measure):
+    def recompute(apps, schema_editor):
+        """Recalcule original_length des messages existants par lots, puis le volume par utilisateur"""
+        EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+        UserProfile = apps.get_model('crypto_app', 'UserProfile')
+        db_alias = schema_editor.connection.alias
+        last_pk = 0
+        while True:
+            batch = list(
+                EncryptedMessage.objects.using(db_alias)
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'original_text', 'original_length')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+
+            # Seuls les textes non ASCII changent de taille
+            changed = []
+            for message in batch:
+                length = measure(message.original_text)
+                if length != message.original_length:
+                    message.original_length = length
+                    changed.append(message)
+            if changed:
+                with transaction.atomic(using=db_alias):
+                    EncryptedMessage.objects.using(db_alias).bulk_update(changed, ['original_length'])
+            last_pk = batch[-1].pk
+
+        usage = dict(
+            EncryptedMessage.objects.using(db_alias)
+            .filter(user__isnull=False)
+            .order_by()
+            .values_list('user_id')
+            .annotate(size=Sum(F('original_length') + F('encrypted_length')))
+        )
+        with transaction.atomic(using=db_alias):
+            for profile in UserProfile.objects.using(db_alias).only('pk', 'user_id', 'bytes_used'):
+                size = usage.pop(profile.user_id, 0)
+                if profile.bytes_used != size:
+                    UserProfile.objects.using(db_alias).filter(pk=profile.pk).update(bytes_used=size)
+            for user_id, size in usage.items():
+                UserProfile.objects.using(db_alias).create(user_id=user_id, bytes_used=size)
+    return recompute
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('crypto_app', '0011_message_stats_signed_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='encryptedmessage',
+            name='original_length',
+            field=models.PositiveIntegerField(default=0, verbose_name='Taille du texte'),
+        ),
+        # Taille du texte original en octets (UTF-8) et non plus en caractères
+        migrations.RunPython(
+            recompute_lengths(lambda text: len(text.encode('utf-8'))),
+            recompute_lengths(len),
+        ),
+    ]
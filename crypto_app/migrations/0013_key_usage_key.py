@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rebuild_key_usages(apps, schema_editor):
+    """Recalcule les utilisations de clés depuis les messages, par identifiant du registre"""
+    EncryptedMessage = apps.get_model('crypto_app', 'EncryptedMessage')
+    KeyUsage = apps.get_model('crypto_app', 'KeyUsage')
+    db_alias = schema_editor.connection.alias
+    KeyUsage.objects.using(db_alias).all().delete()
+    rows = (
+        EncryptedMessage.objects.using(db_alias)
+        .filter(user__isnull=False, key__isnull=False)
+        .order_by()
+        .values_list('user_id', 'key_id')
+        .annotate(count=Count('id'))
+    )
+    KeyUsage.objects.using(db_alias).bulk_create(
+        [KeyUsage(user_id=user_id, key_id=key_id, message_count=count) for user_id, key_id, count in rows],
+        batch_size=1000,
+    )
+
+
+def restore_fingerprints(apps, schema_editor):
+    EncryptionKey = apps.get_model('crypto_app', 'EncryptionKey')
+    KeyUsage = apps.get_model('crypto_app', 'KeyUsage')
+    db_alias = schema_editor.connection.alias
+    for key_id, fingerprint in EncryptionKey.objects.using(db_alias).values_list('pk', 'fingerprint'):
+        KeyUsage.objects.using(db_alias).filter(key_id=key_id).update(key_fingerprint=fingerprint)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_app', '0012_message_original_length_bytes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='keyusage',
+            name='unique_key_usage',
+        ),
+        migrations.AddField(
+            model_name='keyusage',
+            name='key',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='crypto_app.encryptionkey', verbose_name='Clé de chiffrement'),
+        ),
+        migrations.RunPython(rebuild_key_usages, restore_fingerprints),
+        # Valeur par défaut pour que la colonne puisse être recréée sur une table non vide (retour arrière)
+        migrations.AlterField(
+            model_name='keyusage',
+            name='key_fingerprint',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.RemoveField(
+            model_name='keyusage',
+            name='key_fingerprint',
+        ),
+        migrations.AlterField(
+            model_name='keyusage',
+            name='key',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='crypto_app.encryptionkey', verbose_name='Clé de chiffrement'),
+        ),
+        migrations.AddConstraint(
+            model_name='keyusage',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='unique_key_usage'),
+        ),
+    ]
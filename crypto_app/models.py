@@ -1,23 +1,313 @@
-from django.db import models
+import base64
+import hashlib
+from collections import namedtuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from .utils.crypto import encrypt_text, decrypt_text
+from .utils.crypto import DerivedKeyCache, encrypt_text, decrypt_text, encrypt_bytes, decrypt_bytes, encrypt_many
+from .utils.streams import chunked
+
+# Résultat d'un import : nombre de messages créés et liste (position, erreur) des rejets
+ImportResult = namedtuple('ImportResult', ['imported', 'failed'])
+
+# Valeurs de EncryptedMessage.ACCOUNTING_FIELDS à la lecture du message (voir accounting.py) :
+# mêmes attributs qu'un message pour message_entry et message_size
+AccountingState = namedtuple('AccountingState', ['user_id', 'created_at', 'key_id', 'original_length', 'encrypted_length'])
+
+# Contenu des messages anonymisés (EncryptedMessageQuerySet.anonymize)
+ANONYMIZED_TEXT = "[CONTENU ANONYMISÉ]"
+ANONYMIZED_CIPHERTEXT = "[CHIFFRÉ ANONYMISÉ]"
+
+class EncryptedMessageQuerySet(models.QuerySet):
+    def import_messages(self, records, user=None, batch_size=1000, transaction_size=10000,
+                        executor=None, progress=None):
+        """Importe des messages en flux : chiffrement par lots en parallèle puis bulk_create.
+
+        `records` est un itérable de dicts avec `original_text` (ou `text`) et
+        optionnellement `encryption_key` (ou `key`) et `user` (nom d'utilisateur,
+        ignoré si `user` est passé). Chaque groupe de `transaction_size`
+        enregistrements est écrit dans sa propre transaction ; `progress` est
+        appelé avec le total importé après chaque groupe.
+        """
+        from .accounting import record_created
+        binary_storage = getattr(settings, 'CRYPTO_BINARY_STORAGE', False)
+        users = {}
+        imported = 0
+        failed = []
+        position = 0
+
+        for group in chunked(records, transaction_size):
+            messages = []
+            for batch in chunked(group, batch_size):
+                pending = []
+                for record in batch:
+                    text = record.get('original_text', record.get('text')) if isinstance(record, dict) else None
+                    if not isinstance(text, str) or not text:
+                        failed.append((position, "Champ 'original_text' manquant"))
+                    else:
+                        secret = record.get('encryption_key', record.get('key'))
+                        owner = user if user is not None else self._resolve_user(record.get('user'), users)
+                        key = EncryptionKey.objects.for_secret(secret) if secret else None
+                        pending.append((position, EncryptedMessage(user=owner, original_text=text, key=key)))
+                    position += 1
+
+                results = encrypt_many(
+                    ((message.original_text, message.encryption_key or None) for _, message in pending),
+                    executor=executor,
+                    binary=binary_storage,
+                )
+                for (index, message), result in zip(pending, results):
+                    if result.error is not None:
+                        failed.append((index, result.error))
+                        continue
+                    if binary_storage:
+                        message.encrypted_data = result.value
+                    else:
+                        message.encrypted_text = result.value
+                    message.refresh_previews()
+                    messages.append(message)
+
+            if not messages:
+                continue
+            with transaction.atomic(using=self.db):
+                self.bulk_create(messages, batch_size=batch_size)
+                record_created(messages)
+            imported += len(messages)
+            if progress:
+                progress(imported)
+
+        return ImportResult(imported, failed)
+
+    def delete(self):
+        """Supprime les messages en tenant à jour les statistiques par utilisateur"""
+        from .accounting import record_queryset_deleted
+        with transaction.atomic(using=self.db):
+            record_queryset_deleted(self)
+            return super().delete()
+
+    def anonymize(self):
+        """Remplace le contenu des messages en un seul UPDATE ; retourne le nombre de messages"""
+        from .accounting import record_queryset_resized
+        values = {
+            'original_text': ANONYMIZED_TEXT,
+            'encrypted_text': ANONYMIZED_CIPHERTEXT,
+            'encrypted_data': None,
+            'original_preview': ANONYMIZED_TEXT,
+            'original_length': len(ANONYMIZED_TEXT.encode('utf-8')),
+            'encrypted_preview': ANONYMIZED_CIPHERTEXT,
+            'encrypted_length': len(ANONYMIZED_CIPHERTEXT),
+        }
+        with transaction.atomic(using=self.db):
+            record_queryset_resized(self, values['original_length'] + values['encrypted_length'])
+            return self.update(**values)
+
+    def _resolve_user(self, username, cache):
+        if not username:
+            return None
+        if username not in cache:
+            cache[username] = User.objects.filter(username=username).first()
+        return cache[username]
+
+# Registre des clés par processus, borné (LRU) : empreinte -> entrée, id -> clé. Les entrées ne
+# changent jamais, mais seules les lignes validées y entrent : après une transaction annulée,
+# SQLite réattribue le même id à la ligne suivante.
+KEY_REGISTRY_CACHE_SIZE = 1024
+KEY_REGISTRY_CACHE_TTL = 24 * 3600
+_keys_by_fingerprint = DerivedKeyCache(maxsize=KEY_REGISTRY_CACHE_SIZE, ttl=KEY_REGISTRY_CACHE_TTL)
+_secrets_by_id = DerivedKeyCache(maxsize=KEY_REGISTRY_CACHE_SIZE, ttl=KEY_REGISTRY_CACHE_TTL)
+
+
+class EncryptionKeyManager(models.Manager):
+    def for_secret(self, secret):
+        """Entrée du registre d'une clé personnalisée, créée à la première utilisation"""
+        fingerprint = EncryptionKey.fingerprint_for(secret)
+        entry = _keys_by_fingerprint.get(fingerprint)
+        if entry is None:
+            entry, _ = self.get_or_create(fingerprint=fingerprint, defaults={'secret': secret})
+            self._remember(entry)
+        return entry
+    
+    async def afor_secret(self, secret):
+        """Version async de for_secret"""
+        return await sync_to_async(self.for_secret)(secret)
+    
+    def secret_of(self, pk):
+        """Clé personnalisée d'une entrée du registre, lue une fois par processus"""
+        secret = _secrets_by_id.get(pk)
+        if secret is None:
+            entry = self.only('pk', 'fingerprint', 'secret').get(pk=pk)
+            self._remember(entry)
+            secret = entry.secret
+        return secret
+    
+    def clear_cache(self):
+        """Vide le registre du processus (tests, entrées supprimées)"""
+        _keys_by_fingerprint.clear()
+        _secrets_by_id.clear()
+    
+    def _remember(self, entry):
+        # Après commit (immédiat hors transaction) : une ligne lue ou créée dans une transaction
+        # annulée n'existe pas, et son id sera réattribué
+        def remember():
+            _keys_by_fingerprint.put(entry.fingerprint, entry)
+            _secrets_by_id.put(entry.pk, entry.secret)
+        transaction.on_commit(remember, using=self.db)
+
+
+class EncryptionKey(models.Model):
+    """Clé personnalisée, enregistrée une seule fois : les messages la référencent par identifiant"""
+    fingerprint = models.CharField(max_length=64, unique=True, verbose_name="Empreinte")
+    secret = models.CharField(max_length=255, verbose_name="Clé")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    
+    objects = EncryptionKeyManager()
+    
+    @staticmethod
+    def fingerprint_for(secret):
+        """Empreinte SHA-256 (hexadécimale) d'une clé personnalisée"""
+        return hashlib.sha256(secret.encode('utf-8')).hexdigest()
+    
+    def __str__(self):
+        return f"Clé {self.fingerprint[:8]}"
+    
+    class Meta:
+        verbose_name = "Clé de chiffrement"
+        verbose_name_plural = "Clés de chiffrement"
+
 
 class EncryptedMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     original_text = models.TextField(verbose_name="Texte original")
-    encrypted_text = models.TextField(verbose_name="Texte chiffré")
-    encryption_key = models.CharField(max_length=255, blank=True, verbose_name="Clé de chiffrement")
+    # Ancien stockage en base64, conservé pour les lignes pas encore converties
+    encrypted_text = models.TextField(blank=True, verbose_name="Texte chiffré")
+    # Stockage compact : IV + données chiffrées en binaire brut
+    encrypted_data = models.BinaryField(null=True, blank=True, verbose_name="Données chiffrées")
+    # Clé personnalisée (registre) ; vide pour la clé du serveur
+    key = models.ForeignKey(EncryptionKey, on_delete=models.PROTECT, null=True, blank=True,
+                            related_name='messages', verbose_name="Clé de chiffrement")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    # Aperçus et tailles précalculés pour les listes (les colonnes complètes sont différées)
+    original_preview = models.CharField(max_length=100, blank=True, verbose_name="Aperçu du texte")
+    encrypted_preview = models.CharField(max_length=100, blank=True, verbose_name="Aperçu chiffré")
+    original_length = models.PositiveIntegerField(default=0, verbose_name="Taille du texte")
+    encrypted_length = models.PositiveIntegerField(default=0, verbose_name="Taille chiffrée")
+    
+    objects = EncryptedMessageQuerySet.as_manager()
+    
+    PREVIEW_LENGTH = 100
+    # Colonnes volumineuses, à exclure des requêtes de liste avec .defer(*LARGE_FIELDS)
+    LARGE_FIELDS = ('original_text', 'encrypted_text', 'encrypted_data')
+    
+    # Champs dont dépendent les statistiques et le volume par utilisateur (voir accounting.py)
+    ACCOUNTING_FIELDS = AccountingState._fields
+    
+    @property
+    def encryption_key(self):
+        """Clé personnalisée du message ('' pour la clé du serveur), lue dans le registre.
+
+        Lecture seule : l'entrée du registre est résolue explicitement à la création
+        (key=EncryptionKey.objects.for_secret(secret)), qui peut écrire en base.
+        """
+        return EncryptionKey.objects.secret_of(self.key_id) if self.key_id else ''
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_accounting_state()
+        return instance
+    
+    def _remember_accounting_state(self):
+        # Tuple des valeurs chargées (pas de second modèle par ligne), None si un champ est différé
+        values = self.__dict__
+        if all(field in values for field in self.ACCOUNTING_FIELDS):
+            self._accounting_state = AccountingState(*(values[field] for field in self.ACCOUNTING_FIELDS))
+        else:
+            self._accounting_state = None
     
     def save(self, *args, **kwargs):
+        from .accounting import record_created, record_updated
         # Chiffrer le texte avant sauvegarde
-        if self.original_text and not self.encrypted_text:
-            self.encrypted_text = encrypt_text(self.original_text, self.encryption_key or None)
-        super().save(*args, **kwargs)
+        self.prepare_ciphertext()
+        adding = self._state.adding
+        previous = None if adding else getattr(self, '_accounting_state', None)
+        if not adding and previous is None and self.pk is not None:
+            row = type(self).objects.filter(pk=self.pk).values_list(*self.ACCOUNTING_FIELDS).first()
+            previous = AccountingState(*row) if row else None
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                record_created([self])
+            elif previous is not None:
+                # Utilisateur, clé ou taille modifiés : ajuster les compteurs
+                record_updated(previous, self)
+        self._remember_accounting_state()
+    
+    def delete(self, *args, **kwargs):
+        from .accounting import record_deleted
+        with transaction.atomic():
+            record_deleted([self])
+            return super().delete(*args, **kwargs)
+    
+    def prepare_ciphertext(self):
+        """Chiffre le texte si nécessaire et le place dans la colonne de stockage configurée.
+
+        Appelée par save() ; à appeler aussi avant un bulk_create, qui ne passe pas par save().
+        """
+        binary_storage = getattr(settings, 'CRYPTO_BINARY_STORAGE', False)
+        if self.original_text and not self.has_ciphertext():
+            if binary_storage:
+                self.encrypted_data = encrypt_bytes(self.original_text, self.encryption_key or None)
+            else:
+                self.encrypted_text = encrypt_text(self.original_text, self.encryption_key or None)
+        elif binary_storage and self.encrypted_text and self.encrypted_data is None:
+            # Texte chiffré fourni en base64 (ex: encrypt_view) : le stocker en binaire
+            try:
+                self.encrypted_data = base64.b64decode(self.encrypted_text, validate=True)
+                self.encrypted_text = ''
+            except ValueError:
+                pass
+        self.refresh_previews()
+    
+    def refresh_previews(self):
+        """Met à jour les aperçus et tailles à partir des colonnes complètes"""
+        self.original_preview = self.original_text[:self.PREVIEW_LENGTH]
+        # Taille en octets (UTF-8) : comptée dans le quota
+        self.original_length = len(self.original_text.encode('utf-8'))
+        self.refresh_encrypted_preview()
+    
+    def refresh_encrypted_preview(self):
+        """Met à jour l'aperçu et la taille du texte chiffré seuls (texte original non chargé)"""
+        if self.encrypted_data is not None:
+            # 75 octets donnent exactement 100 caractères base64
+            self.encrypted_preview = base64.b64encode(bytes(self.encrypted_data[:self.PREVIEW_LENGTH * 3 // 4])).decode('ascii')
+            self.encrypted_length = len(self.encrypted_data)
+        else:
+            self.encrypted_preview = self.encrypted_text[:self.PREVIEW_LENGTH]
+            self.encrypted_length = len(self.encrypted_text)
+    
+    def has_ciphertext(self):
+        return self.encrypted_data is not None or bool(self.encrypted_text)
+    
+    @property
+    def ciphertext(self):
+        """IV + données chiffrées en binaire, quel que soit le mode de stockage de la ligne"""
+        if self.encrypted_data is not None:
+            return bytes(self.encrypted_data)
+        return base64.b64decode(self.encrypted_text)
+    
+    def get_encrypted_text(self):
+        """Retourne le texte chiffré en base64, pour l'affichage"""
+        if self.encrypted_data is not None:
+            return base64.b64encode(self.encrypted_data).decode('ascii')
+        return self.encrypted_text
     
     def get_decrypted_text(self, key=None):
         """Retourne le texte déchiffré"""
         try:
+            if self.encrypted_data is not None:
+                return decrypt_bytes(bytes(self.encrypted_data), key or self.encryption_key or None).decode('utf-8')
             return decrypt_text(self.encrypted_text, key or self.encryption_key or None)
         except Exception as e:
             return f"Erreur de déchiffrement: {str(e)}"
@@ -28,7 +318,13 @@ class EncryptedMessage(models.Model):
     class Meta:
         verbose_name = "Message chiffré"
         verbose_name_plural = "Messages chiffrés"
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Liste des messages d'un utilisateur (pagination par curseur sur created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='message_user_created_idx'),
+            # Purge par ancienneté (purge_messages, retention.py)
+            models.Index(fields=['created_at'], name='message_created_idx'),
+        ]
 
 # crypto_app/models.py (ajout)
 class UserProfile(models.Model):
@@ -42,10 +338,80 @@ class UserProfile(models.Model):
     tier = models.CharField(max_length=20, choices=USER_TIERS, default='free')
     subscription_date = models.DateTimeField(null=True, blank=True)
     storage_limit = models.BigIntegerField(default=10485760)  # 10MB pour free
+    # Volume stocké (octets), tenu à jour à chaque écriture de message (voir accounting.py)
+    bytes_used = models.BigIntegerField(default=0)
+    
+    def save(self, *args, **kwargs):
+        # bytes_used n'évolue que par UPDATE atomique (accounting.py) : une sauvegarde
+        # du profil (ex: changement de formule) ne doit pas écraser une valeur lue plus tôt
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'bytes_used'
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Profil de {self.user.username}"
     
     class Meta:
         verbose_name = "Profil Utilisateur"
-        verbose_name_plural = "Profils Utilisateur"
\ No newline at end of file
+        verbose_name_plural = "Profils Utilisateur"
+
+
+class UserMessageStats(models.Model):
+    """Totaux par utilisateur, mis à jour à chaque insertion et suppression de message"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='message_stats')
+    # Signés, comme les autres compteurs : un écart (corrigé par rebuild) ne doit pas faire
+    # échouer la suppression d'un message sur la contrainte >= 0
+    total_messages = models.IntegerField(default=0)
+    distinct_keys = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Statistiques de {self.user.username}"
+    
+    class Meta:
+        verbose_name = "Statistiques Utilisateur"
+        verbose_name_plural = "Statistiques Utilisateur"
+
+class MessageCountBucket(models.Model):
+    """Nombre de messages d'un utilisateur par jour ou par mois"""
+    DAY = 'day'
+    MONTH = 'month'
+    PERIODS = [
+        (DAY, 'Jour'),
+        (MONTH, 'Mois'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='message_buckets')
+    period = models.CharField(max_length=5, choices=PERIODS)
+    start = models.DateField()
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.period} {self.start}: {self.count}"
+    
+    class Meta:
+        verbose_name = "Compteur de messages"
+        verbose_name_plural = "Compteurs de messages"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'start'], name='unique_message_bucket'),
+        ]
+
+class KeyUsage(models.Model):
+    """Nombre de messages par clé personnalisée et par utilisateur (clés distinctes)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='key_usages')
+    # Même identifiant que EncryptedMessage.key : compteurs tenus sans lire le registre
+    key = models.ForeignKey(EncryptionKey, on_delete=models.CASCADE, related_name='usages',
+                            verbose_name="Clé de chiffrement")
+    message_count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user.username} - clé {self.key_id}: {self.message_count}"
+    
+    class Meta:
+        verbose_name = "Utilisation de clé"
+        verbose_name_plural = "Utilisations de clés"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_key_usage'),
+        ]
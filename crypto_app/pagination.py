@@ -0,0 +1,91 @@
+# crypto_app/pagination.py
+import base64
+from collections.abc import Sequence
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class KeysetPage(Sequence):
+    """Page obtenue par curseur : liens précédent/suivant, sans numéro ni total"""
+
+    def __init__(self, object_list, has_next, has_previous, paginator):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.paginator = paginator
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[-1]) if self._has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[0]) if self._has_previous else None
+
+
+class KeysetPaginator:
+    """Pagination par clé (created_at, id) décroissante.
+
+    Chaque page est un parcours d'index borné par le dernier élément vu
+    (WHERE (created_at, id) < curseur LIMIT n) : même coût quelle que soit la
+    profondeur, sans COUNT(*) ni OFFSET. Nécessite un index sur
+    (…, -created_at, -id), voir EncryptedMessage.Meta.indexes.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def encode_cursor(self, obj):
+        raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """(created_at, id) d'un curseur, ou None s'il est invalide"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+            created_at, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except ValueError:
+            return None
+
+    def get_page(self, after=None, before=None):
+        """Page suivant le curseur `after`, précédant `before`, ou la première page"""
+        after = self.decode_cursor(after) if after else None
+        before = self.decode_cursor(before) if before and not after else None
+
+        if before:
+            created_at, pk = before
+            rows = list(
+                self.queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+                .order_by('created_at', 'pk')[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            if not has_previous and len(rows) < self.per_page:
+                # Retour en tête de liste : première page complète
+                return self.get_page()
+            return KeysetPage(rows, True, has_previous, self)
+
+        queryset = self.queryset.order_by('-created_at', '-pk')
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], len(rows) > self.per_page, after is not None, self)
@@ -0,0 +1,81 @@
+# crypto_app/retention.py
+"""Suppression par lots des messages anciens.
+
+Chaque lot est supprimé dans sa propre transaction (statistiques et volume
+compris, voir EncryptedMessageQuerySet.delete) : le verrou d'écriture SQLite
+n'est tenu que le temps d'un lot, les autres requêtes s'intercalent entre deux.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EncryptedMessage, UserProfile
+
+# Messages supprimés par transaction
+DELETE_CHUNK_SIZE = 1000
+
+
+def older_than(queryset, days, now=None):
+    """Messages du queryset créés il y a plus de `days` jours"""
+    cutoff_date = (now or timezone.now()) - timedelta(days=days)
+    return queryset.filter(created_at__lt=cutoff_date)
+
+
+def retention_segments(default_days, use_tiers=False, now=None):
+    """Découpe la purge en segments [(nom, queryset à supprimer)].
+
+    Sans `use_tiers`, un seul segment : tous les messages de plus de
+    `default_days` jours. Sinon, un segment par formule avec la durée de
+    settings.CRYPTO_RETENTION_DAYS (None : conservation illimitée), les
+    utilisateurs sans profil relevant de la formule par défaut, et un segment
+    pour les messages anonymes avec `default_days`.
+    """
+    now = now or timezone.now()
+    messages = EncryptedMessage.objects.all()
+    if not use_tiers:
+        return [('tous', older_than(messages, default_days, now))]
+
+    retention = getattr(settings, 'CRYPTO_RETENTION_DAYS', {})
+    default_tier = UserProfile._meta.get_field('tier').default
+    segments = []
+    for tier, _ in UserProfile.USER_TIERS:
+        days = retention.get(tier, default_days)
+        if days is None:
+            continue
+        owners = Q(user__userprofile__tier=tier)
+        if tier == default_tier:
+            owners |= Q(user__isnull=False, user__userprofile__isnull=True)
+        segments.append((tier, older_than(messages.filter(owners), days, now)))
+    segments.append(('anonymes', older_than(messages.filter(user__isnull=True), default_days, now)))
+    return segments
+
+
+def delete_in_chunks(queryset, chunk_size=DELETE_CHUNK_SIZE, progress=None, pause=0, start_after=0):
+    """Supprime les messages du queryset par lots de `chunk_size`, dans l'ordre des clés.
+
+    `progress(supprimés, dernière_clé)` est appelé après chaque lot ; `pause`
+    (secondes) laisse passer les autres écrivains entre deux lots ;
+    `start_after` reprend après une clé déjà traitée. Retourne le nombre de
+    messages supprimés.
+    """
+    # Borne haute fixée au départ : chaque lot est une plage de clés (last_pk, upper]
+    upper = queryset.order_by('-pk').values_list('pk', flat=True).first()
+    deleted = 0
+    last_pk = start_after
+    while upper is not None and last_pk < upper:
+        pks = list(
+            queryset.filter(pk__gt=last_pk, pk__lte=upper).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not pks:
+            break
+        _, per_model = EncryptedMessage.objects.filter(pk__in=pks).delete()
+        deleted += per_model.get(EncryptedMessage._meta.label, 0)
+        last_pk = pks[-1]
+        if progress:
+            progress(deleted, last_pk)
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,124 @@
+# crypto_app/rotation.py
+"""Rotation de clé : rechiffrement des messages existants par lots de clés primaires.
+
+Chaque lot est lu, rechiffré dans le pool de workers (reencrypt_many) puis
+réécrit dans sa propre transaction (statistiques et volume compris). Les
+messages déjà chiffrés avec la nouvelle clé (identifiant de clé de
+l'enveloppe, après dérivation avec son sel) sont ignorés : une rotation
+interrompue peut être relancée sans risque, avec ou sans fichier de reprise.
+"""
+import base64
+from collections import namedtuple
+
+from django.db import connections, transaction
+
+from .accounting import record_updated_many
+from .models import ANONYMIZED_CIPHERTEXT, EncryptedMessage, EncryptionKey
+from .utils.crypto import ENVELOPE_PREFIX_SIZE, AESCipher, reencrypt_many
+
+# Messages rechiffrés par transaction
+ROTATION_BATCH_SIZE = 1000
+
+# Colonnes réécrites par la rotation
+ROTATED_FIELDS = ('encrypted_text', 'encrypted_data', 'encrypted_preview', 'encrypted_length')
+
+# Caractères base64 couvrant l'en-tête d'enveloppe et les paramètres KDF
+_PREFIX_BASE64_LENGTH = (ENVELOPE_PREFIX_SIZE + 2) // 3 * 4
+
+# Résultat d'une rotation : compteurs, liste (clé primaire, erreur) des échecs et dernière clé traitée
+RotationResult = namedtuple('RotationResult', ['rotated', 'skipped', 'failed', 'last_pk'])
+
+
+def envelope_prefix(message):
+    """Début de l'enveloppe du message (en-tête et paramètres KDF), b'' si le texte est illisible"""
+    if message.encrypted_data is not None:
+        return bytes(message.encrypted_data[:ENVELOPE_PREFIX_SIZE])
+    try:
+        return base64.b64decode(message.encrypted_text[:_PREFIX_BASE64_LENGTH], validate=True)
+    except ValueError:
+        return b''
+
+
+def rotate_in_batches(queryset, old_key=None, new_key=None, store_key=False, batch_size=ROTATION_BATCH_SIZE,
+                      executor=None, mode=None, progress=None, start_after=0):
+    """Rechiffre les messages du queryset de `old_key` vers `new_key` (None : clé du serveur).
+
+    Avec `store_key`, les messages référencent ensuite l'entrée du registre
+    de la nouvelle clé (clés personnalisées). Les messages que l'ancienne clé ne déchiffre pas sont
+    laissés intacts et signalés. `progress(traités, dernière_clé)` est appelé
+    après chaque lot ; `start_after` reprend après une clé déjà traitée.
+    """
+    # La future clé du serveur n'est pas dérivée, comme la clé du serveur (voir AESCipher)
+    kdf = None if store_key else ''
+    new_cipher = AESCipher(new_key, mode, kdf=kdf)
+    fields = list(ROTATED_FIELDS) + (['key'] if store_key else [])
+    new_entry = EncryptionKey.objects.for_secret(new_key) if store_key else None
+    messages = queryset.only(*EncryptedMessage.ACCOUNTING_FIELDS, 'encrypted_text', 'encrypted_data')
+
+    # Borne haute fixée au départ : chaque lot est une plage de clés (last_pk, upper]
+    upper = queryset.order_by('-pk').values_list('pk', flat=True).first()
+    rotated = skipped = 0
+    failed = []
+    last_pk = start_after
+    while upper is not None and last_pk < upper:
+        batch = list(messages.filter(pk__gt=last_pk, pk__lte=upper).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        pending = []
+        for message in batch:
+            if (not message.has_ciphertext() or message.encrypted_text == ANONYMIZED_CIPHERTEXT
+                    or new_cipher.is_encrypted_with(envelope_prefix(message))):
+                skipped += 1
+            else:
+                pending.append(message)
+
+        results = reencrypt_many(
+            [bytes(m.encrypted_data) if m.encrypted_data is not None else m.encrypted_text for m in pending],
+            old_key, new_key, executor=executor, mode=mode, kdf=kdf,
+        )
+        changed = []
+        for message, result in zip(pending, results):
+            if result.error is not None:
+                failed.append((message.pk, result.error))
+                continue
+            if message.encrypted_data is not None:
+                message.encrypted_data = result.value
+            else:
+                message.encrypted_text = result.value
+            if store_key:
+                message.key = new_entry
+            message.refresh_encrypted_preview()
+            changed.append(message)
+
+        if changed:
+            with transaction.atomic(using=queryset.db):
+                write_batch(changed, fields, queryset.db)
+                record_updated_many([(message._accounting_state, message) for message in changed])
+            rotated += len(changed)
+        if progress:
+            progress(rotated + skipped + len(failed), last_pk)
+
+    return RotationResult(rotated, skipped, failed, last_pk)
+
+
+def write_batch(messages, fields, using='default'):
+    """Réécrit des colonnes de messages existants : un UPDATE paramétré par clé exécuté en executemany.
+
+    Nettement plus rapide que bulk_update, dont les CASE WHEN par ligne
+    dominent le temps de la rotation.
+    """
+    connection = connections[using]
+    model_fields = [EncryptedMessage._meta.get_field(name) for name in fields]
+    assignments = ', '.join(f"{connection.ops.quote_name(field.column)} = %s" for field in model_fields)
+    sql = (
+        f"UPDATE {connection.ops.quote_name(EncryptedMessage._meta.db_table)} SET {assignments} "
+        f"WHERE {connection.ops.quote_name(EncryptedMessage._meta.pk.column)} = %s"
+    )
+    rows = [
+        [field.get_db_prep_save(getattr(message, field.attname), connection) for field in model_fields] + [message.pk]
+        for message in messages
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
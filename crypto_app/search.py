@@ -0,0 +1,60 @@
+# crypto_app/search.py
+"""Recherche plein texte dans les messages (texte original).
+
+Sous SQLite, la recherche passe par l'index FTS5 crypto_app_message_fts
+(migration 0009, tenu à jour par triggers) ; sans lui, elle retombe sur un
+LIKE sur original_text.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'crypto_app_message_fts'
+
+_fts_available = {}
+
+
+def fts_available(using='default'):
+    """Indique si l'index FTS5 existe sur cette base (vérifié une fois par processus)"""
+    if using not in _fts_available:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                available = cursor.fetchone() is not None
+        _fts_available[using] = available
+    return _fts_available[using]
+
+
+def fts_query(terms):
+    """Requête FTS5 : chaque mot entre guillemets (pas de syntaxe FTS) et en préfixe"""
+    words = re.findall(r'\w+', terms)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matching_ids(terms):
+    """Sous-requête des identifiants de messages correspondant à la recherche"""
+    return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [fts_query(terms)])
+
+
+def text_filter(terms, using='default'):
+    """Condition de recherche sur le texte original (index FTS5 si disponible)"""
+    if fts_available(using):
+        if not fts_query(terms):
+            return Q(pk__in=[])
+        return Q(pk__in=matching_ids(terms))
+    condition = Q()
+    for word in terms.split():
+        condition &= Q(original_text__icontains=word)
+    return condition
+
+
+def search_messages(queryset, terms):
+    """Messages du queryset dont le texte original contient tous les mots de `terms`"""
+    terms = terms.strip()
+    if not terms:
+        return queryset
+    return queryset.filter(text_filter(terms, queryset.db))
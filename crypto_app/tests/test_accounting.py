@@ -0,0 +1,352 @@
+import io
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from crypto_app.accounting import (
+    QuotaExceeded, get_message_stats, message_size, rebuild, reconcile_storage, release_quota,
+    remaining_quota, reserve_quota, reserve_quota_many,
+)
+from crypto_app.models import (
+    ANONYMIZED_TEXT, AccountingState, EncryptedMessage, EncryptionKey, KeyUsage, MessageCountBucket, UserMessageStats, UserProfile,
+)
+from crypto_app import writebehind
+from crypto_app.writebehind import WriteBehindQueue, asave_message, queue_stats, save_message
+
+
+def new_message(user, text='message', key=''):
+    message = EncryptedMessage(user=user, original_text=text, key=EncryptionKey.objects.for_secret(key) if key else None)
+    message.prepare_ciphertext()
+    return message
+
+
+class QuotaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.size = message_size(new_message(self.user))
+        UserProfile.objects.create(user=self.user, storage_limit=2 * self.size)
+
+    def bytes_used(self):
+        return UserProfile.objects.get(user=self.user).bytes_used
+
+    def test_reservation_is_counted_before_the_write(self):
+        message = new_message(self.user)
+        reserve_quota(message)
+        self.assertEqual(self.bytes_used(), self.size)
+        message.save()
+        # Place déjà comptée : pas de second décompte à l'écriture
+        self.assertEqual(self.bytes_used(), self.size)
+        message.delete()
+        self.assertEqual(self.bytes_used(), 0)
+
+    def test_reservation_beyond_the_limit_is_refused(self):
+        for _ in range(2):
+            reserve_quota(new_message(self.user))
+        with self.assertRaises(QuotaExceeded):
+            reserve_quota(new_message(self.user))
+        self.assertEqual(self.bytes_used(), 2 * self.size)
+        self.assertEqual(remaining_quota(self.user), 0)
+
+    def test_failed_save_releases_the_reservation(self):
+        message = new_message(self.user)
+        reserve_quota(message)
+        message.original_text = None  # save() échoue
+        with self.assertRaises(TypeError):
+            save_message(message)
+        self.assertEqual(self.bytes_used(), 0)
+
+    def test_release(self):
+        message = new_message(self.user)
+        reserve_quota(message)
+        release_quota([message])
+        release_quota([message])
+        self.assertEqual(self.bytes_used(), 0)
+
+    def test_reserve_many_keeps_the_messages_that_fit(self):
+        messages = [new_message(self.user) for _ in range(3)]
+        refused = reserve_quota_many(messages)
+        self.assertEqual(refused, [messages[2]])
+        self.assertEqual(self.bytes_used(), 2 * self.size)
+
+    def test_multibyte_text_is_counted_in_bytes(self):
+        text = 'Déjà vu — 日本語 🔐'
+        message = new_message(self.user, text)
+        self.assertEqual(message.original_length, len(text.encode('utf-8')))
+        reserve_quota(message)
+        message.save()
+        self.assertEqual(self.bytes_used(), len(text.encode('utf-8')) + message.encrypted_length)
+        self.assertEqual(reconcile_storage(), [])
+
+    def test_missing_profile_gets_the_default_quota(self):
+        bob = User.objects.create_user('bob', password='pw')
+        reserve_quota(new_message(bob))
+        profile = UserProfile.objects.get(user=bob)
+        self.assertEqual(profile.bytes_used, self.size)
+        self.assertEqual(profile.storage_limit, UserProfile._meta.get_field('storage_limit').default)
+
+    def test_api_stores_only_what_fits(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('crypto_app:api_encrypt') + '?store=1',
+            json.dumps({'items': [{'text': 'message'}] * 3}),
+            content_type='application/json',
+        )
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(['error' in line for line in lines], [False, False, True])
+        self.assertEqual(EncryptedMessage.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.bytes_used(), 2 * self.size)
+
+
+class WriteBehindQuotaTests(TestCase):
+    """Lot écrit dans le thread du test (_write) : le thread d'écriture ne partage pas la base en mémoire"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.size = message_size(new_message(self.user))
+        UserProfile.objects.create(user=self.user, storage_limit=2 * self.size)
+        self.queue = WriteBehindQueue()
+
+    def bytes_used(self):
+        return UserProfile.objects.get(user=self.user).bytes_used
+
+    def test_queued_messages_count_against_the_quota(self):
+        batch = []
+        for _ in range(3):
+            message = new_message(self.user)
+            try:
+                reserve_quota(message)
+            except QuotaExceeded:
+                continue
+            batch.append(message)
+        # Deux messages en attente d'écriture : le troisième est déjà refusé
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(self.bytes_used(), 2 * self.size)
+
+        self.queue._write(batch)
+        self.assertEqual(self.queue.written, 2)
+        self.assertEqual(EncryptedMessage.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.bytes_used(), 2 * self.size)
+
+    def test_abandoned_message_releases_its_reservation(self):
+        kept, abandoned = new_message(self.user), new_message(self.user)
+        reserve_quota(kept)
+        reserve_quota(abandoned)
+        abandoned.original_text = None
+        with self.assertLogs('crypto_app.writebehind', 'ERROR'):
+            self.queue._write([kept, abandoned])
+        self.assertEqual((self.queue.written, self.queue.failed), (1, 1))
+        self.assertEqual(self.bytes_used(), self.size)
+
+    def test_failed_batch_is_written_one_by_one(self):
+        batch = [new_message(self.user) for _ in range(2)]
+        for message in batch:
+            reserve_quota(message)
+        with mock.patch.object(EncryptedMessage.objects, 'bulk_create', side_effect=IntegrityError), \
+                self.assertLogs('crypto_app.writebehind', 'ERROR'):
+            self.queue._write(batch)
+        self.assertEqual((self.queue.written, self.queue.failed), (2, 0))
+        self.assertEqual(EncryptedMessage.objects.filter(user=self.user).count(), 2)
+        # Place réservée comptée une seule fois malgré la reprise message par message
+        self.assertEqual(self.bytes_used(), 2 * self.size)
+        self.assertEqual(reconcile_storage(), [])
+
+    @override_settings(CRYPTO_WRITE_BEHIND=True)
+    def test_save_message_queues_when_enabled(self):
+        recording = RecordingQueue()
+        with mock.patch.object(writebehind, '_write_queue', recording):
+            message = new_message(self.user)
+            save_message(message)
+            self.assertTrue(recording.flush(timeout=5))
+            self.assertEqual(recording.batches, [[message]])
+            self.assertFalse(EncryptedMessage.objects.exists())
+            self.assertEqual(queue_stats(), {'enabled': True, 'depth': 0, 'written': 1, 'failed': 0})
+
+
+class RecordingQueue(WriteBehindQueue):
+    """File dont le thread d'écriture note les lots au lieu d'écrire en base"""
+
+    def __init__(self, release=None, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        # Événement attendu avant chaque lot (écriture bloquée tant qu'il n'est pas levé)
+        self.release = release
+
+    def _write(self, batch):
+        if self.release is not None:
+            self.release.wait(5)
+        self.batches.append(batch)
+        self.written += len(batch)
+
+
+class WriteBehindQueueTests(SimpleTestCase):
+    def test_flush_waits_for_every_message(self):
+        release = threading.Event()
+        write_queue = RecordingQueue(release=release, batch_size=3)
+        for i in range(7):
+            write_queue.put(i)
+        self.assertEqual(write_queue.depth(), 7)
+        release.set()
+        self.assertTrue(write_queue.flush(timeout=5))
+        self.assertEqual(write_queue.depth(), 0)
+        # Lots bornés par batch_size, dans l'ordre de dépôt
+        self.assertTrue(all(len(batch) <= 3 for batch in write_queue.batches))
+        self.assertEqual([item for batch in write_queue.batches for item in batch], list(range(7)))
+
+    def test_flush_timeout(self):
+        release = threading.Event()
+        write_queue = RecordingQueue(release=release)
+        write_queue.put('message')
+        self.assertFalse(write_queue.flush(timeout=0.05))
+        release.set()
+        self.assertTrue(write_queue.flush(timeout=5))
+
+    def test_flush_without_writer_thread(self):
+        write_queue = RecordingQueue()
+        write_queue._queue.put('message')
+        self.assertFalse(write_queue.flush(timeout=5))
+
+    def test_empty_queue_is_flushed(self):
+        self.assertTrue(RecordingQueue().flush(timeout=0))
+
+    @override_settings(CRYPTO_WRITE_BEHIND=True)
+    async def test_asave_message_queues_when_enabled(self):
+        recording = RecordingQueue()
+        with mock.patch.object(writebehind, '_write_queue', recording):
+            await asave_message('message')
+            self.assertTrue(recording.flush(timeout=5))
+        self.assertEqual(recording.batches, [['message']])
+
+
+class CounterTests(TestCase):
+    """Compteurs tenus à chaque écriture : toujours égaux à un recalcul complet (rebuild, reconcile_storage)"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+
+    def counters(self):
+        return (
+            sorted(UserMessageStats.objects.exclude(total_messages=0, distinct_keys=0)
+                   .values_list('user_id', 'total_messages', 'distinct_keys')),
+            sorted(MessageCountBucket.objects.exclude(count=0).values_list('user_id', 'period', 'start', 'count')),
+            sorted(KeyUsage.objects.values_list('user_id', 'key_id', 'message_count')),
+        )
+
+    def assertCountersConsistent(self):
+        counters = self.counters()
+        self.assertEqual(reconcile_storage(), [])
+        rebuild()
+        self.assertEqual(self.counters(), counters)
+
+    def create(self, user, text='message', key=''):
+        message = EncryptedMessage(user=user, original_text=text, key=EncryptionKey.objects.for_secret(key) if key else None)
+        message.save()
+        return message
+
+    def test_create(self):
+        self.create(self.alice, key='alpha')
+        self.create(self.alice, key='beta')
+        self.create(self.alice)
+        self.create(None)
+        stats = get_message_stats(self.alice)
+        self.assertEqual((stats['total_messages'], stats['unique_keys']), (3, 2))
+        self.assertEqual((stats['messages_today'], stats['messages_this_month']), (3, 3))
+        self.assertCountersConsistent()
+
+    def test_reassign_and_key_change(self):
+        message = self.create(self.alice, key='alpha')
+        message.user = self.bob
+        message.save()
+        self.assertEqual(get_message_stats(self.alice)['total_messages'], 0)
+        self.assertEqual(get_message_stats(self.bob)['unique_keys'], 1)
+        self.assertCountersConsistent()
+
+        message.key = EncryptionKey.objects.for_secret('beta')
+        message.original_text = 'message plus long'
+        message.encrypted_data = None
+        message.save()
+        self.assertEqual(KeyUsage.objects.get(user=self.bob).key, message.key)
+        self.assertCountersConsistent()
+
+    def test_loaded_state_is_a_tuple(self):
+        message = self.create(self.alice, key='alpha')
+        loaded = EncryptedMessage.objects.get(pk=message.pk)
+        self.assertEqual(loaded._accounting_state, AccountingState(
+            self.alice.pk, message.created_at, message.key_id, message.original_length, message.encrypted_length,
+        ))
+        # Champ différé : état relu en base à l'enregistrement
+        loaded = EncryptedMessage.objects.defer('user').get(pk=message.pk)
+        self.assertIsNone(loaded._accounting_state)
+        loaded.user = self.bob
+        loaded.save()
+        self.assertEqual(get_message_stats(self.bob)['total_messages'], 1)
+        self.assertCountersConsistent()
+
+    def test_delete(self):
+        messages = [self.create(self.alice, key=key) for key in ('alpha', 'alpha', 'beta', '')]
+        messages[0].delete()
+        self.assertCountersConsistent()
+        EncryptedMessage.objects.filter(key__isnull=False).delete()
+        self.assertEqual(get_message_stats(self.alice), {
+            'total_messages': 1, 'unique_keys': 0, 'messages_today': 1, 'messages_this_month': 1,
+        })
+        self.assertCountersConsistent()
+
+    def test_anonymize(self):
+        messages = [self.create(self.alice, text='un message bien plus long que le texte anonymisé ' * 4)
+                    for _ in range(3)]
+        EncryptedMessage.objects.filter(pk__in=[message.pk for message in messages[:2]]).anonymize()
+        self.assertCountersConsistent()
+        EncryptedMessage.objects.all().anonymize()
+        self.assertEqual(
+            set(EncryptedMessage.objects.values_list('original_length', flat=True)),
+            {len(ANONYMIZED_TEXT.encode('utf-8'))},
+        )
+        self.assertCountersConsistent()
+
+    def test_import(self):
+        records = [{'text': 'un', 'key': 'alpha', 'user': 'alice'}, {'text': 'deux', 'user': 'bob'}, {'text': ''}]
+        result = EncryptedMessage.objects.import_messages(records, batch_size=2)
+        self.assertEqual((result.imported, len(result.failed)), (2, 1))
+        self.assertEqual(get_message_stats(self.alice)['unique_keys'], 1)
+        self.assertCountersConsistent()
+
+    def test_purge(self):
+        for _ in range(2):
+            self.create(self.alice, key='alpha')
+        recent = self.create(self.alice, key='beta')
+        EncryptedMessage.objects.exclude(pk=recent.pk).update(created_at=timezone.now() - timedelta(days=60))
+        rebuild()
+        call_command('purge_messages', older_than=30, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(list(EncryptedMessage.objects.all()), [recent])
+        self.assertEqual(get_message_stats(self.alice)['unique_keys'], 1)
+        self.assertCountersConsistent()
+
+    def test_rebuild_and_reconcile_fix_drift(self):
+        self.create(self.alice, key='alpha')
+        self.create(self.bob)
+        counters = self.counters()
+        UserMessageStats.objects.update(total_messages=7, distinct_keys=5)
+        MessageCountBucket.objects.update(count=3)
+        UserProfile.objects.update(bytes_used=1)
+        self.assertEqual(len(reconcile_storage()), 2)
+        self.assertEqual(reconcile_storage(), [])
+        rebuild([self.alice.pk, self.bob.pk])
+        self.assertEqual(self.counters(), counters)
+
+    def test_negative_drift_does_not_block_deletes(self):
+        message = self.create(self.alice, key='alpha')
+        # Compteur en retard (ex: message écrit sans passer par save)
+        UserMessageStats.objects.update(total_messages=0)
+        message.delete()
+        self.assertEqual(UserMessageStats.objects.get(user=self.alice).total_messages, -1)
+        rebuild()
+        self.assertEqual(get_message_stats(self.alice)['total_messages'], 0)
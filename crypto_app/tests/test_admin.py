@@ -0,0 +1,263 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from unittest.mock import patch
+from urllib.parse import parse_qsl
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from crypto_app.accounting import get_message_stats, rebuild, reconcile_storage
+
+from crypto_app.admin import EncryptedMessageAdmin
+from crypto_app.models import (
+    ANONYMIZED_TEXT, EncryptedMessage, EncryptionKey, KeyUsage, MessageCountBucket, UserMessageStats, UserProfile,
+)
+from crypto_app.utils.crypto import AESCipher
+
+
+class EncryptedMessageAdminTests(TestCase):
+    changelist_url = reverse('admin:crypto_app_encryptedmessage_changelist')
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        for user in (self.alice, self.bob):
+            EncryptedMessage(user=user, original_text=f"message de {user.username}").save()
+        self.client.force_login(self.admin)
+
+    def test_user_filter_is_a_search_field(self):
+        response = self.client.get(self.changelist_url, {'q': 'message'})
+        self.assertContains(response, 'name="user"')
+        # La recherche en cours est conservée par le formulaire du filtre
+        self.assertContains(response, '<input type="hidden" name="q" value="message">', html=True)
+
+    def test_user_filter_selects_by_username(self):
+        response = self.client.get(self.changelist_url, {'user': 'alice'})
+        self.assertEqual(
+            [message.user for message in response.context['cl'].result_list], [self.alice]
+        )
+        response = self.client.get(self.changelist_url, {'user': 'inconnu'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_change_form_uses_user_autocomplete(self):
+        message = EncryptedMessage.objects.get(user=self.alice)
+        response = self.client.get(reverse('admin:crypto_app_encryptedmessage_change', args=[message.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, 'name="user"')
+
+    def test_changelist_is_paginated_by_cursor(self):
+        for index in range(5):
+            EncryptedMessage(user=self.alice, original_text=f"suite {index}").save()
+        expected = list(
+            EncryptedMessage.objects.filter(user=self.alice).order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+        seen, params = [], {}
+        with patch.object(EncryptedMessageAdmin, 'list_per_page', 3):
+            while True:
+                response = self.client.get(self.changelist_url, {'user': 'alice', **params})
+                cl = response.context['cl']
+                seen += [message.pk for message in cl.result_list]
+                if not cl.keyset_page.has_next():
+                    break
+                # Lien « Plus anciens » : curseur et filtres conservés
+                self.assertContains(response, cl.next_page_url.replace('&', '&amp;'))
+                params = dict(parse_qsl(cl.next_page_url[1:]))
+            self.assertEqual(seen, expected)
+
+            # Page précédente, puis filtre changé : retour en tête de liste
+            response = self.client.get(self.changelist_url, {'user': 'alice', 'before': cl.keyset_page.previous_cursor})
+            self.assertEqual([message.pk for message in response.context['cl'].result_list], seen[:3])
+            self.assertNotIn('after', response.context['cl'].get_query_string({'user': 'bob'}))
+
+    def test_changelist_sorted_by_column_uses_page_numbers(self):
+        response = self.client.get(self.changelist_url, {'o': '1', 'after': 'ignoré'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['cl'].keyset_page)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+
+class ExportActionsTests(TestCase):
+    changelist_url = reverse('admin:crypto_app_encryptedmessage_changelist')
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.messages = [
+            self.create(self.alice, 'bonjour'),
+            self.create(None, 'été, "guillemets"\net retour', key='alpha'),
+        ]
+        # Ancien stockage en base64 : export et rapport identiques à ceux du stockage binaire
+        with override_settings(CRYPTO_BINARY_STORAGE=False):
+            self.messages.append(self.create(self.alice, 'base64'))
+        self.assertIsNone(self.messages[-1].encrypted_data)
+
+    def create(self, user, text, key=''):
+        message = EncryptedMessage(user=user, original_text=text, key=EncryptionKey.objects.for_secret(key) if key else None)
+        message.save()
+        return message
+
+    def run_action(self, action, messages=None):
+        response = self.client.post(self.changelist_url, {
+            'action': action,
+            '_selected_action': [message.pk for message in messages or self.messages],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def expected_rows(self):
+        return [
+            {
+                'id': str(message.pk),
+                'user': message.user.username if message.user else 'Anonyme',
+                'original_text': message.original_text,
+                'encrypted_text': message.get_encrypted_text(),
+                'encryption_key': message.encryption_key or 'Défaut',
+                'created_at': message.created_at.isoformat(),
+            }
+            for message in EncryptedMessage.objects.filter(pk__in=[m.pk for m in self.messages]).order_by('-created_at', '-pk')
+        ]
+
+    def assertRows(self, rows):
+        self.assertEqual([{key: str(value) for key, value in row.items()} for row in rows], self.expected_rows())
+
+    def test_export_json(self):
+        response, content = self.run_action('export_messages_json')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="messages_export.json"')
+        self.assertRows(json.loads(content))
+
+    def test_export_ndjson(self):
+        response, content = self.run_action('export_messages_ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertRows([json.loads(line) for line in content.splitlines()])
+
+    def test_export_csv(self):
+        response, content = self.run_action('export_messages_csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="messages_export.csv"')
+        self.assertRows(list(csv.DictReader(io.StringIO(content))))
+
+    def test_exported_ciphertext_decrypts(self):
+        _, content = self.run_action('export_messages_json')
+        for row in json.loads(content):
+            key = None if row['encryption_key'] == 'Défaut' else row['encryption_key']
+            self.assertEqual(AESCipher(key).decrypt(row['encrypted_text']), row['original_text'])
+
+    def test_decryption_report(self):
+        response, content = self.run_action('decrypt_selected_messages')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rapport_dechiffrement.txt"')
+        for message in self.messages:
+            self.assertIn(f"Message ID: {message.pk}\nStatus: ✅ Succès\nTexte déchiffré: {message.original_text}\n", content)
+        self.assertIn("Messages traités: 3\nSuccès: 3\nErreurs: 0\n", content)
+
+    def test_decryption_report_lists_errors_per_message(self):
+        broken, anonymized, kept = self.messages
+        EncryptedMessage.objects.filter(pk=broken.pk).update(encrypted_data=AESCipher('inconnue', kdf='').encrypt_bytes('x'))
+        EncryptedMessage.objects.filter(pk=anonymized.pk).anonymize()
+        with patch('crypto_app.admin.DECRYPT_CHUNK_SIZE', 2):
+            _, content = self.run_action('decrypt_selected_messages')
+        for message in (broken, anonymized):
+            self.assertIn(f"Message ID: {message.pk}\nStatus: ❌ Erreur\nErreur: Erreur lors du déchiffrement", content)
+        self.assertIn(f"Message ID: {kept.pk}\nStatus: ✅ Succès\nTexte déchiffré: base64\n", content)
+        self.assertIn("Messages traités: 3\nSuccès: 1\nErreurs: 2\n", content)
+
+
+class BulkActionsTests(TestCase):
+    """Actions appliquées en quelques requêtes, compteurs par utilisateur tenus à jour"""
+    changelist_url = reverse('admin:crypto_app_encryptedmessage_changelist')
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.messages = [
+            self.create(self.alice, 'un texte bien plus long que le contenu anonymisé ' * 3, key='alpha'),
+            self.create(self.alice, 'deuxième message'),
+            self.create(self.alice, 'troisième message', key='beta'),
+            self.create(self.bob, 'message de bob'),
+            self.create(None, 'message anonyme'),
+        ]
+
+    def create(self, user, text, key=''):
+        message = EncryptedMessage(user=user, original_text=text, key=EncryptionKey.objects.for_secret(key) if key else None)
+        message.save()
+        return message
+
+    def run_action(self, action, messages, **data):
+        return self.client.post(self.changelist_url, {
+            'action': action, '_selected_action': [message.pk for message in messages], **data,
+        }, follow=True)
+
+    def counters(self):
+        return (
+            sorted(UserMessageStats.objects.exclude(total_messages=0, distinct_keys=0)
+                   .values_list('user_id', 'total_messages', 'distinct_keys')),
+            sorted(MessageCountBucket.objects.exclude(count=0).values_list('user_id', 'period', 'start', 'count')),
+            sorted(KeyUsage.objects.values_list('user_id', 'key_id', 'message_count')),
+            sorted(UserProfile.objects.values_list('user_id', 'bytes_used')),
+        )
+
+    def assertCountersConsistent(self):
+        counters = self.counters()
+        self.assertEqual(reconcile_storage(), [])
+        rebuild()
+        self.assertEqual(self.counters(), counters)
+
+    def test_anonymize_action(self):
+        selected = [self.messages[0], self.messages[1], self.messages[3], self.messages[4]]
+        before = UserProfile.objects.get(user=self.alice).bytes_used
+        response = self.run_action('anonymize_messages', selected)
+        self.assertContains(response, "4 messages ont été anonymisés.")
+        self.assertEqual(
+            {message.pk for message in EncryptedMessage.objects.filter(original_text=ANONYMIZED_TEXT)},
+            {message.pk for message in selected},
+        )
+        self.assertEqual(EncryptedMessage.objects.get(pk=self.messages[2].pk).get_decrypted_text(), 'troisième message')
+        # Volume réduit de la différence de taille, clés et nombres de messages inchangés
+        self.assertLess(UserProfile.objects.get(user=self.alice).bytes_used, before)
+        self.assertEqual(get_message_stats(self.alice)['total_messages'], 3)
+        self.assertCountersConsistent()
+
+    def test_anonymize_action_query_count_does_not_grow_with_the_selection(self):
+        def queries(messages):
+            with CaptureQueriesContext(connection) as context:
+                self.run_action('anonymize_messages', messages)
+            return len(context.captured_queries)
+
+        # Une mise à jour des compteurs par utilisateur, pas par message
+        few = queries(self.messages[:1])
+        more = [self.create(self.alice, f"encore un message {i}") for i in range(10)]
+        self.assertEqual(queries(self.messages[1:3] + more), few)
+
+    def test_delete_old_messages_action(self):
+        old = [self.messages[0], self.messages[3], self.messages[4]]
+        EncryptedMessage.objects.filter(pk__in=[message.pk for message in old]).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+        # Dates modifiées hors de l'ORM : compteurs par période recalculés
+        rebuild()
+        with patch('crypto_app.retention.DELETE_CHUNK_SIZE', 2):
+            response = self.run_action('delete_old_messages', self.messages)
+        self.assertContains(response, "3 messages anciens ont été supprimés.")
+        self.assertEqual(sorted(EncryptedMessage.objects.values_list('pk', flat=True)),
+                         [self.messages[1].pk, self.messages[2].pk])
+        self.assertEqual(get_message_stats(self.alice)['total_messages'], 2)
+        self.assertEqual(get_message_stats(self.bob)['total_messages'], 0)
+        self.assertFalse(KeyUsage.objects.filter(key__fingerprint=EncryptionKey.fingerprint_for('alpha')).exists())
+        self.assertCountersConsistent()
+
+    def test_delete_selected_action(self):
+        response = self.run_action('delete_selected', self.messages[1:4], post='yes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(EncryptedMessage.objects.values_list('pk', flat=True)),
+                         [self.messages[0].pk, self.messages[4].pk])
+        self.assertEqual(get_message_stats(self.alice)['unique_keys'], 1)
+        self.assertEqual(UserProfile.objects.get(user=self.bob).bytes_used, 0)
+        self.assertCountersConsistent()
@@ -0,0 +1,133 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from crypto_app.accounting import message_size
+from crypto_app.models import EncryptedMessage, EncryptionKey, UserProfile
+from crypto_app.utils.crypto import AESCipher
+
+
+class ApiItemsTests(TestCase):
+    url = reverse('crypto_app:api_encrypt')
+
+    def post(self, data, content_type='application/json'):
+        body = data if isinstance(data, str) else json.dumps(data)
+        return self.client.post(self.url, body, content_type=content_type)
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_documented_shapes_are_accepted(self):
+        for data in (
+            {'text': 'un', 'id': 7},
+            [{'text': 'un', 'key': 'alpha'}, 'deux'],
+            {'items': ['un', {'text': 'deux', 'key': None}]},
+        ):
+            with self.subTest(data=data):
+                lines = self.lines(self.post(data))
+                self.assertTrue(lines)
+                self.assertTrue(all('encrypted_text' in line and 'error' not in line for line in lines))
+
+    def test_invalid_items_are_rejected(self):
+        for data in (
+            {'items': 'abc'},
+            {'items': {'text': 'un'}},
+            '"abc"',
+            '42',
+            ['un', 42],
+            [{'text': 1}],
+            [{'text': 'un', 'key': 123}],
+            [None],
+        ):
+            with self.subTest(data=data):
+                response = self.post(data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_ndjson_reports_invalid_lines(self):
+        body = '{"text": "un"}\n42\n"deux"\n{"text": "trois", "key": 5}\n'
+        lines = self.lines(self.post(body, content_type='application/x-ndjson'))
+        self.assertEqual(['error' in line for line in lines], [False, True, False, True])
+
+    def test_round_trip(self):
+        encrypted = self.lines(self.post({'items': [{'text': 'secret', 'key': 'alpha', 'id': 'a'}]}))
+        response = self.client.post(
+            reverse('crypto_app:api_decrypt'),
+            json.dumps([{'encrypted_text': encrypted[0]['encrypted_text'], 'key': 'alpha', 'id': 'a'}]),
+            content_type='application/json',
+        )
+        self.assertEqual(self.lines(response), [{'index': 0, 'id': 'a', 'text': 'secret'}])
+
+    def test_order_and_ids_are_kept_across_chunks(self):
+        items = [{'text': f"message {i}", 'id': i * 10, 'key': 'alpha' if i % 2 else None} for i in range(8)]
+        with mock.patch('crypto_app.api.API_CHUNK_SIZE', 3):
+            lines = self.lines(self.post(items))
+        self.assertEqual([(line['index'], line['id']) for line in lines], [(i, i * 10) for i in range(8)])
+        for item, line in zip(items, lines):
+            cipher = AESCipher(item['key']) if item['key'] else AESCipher()
+            self.assertEqual(cipher.decrypt(line['encrypted_text']), item['text'])
+
+
+class ApiDecryptErrorsTests(TestCase):
+    url = reverse('crypto_app:api_decrypt')
+
+    def test_errors_are_reported_per_item(self):
+        alpha = AESCipher('alpha').encrypt('un')
+        items = [
+            {'encrypted_text': alpha, 'key': 'alpha', 'id': 'ok'},
+            {'encrypted_text': alpha, 'key': 'beta', 'id': 'mauvaise clé'},
+            {'encrypted_text': 'pas du base64 !', 'id': 'illisible'},
+            AESCipher().encrypt('deux'),
+        ]
+        with mock.patch('crypto_app.api.API_CHUNK_SIZE', 2):
+            response = self.client.post(self.url, json.dumps(items), content_type='application/json')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['index'] for line in lines], [0, 1, 2, 3])
+        self.assertEqual(lines[0], {'index': 0, 'id': 'ok', 'text': 'un'})
+        self.assertEqual([line.get('id') for line in lines[1:3]], ['mauvaise clé', 'illisible'])
+        self.assertTrue(all('error' in line and 'text' not in line for line in lines[1:3]))
+        self.assertEqual(lines[3], {'index': 3, 'text': 'deux'})
+
+
+class ApiStoreTests(TestCase):
+    url = reverse('crypto_app:api_encrypt') + '?store=1'
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def post(self, items):
+        response = self.client.post(self.url, json.dumps(items), content_type='application/json')
+        if response.status_code != 200:
+            return response
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_anonymous_store_is_refused(self):
+        response = self.post(['un'])
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(EncryptedMessage.objects.exists())
+
+    def test_messages_are_stored_for_the_user(self):
+        self.client.force_login(self.user)
+        lines = self.post(['un', {'text': 'deux', 'key': 'alpha'}])
+        self.assertTrue(all('error' not in line for line in lines))
+        messages = EncryptedMessage.objects.filter(user=self.user).order_by('pk')
+        self.assertEqual([(m.original_text, m.key) for m in messages],
+                         [('un', None), ('deux', EncryptionKey.objects.for_secret('alpha'))])
+        self.assertEqual([m.get_decrypted_text() for m in messages], ['un', 'deux'])
+
+    def test_quota_refusal_is_reported_per_item(self):
+        message = EncryptedMessage(user=self.user, original_text='un')
+        message.prepare_ciphertext()
+        size = message_size(message)
+        UserProfile.objects.create(user=self.user, storage_limit=2 * size)
+        self.client.force_login(self.user)
+        lines = self.post(['un', 'un', 'un'])
+        self.assertEqual(['error' in line for line in lines], [False, False, True])
+        self.assertIn("Quota de stockage dépassé", lines[2]['error'])
+        # Le chiffré est tout de même renvoyé au client
+        self.assertIn('encrypted_text', lines[2])
+        self.assertEqual(EncryptedMessage.objects.filter(user=self.user).count(), 2)
@@ -0,0 +1,288 @@
+import array
+import io
+import os
+import zlib
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+from django.test import SimpleTestCase, override_settings
+
+from crypto_app.utils.crypto import (
+    ENVELOPE_HEADER, ENVELOPE_MAGIC, ENVELOPE_VERSION, FLAG_LZMA, FLAG_SALT, FLAG_ZLIB, KDF_HEADER, MODES,
+    AESCipher, derive_kdf_key, kdf_cache_stats, key_fingerprint, parse_envelope_header, prepare_key,
+)
+
+PLAINTEXT = 'Message à chiffrer, assez long pour être compressé. ' * 8
+KEY = 'cle-personnalisee'
+# Coût réduit pour les tests : accepté au déchiffrement, même d'une enveloppe fournie par un client
+KDF_COST = 8
+
+# Octets de l'en-tête (voir ENVELOPE_HEADER)
+MAGIC = slice(0, 2)
+VERSION = 2
+MODE = 3
+FLAGS = 4
+KEY_ID = slice(5, 9)
+
+
+def tampered(data, position, value):
+    data = bytearray(data)
+    data[position] = value
+    return bytes(data)
+
+
+class EnvelopeTests(SimpleTestCase):
+    def assertNotRecovered(self, cipher, data, plaintext=PLAINTEXT.encode()):
+        """L'enveloppe altérée est rejetée ou, faute d'authentification (CTR/CBC), ne redonne pas le texte"""
+        try:
+            recovered = cipher.decrypt_bytes(data)
+        except Exception:
+            return
+        self.assertNotEqual(recovered, plaintext)
+
+    def test_round_trip(self):
+        for mode in ('GCM', 'CTR', 'CBC', 'LEGACY'):
+            for compression in (None, 'zlib', 'lzma'):
+                for kdf in ('', 'pbkdf2', 'scrypt'):
+                    with self.subTest(mode=mode, compression=compression, kdf=kdf):
+                        cipher = AESCipher(KEY, mode, compression=compression or '', kdf=kdf, kdf_cost=KDF_COST)
+                        encrypted = cipher.encrypt(PLAINTEXT)
+                        self.assertEqual(AESCipher(KEY).decrypt(encrypted), PLAINTEXT)
+
+    def test_stream_round_trip(self):
+        data = os.urandom(200 * 1024 + 7)
+        for mode in ('GCM', 'CTR', 'CBC', 'LEGACY'):
+            for kdf in ('', 'pbkdf2'):
+                with self.subTest(mode=mode, kdf=kdf):
+                    cipher = AESCipher(KEY, mode, kdf=kdf, kdf_cost=KDF_COST)
+                    encrypted = b''.join(cipher.encrypt_stream(io.BytesIO(data)))
+                    self.assertEqual(len(encrypted), cipher.encrypted_size(len(data)))
+                    self.assertEqual(b''.join(AESCipher(KEY).decrypt_stream(io.BytesIO(encrypted))), data)
+                    self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), data)
+
+    def test_header_fields(self):
+        encrypted = AESCipher(KEY, 'CTR', compression='zlib', kdf='').encrypt_bytes(PLAINTEXT)
+        self.assertEqual(encrypted[MAGIC], ENVELOPE_MAGIC)
+        self.assertEqual(encrypted[VERSION], ENVELOPE_VERSION)
+        self.assertEqual(encrypted[MODE], MODES['CTR'])
+        self.assertEqual(encrypted[FLAGS], FLAG_ZLIB)
+        self.assertEqual(encrypted[KEY_ID], key_fingerprint(prepare_key(KEY)[0]))
+        self.assertEqual(parse_envelope_header(encrypted), ('CTR', FLAG_ZLIB, encrypted[KEY_ID]))
+
+        salted = AESCipher(KEY, 'GCM', compression='lzma', kdf='pbkdf2', kdf_cost=KDF_COST).encrypt_bytes(PLAINTEXT)
+        self.assertEqual(salted[FLAGS], FLAG_SALT | FLAG_LZMA)
+        algorithm, cost, salt = KDF_HEADER.unpack_from(salted, ENVELOPE_HEADER.size)
+        self.assertEqual((algorithm, cost), (1, KDF_COST))
+        # Identifiant d'une clé dérivée : empreinte de la clé dérivée, pas du mot de passe
+        self.assertEqual(salted[KEY_ID], key_fingerprint(derive_kdf_key('pbkdf2', KDF_COST, KEY.encode(), salt)))
+        self.assertNotEqual(salted[KEY_ID], encrypted[KEY_ID])
+
+    def test_server_key_is_not_derived(self):
+        encrypted = AESCipher().encrypt_bytes(PLAINTEXT)
+        self.assertEqual(encrypted[FLAGS], 0)
+        self.assertEqual(AESCipher().decrypt_bytes(encrypted), PLAINTEXT.encode())
+
+    def test_tampered_magic_or_version(self):
+        for mode in ('GCM', 'CTR', 'CBC'):
+            encrypted = AESCipher(KEY, mode, kdf='').encrypt_bytes(PLAINTEXT)
+            for position, value in ((0, encrypted[0] ^ 0xFF), (VERSION, ENVELOPE_VERSION + 1)):
+                with self.subTest(mode=mode, position=position):
+                    self.assertNotRecovered(AESCipher(KEY), tampered(encrypted, position, value))
+
+    def test_tampered_mode(self):
+        for mode in ('GCM', 'CTR', 'CBC'):
+            encrypted = AESCipher(KEY, mode, kdf='').encrypt_bytes(PLAINTEXT)
+            for other in set(MODES.values()) - {MODES[mode]} | {0, 9}:
+                with self.subTest(mode=mode, other=other):
+                    self.assertNotRecovered(AESCipher(KEY), tampered(encrypted, MODE, other))
+
+    def test_tampered_flags(self):
+        encrypted = AESCipher(KEY, 'GCM', kdf='').encrypt_bytes(PLAINTEXT)
+        with self.assertRaisesMessage(Exception, "format d'enveloppe non supporté"):
+            AESCipher(KEY).decrypt_bytes(tampered(encrypted, FLAGS, 0x80))
+        for flag in (FLAG_ZLIB, FLAG_LZMA, FLAG_SALT):
+            with self.subTest(flag=flag):
+                # En-tête authentifié en GCM : tout drapeau ajouté est détecté
+                with self.assertRaises(Exception):
+                    AESCipher(KEY).decrypt_bytes(tampered(encrypted, FLAGS, flag))
+
+    def test_tampered_key_id(self):
+        for kdf in ('', 'pbkdf2'):
+            encrypted = AESCipher(KEY, 'GCM', kdf=kdf, kdf_cost=KDF_COST).encrypt_bytes(PLAINTEXT)
+            with self.subTest(kdf=kdf):
+                with self.assertRaisesMessage(Exception, "clé incorrecte"):
+                    AESCipher(KEY).decrypt_bytes(tampered(encrypted, KEY_ID.start, encrypted[KEY_ID.start] ^ 0x01))
+
+    def test_tampered_body_and_tag(self):
+        encrypted = AESCipher(KEY, 'GCM', kdf='').encrypt_bytes(PLAINTEXT)
+        for position in (ENVELOPE_HEADER.size, ENVELOPE_HEADER.size + 20, len(encrypted) - 1):
+            with self.subTest(position=position):
+                with self.assertRaises(Exception):
+                    AESCipher(KEY).decrypt_bytes(tampered(encrypted, position, encrypted[position] ^ 0x01))
+        with self.assertRaises(Exception):
+            AESCipher(KEY).decrypt_bytes(encrypted[:-1])
+
+    def test_wrong_key_is_rejected(self):
+        encrypted = AESCipher(KEY, 'GCM', kdf='pbkdf2', kdf_cost=KDF_COST).encrypt_bytes(PLAINTEXT)
+        with self.assertRaisesMessage(Exception, "clé incorrecte"):
+            AESCipher('autre-cle').decrypt_bytes(encrypted)
+        with self.assertRaisesMessage(Exception, "clé incorrecte"):
+            b''.join(AESCipher('autre-cle').decrypt_stream(io.BytesIO(encrypted)))
+        self.assertTrue(AESCipher(KEY).is_encrypted_with(encrypted))
+        self.assertFalse(AESCipher('autre-cle').is_encrypted_with(encrypted))
+
+    def test_forged_kdf_cost_is_rejected_before_derivation(self):
+        encrypted = AESCipher(KEY, 'GCM', kdf='pbkdf2', kdf_cost=KDF_COST).encrypt_bytes(PLAINTEXT)
+        forged = tampered(encrypted, ENVELOPE_HEADER.size + 1, 24)
+        misses = kdf_cache_stats()['misses']
+        with self.assertRaisesMessage(Exception, "format d'enveloppe non supporté"):
+            AESCipher(KEY, untrusted=True).decrypt_bytes(forged)
+        with self.assertRaisesMessage(Exception, "format d'enveloppe non supporté"):
+            b''.join(AESCipher(KEY, untrusted=True).decrypt_stream(io.BytesIO(forged)))
+        self.assertEqual(kdf_cache_stats()['misses'], misses)
+
+    def test_stored_kdf_cost_above_the_configured_cost(self):
+        """Un coût supérieur au coût configuré (réglage abaissé depuis) reste lisible pour les messages stockés"""
+        encrypted = AESCipher(KEY, 'GCM', kdf='scrypt', kdf_cost=15).encrypt_bytes(PLAINTEXT)
+        self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), PLAINTEXT.encode())
+        with self.assertRaisesMessage(Exception, "format d'enveloppe non supporté"):
+            AESCipher(KEY, untrusted=True).decrypt_bytes(encrypted)
+
+    def test_compression_round_trip(self):
+        for compression, flag in (('zlib', FLAG_ZLIB), ('lzma', FLAG_LZMA)):
+            with self.subTest(compression=compression):
+                plain = AESCipher(KEY, 'GCM', compression='', kdf='').encrypt_bytes(PLAINTEXT)
+                encrypted = AESCipher(KEY, 'GCM', compression=compression, kdf='').encrypt_bytes(PLAINTEXT)
+                self.assertEqual(encrypted[FLAGS], flag)
+                self.assertLess(len(encrypted), len(plain))
+                self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), PLAINTEXT.encode())
+                self.assertEqual(b''.join(AESCipher(KEY).decrypt_stream(io.BytesIO(encrypted))), PLAINTEXT.encode())
+
+    def test_compression_skipped_when_it_does_not_help(self):
+        cipher = AESCipher(KEY, 'GCM', compression='zlib', kdf='')
+        for data in (os.urandom(4096), b'court'):
+            with self.subTest(size=len(data)):
+                encrypted = cipher.encrypt_bytes(data)
+                self.assertEqual(encrypted[FLAGS], 0)
+                self.assertEqual(len(encrypted), cipher.encrypted_size(len(data)))
+                self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), data)
+
+    @override_settings(CRYPTO_MAX_DECOMPRESSED_SIZE=1024)
+    def test_compression_skipped_above_the_decompression_limit(self):
+        data = b'a' * 2048
+        encrypted = AESCipher(KEY, 'GCM', compression='zlib', kdf='').encrypt_bytes(data)
+        self.assertEqual(encrypted[FLAGS], 0)
+        self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), data)
+
+    @override_settings(CRYPTO_MAX_DECOMPRESSED_SIZE=1024)
+    def test_decompression_bomb_is_rejected(self):
+        """Enveloppe forgée : quelques octets compressés qui dépassent la limite une fois décompressés"""
+        bomb = zlib.compress(b'\0' * 1025)
+        key, key_id = prepare_key(KEY.encode())
+        # Enveloppe GCM valide (tag calculé avec la clé) portant FLAG_ZLIB
+        header = ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, MODES['GCM'], FLAG_ZLIB, key_id)
+        nonce = os.urandom(12)
+        gcm = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        gcm.update(header)
+        forged = header + nonce + gcm.encrypt(bomb) + gcm.digest()
+        with self.assertRaisesMessage(Exception, "données décompressées trop volumineuses"):
+            AESCipher(KEY).decrypt_bytes(forged)
+        with self.assertRaisesMessage(Exception, "données décompressées trop volumineuses"):
+            b''.join(AESCipher(KEY).decrypt_stream(io.BytesIO(forged)))
+        # Juste sous la limite : accepté
+        self.assertEqual(len(AESCipher(KEY).decrypt_bytes(
+            AESCipher(KEY, 'GCM', compression='zlib', kdf='').encrypt_bytes(b'\0' * 1024)
+        )), 1024)
+
+    def test_legacy_format(self):
+        encrypted = AESCipher(KEY, 'LEGACY').encrypt_bytes(PLAINTEXT)
+        self.assertEqual(len(encrypted) % AES.block_size, 0)
+        self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), PLAINTEXT.encode())
+
+    def test_legacy_iv_that_looks_like_a_header(self):
+        """Ancien format (IV + CBC) dont l'IV commence comme une enveloppe : relu en LEGACY"""
+        key, _ = prepare_key(KEY.encode())
+        for mode in ('GCM', 'CTR', 'CBC'):
+            iv = ENVELOPE_MAGIC + bytes([ENVELOPE_VERSION, MODES[mode], 0]) + os.urandom(11)
+            with self.subTest(mode=mode):
+                encrypted = iv + AES.new(key, AES.MODE_CBC, iv).encrypt(pad(PLAINTEXT.encode(), AES.block_size))
+                self.assertIsNotNone(parse_envelope_header(encrypted))
+                self.assertEqual(AESCipher(KEY).decrypt_bytes(encrypted), PLAINTEXT.encode())
+
+
+class CallerBufferTests(SimpleTestCase):
+    """encrypt_into / decrypt_from : écriture dans des buffers fournis par l'appelant"""
+
+    MODES = ('GCM', 'CTR', 'CBC', 'LEGACY')
+
+    def test_encrypt_into_writes_in_the_caller_buffer(self):
+        data = os.urandom(1000)
+        for mode in self.MODES:
+            for kdf in ('', 'pbkdf2'):
+                with self.subTest(mode=mode, kdf=kdf):
+                    cipher = AESCipher(KEY, mode, compression='', kdf=kdf, kdf_cost=KDF_COST)
+                    size = cipher.encrypted_size(len(data))
+                    out = bytearray(size + 100)
+                    view = cipher.encrypt_into(data, out)
+                    self.assertIs(view.obj, out)
+                    self.assertEqual(len(view), size)
+                    # Octets au-delà de l'enveloppe laissés intacts
+                    self.assertEqual(bytes(out[size:]), bytes(100))
+                    self.assertEqual(AESCipher(KEY).decrypt_bytes(view), data)
+
+    def test_encrypt_into_accepts_bytes_like_sources(self):
+        cipher = AESCipher(KEY, 'GCM', compression='', kdf='')
+        backing = bytearray(b'--' + PLAINTEXT.encode() + b'--')
+        words = array.array('I', range(64))
+        for data, expected in (
+            (PLAINTEXT.encode(), PLAINTEXT.encode()),
+            (backing, bytes(backing)),
+            (memoryview(backing)[2:-2], PLAINTEXT.encode()),
+            (words, words.tobytes()),
+        ):
+            with self.subTest(type=type(data).__name__):
+                self.assertEqual(AESCipher(KEY).decrypt_bytes(cipher.encrypt_into(data)), expected)
+
+    def test_encrypt_into_undersized_buffer(self):
+        for mode in self.MODES:
+            with self.subTest(mode=mode):
+                cipher = AESCipher(KEY, mode, compression='', kdf='')
+                out = bytearray(cipher.encrypted_size(100) - 1)
+                with self.assertRaisesMessage(ValueError, "Buffer de sortie trop petit"):
+                    cipher.encrypt_into(bytes(100), out)
+                self.assertEqual(out, bytearray(len(out)))
+
+    def test_decrypt_from_slices_into_the_caller_buffer(self):
+        data = os.urandom(1000)
+        for mode in self.MODES:
+            with self.subTest(mode=mode):
+                encrypted = AESCipher(KEY, mode, compression='', kdf='').encrypt_bytes(data)
+                # Enveloppe lue au milieu d'un buffer plus grand, sans copie préalable
+                stored = memoryview(b'entete' + encrypted + b'suite')[6:-5]
+                out = bytearray(len(encrypted))
+                view = AESCipher(KEY).decrypt_from(stored, out)
+                self.assertIs(view.obj, out)
+                self.assertEqual(bytes(view), data)
+
+    def test_decrypt_from_undersized_buffer(self):
+        for mode in self.MODES:
+            with self.subTest(mode=mode):
+                encrypted = AESCipher(KEY, mode, compression='', kdf='').encrypt_bytes(bytes(100))
+                with self.assertRaisesMessage(Exception, "Buffer de sortie trop petit"):
+                    AESCipher(KEY).decrypt_from(encrypted, bytearray(50))
+
+    def test_decrypt_from_compressed_envelope_uses_a_new_buffer(self):
+        encrypted = AESCipher(KEY, 'GCM', compression='zlib', kdf='').encrypt_bytes(PLAINTEXT)
+        out = bytearray(len(encrypted))
+        view = AESCipher(KEY).decrypt_from(encrypted, out)
+        self.assertIsNot(view.obj, out)
+        self.assertEqual(bytes(view), PLAINTEXT.encode())
+
+    def test_large_ctr_buffer_is_processed_in_segments(self):
+        data = os.urandom(2 * 1024 * 1024 + 5)
+        cipher = AESCipher(KEY, 'CTR', compression='', kdf='')
+        out = bytearray(cipher.encrypted_size(len(data)))
+        encrypted = cipher.encrypt_into(data, out)
+        plain = bytearray(len(data))
+        self.assertEqual(AESCipher(KEY).decrypt_from(encrypted, plain).obj, plain)
+        self.assertEqual(plain, data)
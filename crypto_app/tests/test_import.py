@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from crypto_app.accounting import reconcile_storage
+from crypto_app.models import EncryptedMessage, KeyUsage
+
+
+class ImportMessagesCommandTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_messages', path, stdout=stdout, stderr=stderr, executor='serial', **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def assertImported(self, expected):
+        """`expected` : (utilisateur, texte, clé) des messages importés, déchiffrables"""
+        messages = EncryptedMessage.objects.order_by('pk')
+        self.assertEqual(
+            [(m.user.username if m.user else None, m.original_text, m.encryption_key) for m in messages], expected
+        )
+        for message in messages:
+            self.assertEqual(message.get_decrypted_text(), message.original_text)
+
+    def test_json_array(self):
+        path = self.write('messages.json', json.dumps([
+            {'original_text': 'bonjour', 'user': 'alice'},
+            {'text': 'été', 'key': 'alpha', 'user': 'bob'},
+            {'original_text': 'anonyme'},
+        ]))
+        output, _ = self.run_import(path, batch_size=2)
+        self.assertIn("3 messages importés, 0 rejetés", output)
+        self.assertImported([('alice', 'bonjour', ''), ('bob', 'été', 'alpha'), (None, 'anonyme', '')])
+        self.assertEqual(list(KeyUsage.objects.values_list('user__username', 'message_count')), [('bob', 1)])
+        self.assertEqual(reconcile_storage(), [])
+
+    def test_ndjson(self):
+        path = self.write('messages.ndjson', '{"original_text": "un"}\n\n{"original_text": "deux", "user": "alice"}\n')
+        output, _ = self.run_import(path)
+        self.assertIn("2 messages importés", output)
+        self.assertImported([(None, 'un', ''), ('alice', 'deux', '')])
+
+    def test_format_option_overrides_extension(self):
+        path = self.write('messages.txt', '[{"original_text": "un"}]')
+        self.run_import(path, format='json')
+        self.assertImported([(None, 'un', '')])
+
+    def test_user_option_owns_every_message(self):
+        path = self.write('messages.json', '[{"original_text": "un", "user": "bob"}, {"original_text": "deux"}]')
+        self.run_import(path, user='alice')
+        self.assertImported([('alice', 'un', ''), ('alice', 'deux', '')])
+
+    def test_unknown_user_option(self):
+        path = self.write('messages.json', '[]')
+        with self.assertRaisesMessage(CommandError, "Utilisateur introuvable: carol"):
+            self.run_import(path, user='carol')
+
+    def test_rejected_records_are_reported(self):
+        path = self.write('messages.json', json.dumps([
+            {'original_text': 'un'}, {'original_text': ''}, 'pas un objet', {'text': 42}, {'original_text': 'deux'},
+        ]))
+        output, errors = self.run_import(path, batch_size=2, transaction_size=2)
+        self.assertIn("2 messages importés, 3 rejetés", output)
+        for position in (1, 2, 3):
+            self.assertIn(f"Enregistrement {position} rejeté: Champ 'original_text' manquant", errors)
+        self.assertImported([(None, 'un', ''), (None, 'deux', '')])
+
+    def test_invalid_file(self):
+        for name, content in (('virgule.json', '[{"original_text": "un"},]'),
+                              ('objet.json', '{"original_text": "un"}'),
+                              ('tronque.json', '[{"original_text": "un"}'),
+                              ('ligne.ndjson', '{"original_text": "un"}\n{oups\n')):
+            with self.subTest(name=name):
+                with self.assertRaisesMessage(CommandError, "Fichier invalide"):
+                    self.run_import(self.write(name, content))
@@ -0,0 +1,146 @@
+import base64
+import importlib
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from crypto_app.models import EncryptedMessage
+from crypto_app.utils.crypto import AESCipher, encrypt_text
+
+conversion = importlib.import_module('crypto_app.migrations.0003_convert_encrypted_text_to_binary')
+
+BEFORE = [('crypto_app', '0002_encryptedmessage_encrypted_data')]
+AFTER = [('crypto_app', '0003_convert_encrypted_text_to_binary')]
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Base remise à la dernière migration après chaque test"""
+
+    def setUp(self):
+        self.latest = MigrationExecutor(connection).loader.graph.leaf_nodes('crypto_app')
+
+    def tearDown(self):
+        self.migrate(self.latest)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+
+class BinaryStorageMigrationTests(MigrationTestCase):
+    """Conversion base64 -> BinaryField (0003) sur une base existante, puis retour"""
+
+    def setUp(self):
+        super().setUp()
+        self.migrate(BEFORE)
+        self.batch_size = conversion.BATCH_SIZE
+        # Plusieurs lots même avec peu de lignes
+        conversion.BATCH_SIZE = 2
+
+    def tearDown(self):
+        conversion.BATCH_SIZE = self.batch_size
+        super().tearDown()
+
+    def create_messages(self, apps):
+        User = apps.get_model('auth', 'User')
+        Message = apps.get_model('crypto_app', 'EncryptedMessage')
+        user = User.objects.create(username='alice')
+        rows = [
+            ('clé du serveur', '', encrypt_text('clé du serveur')),
+            ('clé personnalisée', 'alpha', encrypt_text('clé personnalisée', 'alpha')),
+            ('ancien format', 'beta', AESCipher('beta', 'LEGACY').encrypt('ancien format')),
+            ('troisième lot', '', encrypt_text('troisième lot')),
+            ('anonymisé', '', '[anonymisé]'),
+        ]
+        for text, key, encrypted in rows:
+            Message.objects.create(user=user, original_text=text, encryption_key=key, encrypted_text=encrypted)
+        return {text: encrypted for text, _, encrypted in rows}
+
+    def test_forward_converts_existing_rows(self):
+        encrypted = self.create_messages(self.migrate(BEFORE))
+        apps = self.migrate(AFTER)
+
+        for message in apps.get_model('crypto_app', 'EncryptedMessage').objects.all():
+            if message.original_text == 'anonymisé':
+                # Texte non base64 laissé tel quel
+                self.assertIsNone(message.encrypted_data)
+                self.assertEqual(message.encrypted_text, '[anonymisé]')
+                continue
+            self.assertEqual(message.encrypted_text, '')
+            self.assertEqual(bytes(message.encrypted_data), base64.b64decode(encrypted[message.original_text]))
+
+    def test_converted_rows_stay_decryptable(self):
+        self.create_messages(self.migrate(BEFORE))
+        self.migrate(self.latest)
+
+        messages = EncryptedMessage.objects.exclude(original_text='anonymisé')
+        self.assertEqual(messages.count(), 4)
+        for message in messages:
+            self.assertIsNotNone(message.encrypted_data)
+            self.assertEqual(message.get_decrypted_text(), message.original_text)
+
+    def test_reverse_restores_base64(self):
+        encrypted = self.create_messages(self.migrate(BEFORE))
+        self.migrate(AFTER)
+        apps = self.migrate(BEFORE)
+
+        for message in apps.get_model('crypto_app', 'EncryptedMessage').objects.all():
+            self.assertIsNone(message.encrypted_data)
+            self.assertEqual(message.encrypted_text, encrypted.get(message.original_text, '[anonymisé]'))
+
+
+class OriginalLengthMigrationTests(MigrationTestCase):
+    """Taille du texte original recalculée en octets (0012), avec le volume par utilisateur"""
+
+    def test_lengths_and_bytes_used_are_recomputed(self):
+        apps = self.migrate([('crypto_app', '0011_message_stats_signed_counters')])
+        User = apps.get_model('auth', 'User')
+        Message = apps.get_model('crypto_app', 'EncryptedMessage')
+        UserProfile = apps.get_model('crypto_app', 'UserProfile')
+        alice, bob = User.objects.create(username='alice'), User.objects.create(username='bob')
+        for user, text in ((alice, 'ascii'), (alice, 'éèà'), (bob, '日本語')):
+            # Taille en caractères, comme avant la migration
+            Message.objects.create(user=user, original_text=text, encrypted_text='x' * 10,
+                                   original_length=len(text), encrypted_length=10)
+        UserProfile.objects.create(user=alice, bytes_used=28)
+
+        apps = self.migrate([('crypto_app', '0012_message_original_length_bytes')])
+        Message = apps.get_model('crypto_app', 'EncryptedMessage')
+        UserProfile = apps.get_model('crypto_app', 'UserProfile')
+        self.assertEqual(
+            dict(Message.objects.values_list('original_text', 'original_length')),
+            {'ascii': 5, 'éèà': 6, '日本語': 9},
+        )
+        self.assertEqual(
+            dict(UserProfile.objects.values_list('user__username', 'bytes_used')),
+            {'alice': 31, 'bob': 19},
+        )
+
+
+class KeyUsageMigrationTests(MigrationTestCase):
+    """Utilisations de clés rattachées au registre par identifiant (0013), puis retour aux empreintes"""
+
+    def test_usages_are_keyed_by_registry_id(self):
+        apps = self.migrate([('crypto_app', '0012_message_original_length_bytes')])
+        User = apps.get_model('auth', 'User')
+        Key = apps.get_model('crypto_app', 'EncryptionKey')
+        Message = apps.get_model('crypto_app', 'EncryptedMessage')
+        KeyUsage = apps.get_model('crypto_app', 'KeyUsage')
+        alice = User.objects.create(username='alice')
+        alpha = Key.objects.create(fingerprint='a' * 64, secret='alpha')
+        beta = Key.objects.create(fingerprint='b' * 64, secret='beta')
+        for key in (alpha, alpha, beta, None):
+            Message.objects.create(user=alice, original_text='texte', encrypted_text='x', key=key)
+        KeyUsage.objects.create(user=alice, key_fingerprint='a' * 64, message_count=2)
+        KeyUsage.objects.create(user=alice, key_fingerprint='b' * 64, message_count=1)
+
+        apps = self.migrate([('crypto_app', '0013_key_usage_key')])
+        usages = apps.get_model('crypto_app', 'KeyUsage').objects.values_list('key_id', 'message_count')
+        self.assertEqual(sorted(usages), [(alpha.pk, 2), (beta.pk, 1)])
+
+        apps = self.migrate([('crypto_app', '0012_message_original_length_bytes')])
+        usages = apps.get_model('crypto_app', 'KeyUsage').objects.values_list('key_fingerprint', 'message_count')
+        self.assertEqual(sorted(usages), [('a' * 64, 2), ('b' * 64, 1)])
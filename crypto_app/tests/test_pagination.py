@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from crypto_app.models import EncryptedMessage
+from crypto_app.pagination import KeysetPaginator
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('alice', password='pw')
+        now = timezone.now()
+        # 7 messages dont 3 créés au même instant : l'id départage
+        dates = [now, now - timedelta(minutes=1), now - timedelta(minutes=1), now - timedelta(minutes=1),
+                 now - timedelta(minutes=2), now - timedelta(minutes=3), now - timedelta(minutes=4)]
+        for index, created_at in enumerate(dates):
+            message = EncryptedMessage(user=user, original_text=f"message {index}")
+            message.save()
+            EncryptedMessage.objects.filter(pk=message.pk).update(created_at=created_at)
+        self.expected = list(EncryptedMessage.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(EncryptedMessage.objects.all(), 3)
+
+    def pks(self, page):
+        return [message.pk for message in page]
+
+    def test_first_page(self):
+        page = self.paginator.get_page()
+        self.assertEqual(self.pks(page), self.expected[:3])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+        self.assertIsNone(page.previous_cursor)
+
+    def test_after_cursors_walk_every_message_once(self):
+        seen, page = [], self.paginator.get_page()
+        while True:
+            seen += self.pks(page)
+            if not page.has_next():
+                break
+            page = self.paginator.get_page(after=page.next_cursor)
+        # Égalités sur created_at : aucun message sauté ni répété entre deux pages
+        self.assertEqual(seen, self.expected)
+
+    def test_last_page(self):
+        page = self.paginator.get_page(after=self.paginator.get_page(after=self.paginator.get_page().next_cursor).next_cursor)
+        self.assertEqual(self.pks(page), self.expected[6:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+        self.assertIsNone(page.next_cursor)
+
+    def test_before_cursor(self):
+        second = self.paginator.get_page(after=self.paginator.get_page().next_cursor)
+        third = self.paginator.get_page(after=second.next_cursor)
+        page = self.paginator.get_page(before=third.previous_cursor)
+        self.assertEqual(self.pks(page), self.pks(second))
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_before_cursor_near_the_top_returns_the_full_first_page(self):
+        page = self.paginator.get_page(before=self.paginator.encode_cursor(EncryptedMessage.objects.get(pk=self.expected[1])))
+        self.assertEqual(self.pks(page), self.expected[:3])
+        self.assertFalse(page.has_previous())
+
+    def test_malformed_cursors_give_the_first_page(self):
+        for cursor in ('!!!', 'abc', self.paginator.encode_cursor(EncryptedMessage.objects.first())[:-4] + 'AAAA', 'fA'):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(self.paginator.decode_cursor(cursor))
+                self.assertEqual(self.pks(self.paginator.get_page(after=cursor)), self.expected[:3])
+                self.assertEqual(self.pks(self.paginator.get_page(before=cursor)), self.expected[:3])
@@ -0,0 +1,95 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from crypto_app.models import KEY_REGISTRY_CACHE_SIZE, EncryptedMessage, EncryptionKey, _secrets_by_id
+
+
+class EncryptionKeyRegistryTests(TestCase):
+    def setUp(self):
+        EncryptionKey.objects.clear_cache()
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def test_for_secret_registers_each_key_once(self):
+        first = EncryptionKey.objects.for_secret('alpha')
+        second = EncryptionKey.objects.for_secret('alpha')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(first.fingerprint, EncryptionKey.fingerprint_for('alpha'))
+        self.assertEqual(EncryptionKey.objects.count(), 1)
+
+    def test_messages_share_the_registry_entry(self):
+        for text in ('un', 'deux'):
+            EncryptedMessage(user=self.user, original_text=text, key=EncryptionKey.objects.for_secret('alpha')).save()
+        self.assertEqual(EncryptionKey.objects.count(), 1)
+        message = EncryptedMessage.objects.get(original_text='deux')
+        self.assertEqual(message.encryption_key, 'alpha')
+        self.assertEqual(message.get_decrypted_text(), 'deux')
+
+    def test_encryption_key_is_read_only(self):
+        message = EncryptedMessage(user=self.user, original_text='un')
+        # Pas d'écriture cachée dans le registre lors d'une affectation
+        with self.assertRaises(AttributeError):
+            message.encryption_key = 'alpha'
+        self.assertEqual(EncryptionKey.objects.count(), 0)
+
+    def test_server_key_messages_have_no_entry(self):
+        message = EncryptedMessage(user=self.user, original_text='serveur')
+        message.save()
+        self.assertIsNone(message.key_id)
+        self.assertEqual(message.encryption_key, '')
+        self.assertEqual(EncryptedMessage.objects.get(pk=message.pk).get_decrypted_text(), 'serveur')
+
+    def test_rolled_back_entry_does_not_shadow_reused_id(self):
+        """Une entrée lue dans une transaction annulée ne reste pas en cache : SQLite réattribue son id"""
+        with transaction.atomic():
+            alpha = EncryptedMessage(user=self.user, original_text='annulé', key=EncryptionKey.objects.for_secret('alpha'))
+            alpha.save()
+            self.assertEqual(EncryptionKey.objects.secret_of(alpha.key_id), 'alpha')
+            transaction.set_rollback(True)
+
+        beta = EncryptedMessage(user=self.user, original_text='conservé', key=EncryptionKey.objects.for_secret('beta'))
+        beta.save()
+        self.assertEqual(beta.key_id, alpha.key_id)
+        beta = EncryptedMessage.objects.get(pk=beta.pk)
+        self.assertEqual(beta.encryption_key, 'beta')
+        self.assertEqual(beta.get_decrypted_text(), 'conservé')
+
+
+class EncryptionKeyRegistryCacheTests(TransactionTestCase):
+    def setUp(self):
+        EncryptionKey.objects.clear_cache()
+
+    def tearDown(self):
+        # Les tables sont vidées entre les tests : les entrées en cache n'existent plus
+        EncryptionKey.objects.clear_cache()
+
+    def test_entries_are_cached_after_commit(self):
+        with transaction.atomic():
+            entry = EncryptionKey.objects.for_secret('alpha')
+            self.assertEqual(EncryptionKey.objects.secret_of(entry.pk), 'alpha')
+            self.assertIsNone(_secrets_by_id.get(entry.pk))
+        self.assertEqual(_secrets_by_id.get(entry.pk), 'alpha')
+        with self.assertNumQueries(0):
+            self.assertEqual(EncryptionKey.objects.for_secret('alpha').pk, entry.pk)
+            self.assertEqual(EncryptionKey.objects.secret_of(entry.pk), 'alpha')
+
+    def test_rolled_back_entries_are_not_cached(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                alpha = EncryptionKey.objects.for_secret('alpha')
+                EncryptionKey.objects.secret_of(alpha.pk)
+                raise RuntimeError
+        self.assertIsNone(_secrets_by_id.get(alpha.pk))
+
+        beta = EncryptionKey.objects.for_secret('beta')
+        self.assertEqual(beta.pk, alpha.pk)
+        self.assertEqual(EncryptionKey.objects.secret_of(beta.pk), 'beta')
+
+    def test_cache_is_bounded(self):
+        EncryptionKey.objects.bulk_create([
+            EncryptionKey(fingerprint=EncryptionKey.fingerprint_for(f'cle-{i}'), secret=f'cle-{i}')
+            for i in range(KEY_REGISTRY_CACHE_SIZE + 10)
+        ])
+        for pk in EncryptionKey.objects.values_list('pk', flat=True):
+            EncryptionKey.objects.secret_of(pk)
+        self.assertEqual(_secrets_by_id.stats()['size'], KEY_REGISTRY_CACHE_SIZE)
@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from crypto_app.accounting import rebuild, reconcile_storage
+from crypto_app.models import EncryptedMessage, UserProfile
+from crypto_app.retention import delete_in_chunks, retention_segments
+
+from .test_rotation import Interrupted, InterruptingStream
+
+RETENTION_DAYS = {'free': 30, 'premium': 365, 'enterprise': None}
+
+
+@override_settings(CRYPTO_RETENTION_DAYS=RETENTION_DAYS)
+class PurgeMessagesTests(TestCase):
+    def setUp(self):
+        self.free = User.objects.create_user('free', password='pw')
+        self.premium = User.objects.create_user('premium', password='pw')
+        self.enterprise = User.objects.create_user('enterprise', password='pw')
+        # Sans profil : formule par défaut (gratuite)
+        self.unprofiled = User.objects.create_user('sansprofil', password='pw')
+        UserProfile.objects.create(user=self.free, tier='free')
+        UserProfile.objects.create(user=self.premium, tier='premium')
+        UserProfile.objects.create(user=self.enterprise, tier='enterprise')
+        self.messages = {}
+        for user in (self.free, self.premium, self.enterprise, self.unprofiled, None):
+            for days in (10, 60, 400):
+                self.messages[(user.username if user else 'anonyme', days)] = self.create(user, days)
+        rebuild()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'purge.json')
+
+    def create(self, user, days):
+        message = EncryptedMessage(user=user, original_text=f"message de {days} jours")
+        message.save()
+        EncryptedMessage.objects.filter(pk=message.pk).update(created_at=timezone.now() - timedelta(days=days))
+        return message
+
+    def purge(self, stderr=None, **options):
+        stdout = io.StringIO()
+        call_command('purge_messages', stdout=stdout, stderr=stderr or io.StringIO(), **options)
+        return stdout.getvalue()
+
+    def remaining(self):
+        pks = set(EncryptedMessage.objects.values_list('pk', flat=True))
+        return sorted(key for key, message in self.messages.items() if message.pk in pks)
+
+    def test_segments_without_tiers(self):
+        segments = retention_segments(90)
+        self.assertEqual([name for name, _ in segments], ['tous'])
+        self.assertEqual(segments[0][1].count(), 5)
+
+    def test_segments_by_tier(self):
+        segments = dict(retention_segments(90, use_tiers=True))
+        # Conservation illimitée : pas de segment « enterprise »
+        self.assertEqual(list(segments), ['free', 'premium', 'anonymes'])
+        self.assertEqual(
+            {(message.user.username, message.original_text) for message in segments['free']},
+            {(username, f"message de {days} jours") for username in ('free', 'sansprofil') for days in (60, 400)},
+        )
+        self.assertEqual([message.user for message in segments['premium']], [self.premium])
+        self.assertEqual(segments['anonymes'].count(), 1)
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.purge(older_than=90, by_tier=True, dry_run=True)
+        self.assertIn("free: 4 messages à supprimer", output)
+        self.assertIn("premium: 1 messages à supprimer", output)
+        self.assertIn("anonymes: 1 messages à supprimer", output)
+        self.assertIn("Simulation : 6 messages seraient supprimés", output)
+        self.assertEqual(EncryptedMessage.objects.count(), 15)
+
+    def test_purge_by_tier(self):
+        self.purge(older_than=90, by_tier=True, batch_size=2)
+        self.assertEqual(self.remaining(), [
+            ('anonyme', 10), ('anonyme', 60), ('enterprise', 10), ('enterprise', 60), ('enterprise', 400),
+            ('free', 10), ('premium', 10), ('premium', 60), ('sansprofil', 10),
+        ])
+        self.assertEqual(reconcile_storage(), [])
+
+    def test_interrupted_purge_resumes_from_checkpoint(self):
+        with self.assertRaises(Interrupted):
+            self.purge(older_than=30, batch_size=2, checkpoint=self.checkpoint, stderr=InterruptingStream())
+        with open(self.checkpoint, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        self.assertEqual((checkpoint['older_than'], checkpoint['by_tier']), (30, False))
+        self.assertEqual(EncryptedMessage.objects.count(), 13)
+
+        output = self.purge(older_than=30, batch_size=2, checkpoint=self.checkpoint)
+        self.assertIn("tous: 8 messages supprimés", output)
+        self.assertEqual(EncryptedMessage.objects.count(), 5)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_checkpoint_for_other_options_is_refused(self):
+        with self.assertRaises(Interrupted):
+            self.purge(older_than=30, batch_size=2, checkpoint=self.checkpoint, stderr=InterruptingStream())
+        for options in ({'older_than': 90}, {'older_than': 30, 'by_tier': True}):
+            with self.subTest(**options):
+                with self.assertRaisesMessage(CommandError, "d'autres options de conservation"):
+                    self.purge(checkpoint=self.checkpoint, **options)
+        self.assertEqual(EncryptedMessage.objects.count(), 13)
+
+    def test_delete_in_chunks_starts_after_a_key(self):
+        old = EncryptedMessage.objects.filter(created_at__lt=timezone.now() - timedelta(days=30)).order_by('pk')
+        pks = list(old.values_list('pk', flat=True))
+        progress = []
+        deleted = delete_in_chunks(old, chunk_size=3, start_after=pks[3],
+                                   progress=lambda count, last_pk: progress.append((count, last_pk)))
+        self.assertEqual(deleted, len(pks) - 4)
+        self.assertEqual(progress[-1], (deleted, pks[-1]))
+        self.assertEqual(list(old.values_list('pk', flat=True)), pks[:4])
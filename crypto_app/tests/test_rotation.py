@@ -0,0 +1,130 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from crypto_app.accounting import rebuild
+from crypto_app.models import EncryptedMessage, EncryptionKey, KeyUsage
+from crypto_app.utils.crypto import AESCipher
+
+NEW_KEY = 'nouvelle-cle-du-serveur-32-octets'
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingStream(io.StringIO):
+    """Sortie d'erreur qui interrompt la commande au premier compte rendu de lot (après le point de reprise)"""
+
+    def write(self, text):
+        raise Interrupted
+
+
+class RotateKeysTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.server_messages = [self.create(f"serveur {i}") for i in range(5)]
+        self.custom_messages = [self.create(f"perso {i}", key='alpha') for i in range(3)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'rotation.json')
+
+    def create(self, text, key=''):
+        message = EncryptedMessage(user=self.user, original_text=text, key=EncryptionKey.objects.for_secret(key) if key else None)
+        message.save()
+        return message
+
+    def rotate(self, *args, stderr=None, **options):
+        stdout = io.StringIO()
+        call_command('rotate_keys', *args, stdout=stdout, stderr=stderr or io.StringIO(), **options)
+        return stdout.getvalue()
+
+    def assertRotated(self, messages, key=None):
+        """Messages déchiffrables avec `key` (None : nouvelle clé du serveur) et plus avec l'ancienne"""
+        cipher = AESCipher(key or NEW_KEY)
+        for message in EncryptedMessage.objects.filter(pk__in=[message.pk for message in messages]):
+            self.assertEqual(cipher.decrypt_bytes(message.ciphertext).decode(), message.original_text)
+
+    def assertNotRotated(self, messages):
+        for message in EncryptedMessage.objects.filter(pk__in=[message.pk for message in messages]):
+            self.assertEqual(message.get_decrypted_text(), message.original_text)
+
+    def test_server_key_rotation(self):
+        output = self.rotate(new_key=NEW_KEY, batch_size=2)
+        self.assertIn("5 messages rechiffrés, 0 ignorés, 0 en échec", output)
+        self.assertRotated(self.server_messages)
+        # Messages à clé personnalisée hors du périmètre
+        self.assertNotRotated(self.custom_messages)
+        with override_settings(AES_SECRET_KEY=NEW_KEY):
+            for message in EncryptedMessage.objects.filter(key__isnull=True):
+                self.assertEqual(message.get_decrypted_text(), message.original_text)
+
+    def test_custom_key_rotation(self):
+        output = self.rotate('--custom', old_key='alpha', new_key='beta')
+        self.assertIn("3 messages rechiffrés", output)
+        self.assertRotated(self.custom_messages, 'beta')
+        for message in EncryptedMessage.objects.filter(pk__in=[m.pk for m in self.custom_messages]):
+            self.assertEqual(message.encryption_key, 'beta')
+            self.assertEqual(message.get_decrypted_text(), message.original_text)
+        self.assertNotRotated(self.server_messages)
+        # Utilisation des clés tenue à jour par la rotation
+        usages = sorted(KeyUsage.objects.values_list('key_id', 'message_count'))
+        rebuild()
+        self.assertEqual(sorted(KeyUsage.objects.values_list('key_id', 'message_count')), usages)
+
+    def test_second_run_is_a_no_op(self):
+        self.rotate(new_key=NEW_KEY)
+        rotated = {m.pk: bytes(m.encrypted_data) for m in EncryptedMessage.objects.filter(key__isnull=True)}
+        output = self.rotate(new_key=NEW_KEY)
+        self.assertIn("0 messages rechiffrés, 5 ignorés, 0 en échec", output)
+        self.assertEqual(
+            {m.pk: bytes(m.encrypted_data) for m in EncryptedMessage.objects.filter(key__isnull=True)}, rotated
+        )
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        with self.assertRaises(Interrupted):
+            self.rotate(new_key=NEW_KEY, batch_size=2, checkpoint=self.checkpoint, stderr=InterruptingStream())
+
+        # Premier lot validé et enregistré dans le fichier de reprise, le reste intact
+        with open(self.checkpoint, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        self.assertEqual(checkpoint['last_pk'], self.server_messages[1].pk)
+        self.assertRotated(self.server_messages[:2])
+        self.assertNotRotated(self.server_messages[2:])
+
+        output = self.rotate(new_key=NEW_KEY, batch_size=2, checkpoint=self.checkpoint)
+        self.assertIn(f"3 messages à traiter (reprise après la clé {self.server_messages[1].pk})", output)
+        self.assertIn("3 messages rechiffrés, 0 ignorés", output)
+        self.assertRotated(self.server_messages)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_interrupted_run_resumes_without_checkpoint(self):
+        with self.assertRaises(Interrupted):
+            self.rotate(new_key=NEW_KEY, batch_size=2, stderr=InterruptingStream())
+        output = self.rotate(new_key=NEW_KEY, batch_size=2)
+        # Messages déjà rechiffrés reconnus à l'identifiant de clé de l'enveloppe
+        self.assertIn("3 messages rechiffrés, 2 ignorés, 0 en échec", output)
+        self.assertRotated(self.server_messages)
+
+    def test_checkpoint_for_other_keys_is_refused(self):
+        with self.assertRaises(Interrupted):
+            self.rotate(new_key=NEW_KEY, batch_size=2, checkpoint=self.checkpoint, stderr=InterruptingStream())
+        with self.assertRaisesMessage(CommandError, "d'autres clés"):
+            self.rotate(new_key='une-autre-cle', checkpoint=self.checkpoint)
+
+    def test_undecryptable_messages_are_reported_and_left_intact(self):
+        broken = self.server_messages[2]
+        EncryptedMessage.objects.filter(pk=broken.pk).update(
+            encrypted_data=AESCipher('inconnue', kdf='').encrypt_bytes(broken.original_text)
+        )
+        before = bytes(EncryptedMessage.objects.get(pk=broken.pk).encrypted_data)
+        stderr = io.StringIO()
+        output = self.rotate(new_key=NEW_KEY, stderr=stderr)
+        self.assertIn("4 messages rechiffrés, 0 ignorés, 1 en échec", output)
+        self.assertIn(f"Message {broken.pk} non rechiffré", stderr.getvalue())
+        self.assertEqual(bytes(EncryptedMessage.objects.get(pk=broken.pk).encrypted_data), before)
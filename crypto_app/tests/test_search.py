@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from crypto_app import search
+from crypto_app.models import EncryptedMessage
+from crypto_app.search import fts_available, fts_query, search_messages
+
+
+class SearchTestMixin:
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.messages = {
+            text: self.create(text)
+            for text in ("Rendez-vous à la gare demain", "Réunion de l'été annulée", "NEAR la gare, OR ailleurs",
+                         "Code d'accès : 1234")
+        }
+
+    def create(self, text):
+        message = EncryptedMessage(user=self.user, original_text=text)
+        message.save()
+        return message
+
+    def found(self, terms):
+        return sorted(message.original_text for message in search_messages(EncryptedMessage.objects.all(), terms))
+
+
+class FullTextSearchTests(SearchTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.assertTrue(fts_available())
+
+    def test_all_words_match_by_prefix(self):
+        self.assertEqual(self.found("gare"), ["NEAR la gare, OR ailleurs", "Rendez-vous à la gare demain"])
+        self.assertEqual(self.found("gare dem"), ["Rendez-vous à la gare demain"])
+        self.assertEqual(self.found("gare inconnu"), [])
+
+    def test_case_and_accents_are_ignored(self):
+        self.assertEqual(self.found("REUNION ete"), ["Réunion de l'été annulée"])
+
+    def test_blank_query_returns_everything(self):
+        self.assertEqual(len(self.found("   ")), 4)
+
+    def test_query_without_words_matches_nothing(self):
+        self.assertEqual(fts_query('"*()-:'), '')
+        self.assertEqual(self.found('"*()-:'), [])
+
+    def test_fts_operators_are_searched_as_words(self):
+        self.assertEqual(fts_query('NEAR(gare) OR a*'), '"NEAR"* "gare"* "OR"* "a"*')
+        both = ["NEAR la gare, OR ailleurs", "Rendez-vous à la gare demain"]
+        cases = {
+            'NEAR(gare)': ["NEAR la gare, OR ailleurs"],
+            'gare OR ailleurs': ["NEAR la gare, OR ailleurs"],
+            'demain OR ailleurs': [],
+            '"gare': both,
+            'gare*': both,
+            '-gare': both,
+            'original_text:gare': [],
+            'gare AND NOT': [],
+        }
+        for terms, expected in cases.items():
+            with self.subTest(terms=terms):
+                # Sans échappement, MATCH lèverait une erreur de syntaxe ou changerait le sens de la requête
+                self.assertEqual(self.found(terms), expected)
+
+    def test_index_follows_updates(self):
+        message = self.messages["Code d'accès : 1234"]
+        message.original_text = "Nouveau code : 5678"
+        message.save()
+        self.assertEqual(self.found("1234"), [])
+        self.assertEqual(self.found("5678"), ["Nouveau code : 5678"])
+
+        # Écriture hors de save() : l'index est tenu par les triggers
+        EncryptedMessage.objects.filter(pk=message.pk).update(original_text="Code périmé")
+        self.assertEqual(self.found("5678"), [])
+        self.assertEqual(self.found("perime"), ["Code périmé"])
+
+    def test_index_follows_deletes(self):
+        self.messages["Rendez-vous à la gare demain"].delete()
+        self.assertEqual(self.found("gare"), ["NEAR la gare, OR ailleurs"])
+        EncryptedMessage.objects.filter(original_text__startswith="NEAR").delete()
+        self.assertEqual(self.found("gare"), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH %s", ['"gare"'])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class LikeFallbackSearchTests(SearchTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(search._fts_available, {'default': False})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_all_words_are_required(self):
+        self.assertEqual(self.found("gare"), ["NEAR la gare, OR ailleurs", "Rendez-vous à la gare demain"])
+        self.assertEqual(self.found("GARE demain"), ["Rendez-vous à la gare demain"])
+        self.assertEqual(self.found("gare inconnu"), [])
+
+    def test_fts_syntax_is_plain_text(self):
+        self.assertEqual(self.found("gare, OR"), ["NEAR la gare, OR ailleurs"])
+        self.assertEqual(self.found("accès :"), ["Code d'accès : 1234"])
+
+    def test_blank_query_returns_everything(self):
+        self.assertEqual(len(self.found("")), 4)
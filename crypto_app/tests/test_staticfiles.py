@@ -0,0 +1,143 @@
+import gzip
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.files.storage import FileSystemStorage
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.staticfiles import (
+    IMMUTABLE_MAX_AGE, CompressedManifestStaticFilesStorage, serve_static, write_gzip_variant,
+)
+
+CSS = ('body { color: #333; margin: 0; }\n' * 40).encode()
+
+
+class StaticFilesTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings = override_settings(STATIC_ROOT=str(self.root), STATIC_MAX_AGE=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, name, data):
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+    def get(self, path, **headers):
+        return serve_static(RequestFactory().get(f'/static/{path}', headers=headers), path)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+
+class ServeStaticTests(StaticFilesTestCase):
+    def test_gzip_variant_is_served_when_accepted(self):
+        write_gzip_variant(self.write('css/app.css', CSS))
+        response = self.get('css/app.css', accept_encoding='br, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(self.content(response)), CSS)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_plain_file_without_gzip_support(self):
+        write_gzip_variant(self.write('css/app.css', CSS))
+        for headers in ({}, {'accept_encoding': 'br, identity'}):
+            with self.subTest(**headers):
+                response = self.get('css/app.css', **headers)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(self.content(response), CSS)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_plain_file_without_variant(self):
+        self.write('img/logo.png', b'\x89PNG' + os.urandom(512))
+        response = self.get('img/logo.png', accept_encoding='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_each_variant_has_its_own_etag(self):
+        write_gzip_variant(self.write('css/app.css', CSS))
+        compressed, plain = self.get('css/app.css', accept_encoding='gzip'), self.get('css/app.css')
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertEqual(compressed['Last-Modified'], plain['Last-Modified'])
+
+    def test_conditional_request(self):
+        write_gzip_variant(self.write('css/app.css', CSS))
+        etag = self.get('css/app.css', accept_encoding='gzip')['ETag']
+        response = self.get('css/app.css', accept_encoding='gzip', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age=60', response['Cache-Control'])
+        # ETag de la variante gzip : la version non compressée est renvoyée en entier
+        self.assertEqual(self.get('css/app.css', if_none_match=etag).status_code, 200)
+
+    def test_cache_headers(self):
+        self.write('css/app.css', CSS)
+        self.write('css/app.0123456789ab.css', CSS)
+        response = self.get('css/app.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        response = self.get('css/app.0123456789ab.css')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')
+
+    def test_missing_or_unsafe_paths(self):
+        self.write('css/app.css', CSS)
+        for path in ('css/absent.css', 'css', '../outside.txt', 'css/../../outside.txt', '/etc/passwd'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    self.get(path)
+
+
+class GzipVariantTests(StaticFilesTestCase):
+    def test_variant_written_for_compressible_text(self):
+        path = self.write('css/app.css', CSS)
+        self.assertTrue(write_gzip_variant(path))
+        variant = path.with_name('app.css.gz')
+        self.assertEqual(gzip.decompress(variant.read_bytes()), CSS)
+        # mtime=0 : même variante d'un build à l'autre
+        data = variant.read_bytes()
+        write_gzip_variant(path)
+        self.assertEqual(variant.read_bytes(), data)
+
+    def test_no_variant_when_it_does_not_help(self):
+        for name, data in (('css/small.css', b'a{}'), ('img/logo.png', CSS), ('js/random.js', os.urandom(4096))):
+            with self.subTest(name=name):
+                self.assertFalse(write_gzip_variant(self.write(name, data)))
+                self.assertFalse((self.root / f'{name}.gz').exists())
+
+    def test_stale_variant_is_removed(self):
+        path = self.write('js/app.js', os.urandom(4096))
+        path.with_name('app.js.gz').write_bytes(b'ancienne variante')
+        self.assertFalse(write_gzip_variant(path))
+        self.assertFalse(path.with_name('app.js.gz').exists())
+
+
+class ManifestStorageTests(StaticFilesTestCase):
+    def test_collected_files_are_hashed_compressed_and_served(self):
+        source = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        Path(source.name, 'css').mkdir()
+        Path(source.name, 'css', 'app.css').write_bytes(CSS)
+
+        storage = CompressedManifestStaticFilesStorage(location=str(self.root), base_url='/static/')
+        storage.save('css/app.css', FileSystemStorage(location=source.name).open('css/app.css'))
+        list(storage.post_process({'css/app.css': (FileSystemStorage(location=source.name), 'css/app.css')}))
+
+        # Nom haché lu dans le manifeste (staticfiles.json), comme le fait {% static %}
+        hashed = CompressedManifestStaticFilesStorage(location=str(self.root), base_url='/static/').stored_name('css/app.css')
+        self.assertRegex(hashed, r'^css/app\.[0-9a-f]{12}\.css$')
+        self.assertTrue((self.root / f'{hashed}.gz').is_file())
+
+        response = self.get(hashed, accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(self.content(response)), CSS)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')
+
+    def test_unknown_name_is_not_in_the_manifest(self):
+        storage = CompressedManifestStaticFilesStorage(location=str(self.root), base_url='/static/')
+        with self.assertRaises(ValueError):
+            storage.stored_name('css/absent.css')
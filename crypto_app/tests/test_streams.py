@@ -0,0 +1,75 @@
+import io
+
+from django.test import SimpleTestCase
+
+from crypto_app.utils.streams import iter_json_array, iter_ndjson, json_array_lines
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    def parse(self, text, read_size=64):
+        return list(iter_json_array(io.StringIO(text), read_size=read_size))
+
+    def test_valid_arrays(self):
+        cases = {
+            '[]': [],
+            ' \n[ ]\n': [],
+            '[1, 2, 3]': [1, 2, 3],
+            '[{"text": "a"}, {"text": "b"}]': [{'text': 'a'}, {'text': 'b'}],
+            '[[1, [2]], {"a": {"b": null}}, true]': [[1, [2]], {'a': {'b': None}}, True],
+            '["a, b", "]", "[", "\\"]"]': ['a, b', ']', '[', '"]'],
+        }
+        for text, expected in cases.items():
+            for read_size in (1, 2, 3, 64):
+                with self.subTest(text=text, read_size=read_size):
+                    self.assertEqual(self.parse(text, read_size), expected)
+
+    def test_scalars_split_across_reads(self):
+        # Lecture caractère par caractère : `12` ne doit pas être lu `1` puis `2`
+        for read_size in (1, 2, 3):
+            with self.subTest(read_size=read_size):
+                self.assertEqual(self.parse('[12,345, -6.5e3 ,"long texte", 7890]', read_size),
+                                 [12, 345, -6500.0, 'long texte', 7890])
+
+    def test_round_trip_with_writer(self):
+        objects = [{'original_text': f"message {i}", 'user': None} for i in range(50)]
+        text = ''.join(json_array_lines(objects, indent=2))
+        self.assertEqual(self.parse(text, read_size=7), objects)
+
+    def test_stray_commas_are_rejected(self):
+        for text in ('[,1]', '[1,,2]', '[1,]', '[,]', '[1, 2,]'):
+            for read_size in (1, 64):
+                with self.subTest(text=text, read_size=read_size):
+                    with self.assertRaises(ValueError):
+                        self.parse(text, read_size)
+
+    def test_missing_separator_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, "',' ou ']' attendu"):
+            self.parse('[1 2]')
+
+    def test_non_array_input_is_rejected(self):
+        for text in ('{"a": 1}', '1', '"[1]"', ''):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    self.parse(text)
+
+    def test_truncated_input_is_rejected(self):
+        for text in ('[', '[1', '[1,', '[1, 2', '[{"a": 1}', '["abc'):
+            for read_size in (1, 64):
+                with self.subTest(text=text, read_size=read_size):
+                    with self.assertRaises(ValueError):
+                        self.parse(text, read_size)
+
+    def test_items_are_produced_lazily(self):
+        items = iter_json_array(io.StringIO('[1, 2, oups]'), read_size=1)
+        self.assertEqual([next(items), next(items)], [1, 2])
+        with self.assertRaises(ValueError):
+            next(items)
+
+
+class IterNdjsonTests(SimpleTestCase):
+    def test_blank_lines_are_skipped(self):
+        self.assertEqual(list(iter_ndjson(io.StringIO('{"a": 1}\n\n  \n[2]\n'))), [{'a': 1}, [2]])
+
+    def test_invalid_line(self):
+        with self.assertRaises(ValueError):
+            list(iter_ndjson(io.StringIO('{"a": 1}\n{oups\n')))
@@ -0,0 +1,141 @@
+import importlib
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+
+from core import urls as core_urls
+from crypto_app import urls, views
+from crypto_app.accounting import message_size
+from crypto_app.models import EncryptedMessage, EncryptionKey, UserProfile
+from crypto_app.utils.crypto import STREAM_CHUNK_SIZE, AESCipher
+
+
+class FileViewTests(TestCase):
+    url = reverse('crypto_app:file')
+    content = b'contenu du fichier ' * (STREAM_CHUNK_SIZE // 8)
+
+    def post(self, name, data, operation, key='cle-fichier'):
+        return self.client.post(self.url, {
+            'file': SimpleUploadedFile(name, data),
+            'operation': operation,
+            'key': key,
+        })
+
+    def encrypt(self, name='rapport.txt'):
+        response = self.post(name, self.content, 'encrypt')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_round_trip(self):
+        encrypted = self.encrypt()
+        response = self.post('rapport.txt.aes', encrypted, 'decrypt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rapport.txt"')
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_wrong_key_returns_the_form_not_a_download(self):
+        response = self.post('rapport.txt.aes', self.encrypt(), 'decrypt', key='autre-cle')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Disposition', response)
+        self.assertContains(response, 'clé incorrecte')
+
+    def test_tampered_file_is_rejected_before_sending(self):
+        encrypted = bytearray(self.encrypt())
+        # Dernier bloc de données modifié : le tag GCM n'est vérifié qu'en fin de fichier
+        encrypted[-20] ^= 0x01
+        response = self.post('rapport.txt.aes', bytes(encrypted), 'decrypt')
+        self.assertNotIn('Content-Disposition', response)
+        self.assertContains(response, 'Erreur lors du déchiffrement')
+
+    def test_filename_is_quoted_in_content_disposition(self):
+        response = self.post('rapport "final".txt', b'x', 'encrypt')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rapport \\"final\\".txt.aes"')
+        response = self.post('résumé.txt', b'x', 'encrypt')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''r%C3%A9sum%C3%A9.txt.aes")
+
+
+def reload_urls():
+    # Les résolveurs de core.urls gardent en cache les motifs inclus : recharger les deux
+    importlib.reload(urls)
+    importlib.reload(core_urls)
+    clear_url_caches()
+
+
+class AsyncViewsTests(TestCase):
+    """Vues async montées par CRYPTO_ASYNC_VIEWS, appelées via AsyncClient"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Le choix des vues est fait à l'import de crypto_app.urls
+        with override_settings(CRYPTO_ASYNC_VIEWS=True):
+            reload_urls()
+        cls.addClassCleanup(reload_urls)
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def test_async_views_are_mounted(self):
+        for name, view in (('encrypt', views.encrypt_view_async), ('decrypt', views.decrypt_view_async),
+                           ('messages', views.messages_view_async)):
+            with self.subTest(name=name):
+                self.assertIs(resolve(reverse(f'crypto_app:{name}')).func, view)
+
+    async def test_encrypt_anonymous(self):
+        response = await self.async_client.post(reverse('crypto_app:encrypt'), {'text': 'bonjour', 'custom_key': 'alpha'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AESCipher('alpha').decrypt(response.context['encrypted_text']), 'bonjour')
+        self.assertFalse(await EncryptedMessage.objects.aexists())
+
+    async def test_encrypt_stores_the_message(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('crypto_app:encrypt'), {'text': 'bonjour', 'custom_key': 'alpha'})
+        self.assertContains(response, "Texte chiffré avec succès")
+        message = await EncryptedMessage.objects.select_related('key').aget(user=self.user)
+        self.assertEqual(message.key, await EncryptionKey.objects.afor_secret('alpha'))
+        self.assertEqual(message.get_encrypted_text(), response.context['encrypted_text'])
+        self.assertEqual((await UserProfile.objects.aget(user=self.user)).bytes_used, message_size(message))
+
+    async def test_encrypt_beyond_the_quota_is_not_stored(self):
+        await UserProfile.objects.acreate(user=self.user, storage_limit=10)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('crypto_app:encrypt'), {'text': 'bonjour'})
+        self.assertContains(response, "Message non enregistré")
+        # Le texte chiffré est tout de même affiché
+        self.assertEqual(AESCipher().decrypt(response.context['encrypted_text']), 'bonjour')
+        self.assertFalse(await EncryptedMessage.objects.aexists())
+
+    async def test_decrypt(self):
+        encrypted = AESCipher('alpha').encrypt('bonjour')
+        response = await self.async_client.post(reverse('crypto_app:decrypt'),
+                                                {'encrypted_text': encrypted, 'decryption_key': 'alpha'})
+        self.assertEqual(response.context['decrypted_text'], 'bonjour')
+
+        response = await self.async_client.post(reverse('crypto_app:decrypt'),
+                                                {'encrypted_text': encrypted, 'decryption_key': 'beta'})
+        self.assertNotIn('decrypted_text', response.context)
+        self.assertContains(response, "clé incorrecte")
+
+    async def test_messages_requires_a_login(self):
+        response = await self.async_client.get(reverse('crypto_app:messages'))
+        self.assertRedirects(response, reverse('admin:login'), fetch_redirect_response=False)
+
+    async def test_messages_lists_and_searches_the_user_messages(self):
+        bob = await User.objects.acreate_user('bob', password='pw')
+        created = {}
+        for user, text in ((self.user, 'rendez-vous à la gare'), (self.user, 'liste de courses'), (bob, 'gare du nord')):
+            created[text] = EncryptedMessage(user=user, original_text=text)
+            await created[text].asave()
+        await self.async_client.aforce_login(self.user)
+
+        # Texte original différé dans la liste : comparaison par identifiant
+        response = await self.async_client.get(reverse('crypto_app:messages'))
+        self.assertEqual([m.pk for m in response.context['messages']],
+                         [created['liste de courses'].pk, created['rendez-vous à la gare'].pk])
+        self.assertEqual(response.context['total_messages'], 2)
+
+        response = await self.async_client.get(reverse('crypto_app:messages'), {'q': 'gare'})
+        self.assertEqual([m.pk for m in response.context['messages']], [created['rendez-vous à la gare'].pk])
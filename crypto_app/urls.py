@@ -1,11 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'crypto_app'
 
+# Sous ASGI, les vues async libèrent le worker pendant le chiffrement et l'ORM
+if getattr(settings, 'CRYPTO_ASYNC_VIEWS', False):
+    encrypt_view = views.encrypt_view_async
+    decrypt_view = views.decrypt_view_async
+    messages_view = views.messages_view_async
+else:
+    encrypt_view = views.encrypt_view
+    decrypt_view = views.decrypt_view
+    messages_view = views.messages_view
+
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
-    path('encrypt/', views.encrypt_view, name='encrypt'),
-    path('decrypt/', views.decrypt_view, name='decrypt'),
-    path('messages/', views.messages_view, name='messages'),
+    path('encrypt/', encrypt_view, name='encrypt'),
+    path('decrypt/', decrypt_view, name='decrypt'),
+    path('file/', views.file_view, name='file'),
+    path('messages/', messages_view, name='messages'),
+    path('messages/<int:pk>/encrypted/', views.message_ciphertext_view, name='message_ciphertext'),
+    path('api/encrypt/', api.api_encrypt, name='api_encrypt'),
+    path('api/decrypt/', api.api_decrypt, name='api_decrypt'),
+    path('api/write-queue/', api.api_write_queue, name='api_write_queue'),
 ]
\ No newline at end of file
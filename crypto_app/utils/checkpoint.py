@@ -0,0 +1,26 @@
+import json
+import os
+
+
+def load_checkpoint(path):
+    """Lit un fichier de reprise JSON ; {} si aucun chemin ou fichier absent (ValueError si illisible)"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """Écrit le fichier de reprise de façon atomique : un arrêt brutal ne laisse pas de fichier tronqué"""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(path):
+    """Supprime le fichier de reprise une fois le traitement terminé"""
+    if path and os.path.exists(path):
+        os.remove(path)
@@ -1,70 +1,841 @@
 import base64
+import copy
+import functools
+import hashlib
+import itertools
+import lzma
 import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from django.conf import settings
 
+# Taille des blocs lus pour le chiffrement en flux (64 Ko)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Nombre d'éléments envoyés à un worker en une fois par encrypt_many/decrypt_many
+BATCH_SIZE = 256
+
+# Résultat d'un élément traité par lot : `value` en cas de succès, sinon `error`
+BatchResult = namedtuple('BatchResult', ['value', 'error'])
+
+# Enveloppe versionnée : magic, version, mode, drapeaux, identifiant de clé.
+# Suivent le nonce (ou l'IV), les données chiffrées et, en GCM, le tag.
+# Sans cet en-tête, le format est l'ancien « IV + données CBC » (mode LEGACY).
+ENVELOPE_MAGIC = b'\xae\x5c'
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct('>2sBBB4s')
+MODES = {'CBC': 1, 'CTR': 2, 'GCM': 3}
+MODE_NAMES = {value: name for name, value in MODES.items()}
+NONCE_SIZES = {'LEGACY': 16, 'CBC': 16, 'CTR': 8, 'GCM': 12}
+TAG_SIZE = 16
+
+# Drapeaux de l'enveloppe : compression appliquée avant chiffrement
+FLAG_ZLIB = 0x01
+FLAG_LZMA = 0x02
+COMPRESSION_FLAGS = {'zlib': FLAG_ZLIB, 'lzma': FLAG_LZMA}
+# Clé dérivée par KDF : l'en-tête est suivi de l'algorithme, du coût et du sel
+FLAG_SALT = 0x04
+KNOWN_FLAGS = FLAG_ZLIB | FLAG_LZMA | FLAG_SALT
+# En dessous de cette taille, la compression ne fait pas gagner de place
+COMPRESSION_MIN_SIZE = 128
+# Taille maximale du texte décompressé (CRYPTO_MAX_DECOMPRESSED_SIZE) : quelques Ko
+# d'enveloppe forgée ne doivent pas produire des Go en mémoire
+MAX_DECOMPRESSED_SIZE = 4 * 1024 * 1024
+
+# Au-delà de ce seuil, le mode CTR est traité par segments en parallèle
+PARALLEL_THRESHOLD = 4 * 1024 * 1024
+PARALLEL_SEGMENT_SIZE = 1024 * 1024
+
+# Clés préparées gardées en mémoire par processus (prepare_key)
+KEY_CACHE_SIZE = 256
+
+# Dérivation de clé (FLAG_SALT) : algorithme, coût en log2 (itérations PBKDF2 ou N de
+# scrypt) et sel, inscrits dans l'enveloppe pour que le coût puisse évoluer
+KDF_HEADER = struct.Struct('>BB16s')
+SALT_SIZE = 16
+KDFS = {'pbkdf2': 1, 'scrypt': 2}
+KDF_NAMES = {value: name for name, value in KDFS.items()}
+DEFAULT_KDF_COSTS = {'pbkdf2': 19, 'scrypt': 14}
+# Coût maximal configurable (CRYPTO_KDF_COST)
+MAX_KDF_COSTS = {'pbkdf2': 24, 'scrypt': 18}
+# Octets à lire pour reconnaître la clé d'une enveloppe (en-tête et paramètres KDF)
+ENVELOPE_PREFIX_SIZE = ENVELOPE_HEADER.size + KDF_HEADER.size
+
+
+def _iter_chunks(source, chunk_size):
+    """Parcourt une source (fichier, bytes ou itérable) par blocs de bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = [bytes(source)]
+    elif isinstance(source, str):
+        source = [source.encode('utf-8')]
+    elif hasattr(source, 'read'):
+        read = source.read
+        source = iter(lambda: read(chunk_size), b'')
+
+    for chunk in source:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield chunk
+
+
+def _unpad_view(view):
+    """Retire le padding PKCS7 d'une memoryview sans copier les données"""
+    if not view or len(view) % AES.block_size:
+        raise ValueError("Padding is incorrect.")
+    padding = view[-1]
+    if not 1 <= padding <= AES.block_size or view[-padding:] != bytes([padding]) * padding:
+        raise ValueError("Padding is incorrect.")
+    return view[:-padding]
+
+
+def _compress(algorithm, data):
+    if algorithm == 'zlib':
+        return zlib.compress(data, 6)
+    return lzma.compress(data, preset=6)
+
+
+def _decompressor(flags):
+    """Décompresseur incrémental correspondant aux drapeaux, ou None si non compressé"""
+    if flags & FLAG_ZLIB:
+        return zlib.decompressobj()
+    if flags & FLAG_LZMA:
+        return lzma.LZMADecompressor()
+    return None
+
+
+def _decompress_bounded(decompressor, data, remaining):
+    """Décompresse `data` sans produire plus de `remaining` octets (bombe de décompression)"""
+    try:
+        output = decompressor.decompress(data, remaining + 1)
+    except (zlib.error, lzma.LZMAError) as e:
+        raise Exception(f"Erreur lors du déchiffrement: {str(e)}")
+    if len(output) > remaining:
+        raise Exception("Erreur lors du déchiffrement: données décompressées trop volumineuses")
+    return output
+
+
+def max_decompressed_size():
+    return getattr(settings, 'CRYPTO_MAX_DECOMPRESSED_SIZE', MAX_DECOMPRESSED_SIZE)
+
+
+def key_fingerprint(key):
+    """Identifiant court (4 octets) d'une clé AES, enregistré dans l'enveloppe"""
+    return hashlib.sha256(b'aesecure-key-id:' + key).digest()[:4]
+
+
+def accepted_kdf_cost(algorithm):
+    """Coût maximal accepté pour une enveloppe reçue d'un client (untrusted) : le coût configuré.
+
+    Le coût est lu dans l'enveloppe avant toute vérification : sans ce plafond,
+    une enveloppe forgée (coût 24, quelques dizaines d'octets) occuperait un
+    worker pendant des secondes. Les messages stockés acceptent jusqu'à MAX_KDF_COSTS.
+    """
+    cost = DEFAULT_KDF_COSTS[algorithm]
+    if getattr(settings, 'CRYPTO_KDF', None) == algorithm:
+        cost = max(cost, getattr(settings, 'CRYPTO_KDF_COST', None) or 0)
+    return cost
+
+
+def parse_envelope_header(data):
+    """Retourne (mode, drapeaux, identifiant de clé) si `data` commence par une enveloppe, sinon None"""
+    if len(data) < ENVELOPE_HEADER.size:
+        return None
+    magic, version, mode, flags, key_id = ENVELOPE_HEADER.unpack_from(data)
+    if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION or mode not in MODE_NAMES:
+        return None
+    return MODE_NAMES[mode], flags, key_id
+
+
+class DerivedKeyCache:
+    """Cache LRU (clés dérivées, registre des clés), borné en taille, dont les entrées expirent après `ttl` secondes.
+
+    Partagé par les threads du processus ; `hits` et `misses` mesurent son efficacité.
+    """
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Valeur en cache pour `key`, None si absente ou expirée"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+    
+    def get_or_compute(self, key, compute):
+        """Valeur en cache pour `key`, sinon compute() (hors verrou) mise en cache"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+    
+    def put(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            # Entrées expirées ou les moins récemment utilisées au-delà de la taille maximale
+            while self._entries:
+                oldest_key, (expires, _) = next(iter(self._entries.items()))
+                if expires > now and len(self._entries) <= self.maxsize:
+                    break
+                del self._entries[oldest_key]
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_kdf_cache = None
+_kdf_cache_lock = threading.Lock()
+
+
+def get_kdf_cache():
+    """Cache des clés dérivées du processus (CRYPTO_KDF_CACHE_SIZE entrées, CRYPTO_KDF_CACHE_TTL secondes)"""
+    global _kdf_cache
+    with _kdf_cache_lock:
+        if _kdf_cache is None:
+            _kdf_cache = DerivedKeyCache(
+                maxsize=getattr(settings, 'CRYPTO_KDF_CACHE_SIZE', 1024),
+                ttl=getattr(settings, 'CRYPTO_KDF_CACHE_TTL', 3600),
+            )
+        return _kdf_cache
+
+
+def kdf_cache_stats():
+    """Taille et compteurs (succès, échecs, évictions) du cache des clés dérivées"""
+    return get_kdf_cache().stats()
+
+
+def _kdf(algorithm, cost, password, salt):
+    """Clé AES-256 dérivée du mot de passe (coûteux : appeler via le cache)"""
+    if algorithm == 'pbkdf2':
+        return hashlib.pbkdf2_hmac('sha256', password, salt, 2 ** cost, dklen=32)
+    # scrypt utilise 128 * r * N octets de mémoire
+    return hashlib.scrypt(password, salt=salt, n=2 ** cost, r=8, p=1, maxmem=2 * 1024 * 2 ** cost, dklen=32)
+
+
+def derive_kdf_key(algorithm, cost, password, salt):
+    """Clé dérivée pour un sel donné, calculée une fois par (sel, empreinte du mot de passe) et par processus"""
+    cache_key = (algorithm, cost, salt, hashlib.sha256(password).digest())
+    return get_kdf_cache().get_or_compute(cache_key, lambda: _kdf(algorithm, cost, password, salt))
+
+
+def encryption_kdf_key(algorithm, cost, password):
+    """(sel, clé dérivée) pour chiffrer sous ce mot de passe.
+
+    Le sel est réutilisé tant que l'entrée du cache n'a pas expiré : les
+    chiffrements successifs sous la même clé ne paient la dérivation qu'une fois.
+    """
+    password_hash = hashlib.sha256(password).digest()
+    cache = get_kdf_cache()
+    
+    def new_salt():
+        salt = os.urandom(SALT_SIZE)
+        key = _kdf(algorithm, cost, password, salt)
+        # Le déchiffrement de ces messages dans ce processus trouve la clé en cache
+        cache.put((algorithm, cost, salt, password_hash), key)
+        return salt, key
+    
+    return cache.get_or_compute(('salt', algorithm, cost, password_hash), new_salt)
+
+
+@functools.lru_cache(maxsize=KEY_CACHE_SIZE)
+def prepare_key(key):
+    """Clé AES (16, 24 ou 32 octets) et identifiant d'enveloppe d'une clé texte ou bytes, sans KDF.
+
+    Mis en cache par processus : déchiffrer de nombreux messages sous la même
+    clé ne refait pas la préparation de la clé à chaque message.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    # S'assurer que la clé fait 16, 24 ou 32 octets
+    if len(key) not in [16, 24, 32]:
+        key = key[:32].ljust(32, b'\0')
+    return key, key_fingerprint(key)
+
+
 class AESCipher:
-    def __init__(self, key=None):
-        self.key = key or settings.AES_SECRET_KEY
-        # S'assurer que la clé fait 16, 24 ou 32 octets
-        if isinstance(self.key, str):
-            self.key = self.key.encode('utf-8')
+    def __init__(self, key=None, mode=None, compression=None, kdf=None, kdf_cost=None, untrusted=False):
+        self.password = key or settings.AES_SECRET_KEY
+        if isinstance(self.password, str):
+            self.password = self.password.encode('utf-8')
+        # Clé de l'ancien format (tronquée ou complétée), pour les enveloppes sans sel
+        self.key, self.key_id = prepare_key(self.password)
+        
+        # Mode utilisé pour chiffrer ; le déchiffrement détecte le format tout seul
+        self.mode = (mode or getattr(settings, 'AES_CIPHER_MODE', 'GCM')).upper()
+        if self.mode != 'LEGACY' and self.mode not in MODES:
+            raise ValueError(f"Mode de chiffrement inconnu: {self.mode}")
+        
+        # Compression avant chiffrement ('zlib', 'lzma' ou None), signalée dans l'enveloppe :
+        # impossible en LEGACY, qui n'a pas d'en-tête pour la signaler
+        self.compression = compression if compression is not None else getattr(settings, 'CRYPTO_COMPRESSION', None)
+        if self.compression and self.compression not in COMPRESSION_FLAGS:
+            raise ValueError(f"Compression inconnue: {self.compression}")
+        if self.mode == 'LEGACY':
+            self.compression = None
         
-        if len(self.key) not in [16, 24, 32]:
-            self.key = self.key[:32].ljust(32, b'\0')
+        # Dérivation de la clé par KDF ('pbkdf2', 'scrypt' ou None), elle aussi signalée dans l'enveloppe.
+        # Par défaut réservée aux clés personnalisées (mots de passe) : la clé du serveur est un
+        # secret de configuration, la dériver ajouterait le coût du KDF à chaque déchiffrement à froid
+        if kdf is None and not self.is_server_key():
+            kdf = getattr(settings, 'CRYPTO_KDF', None)
+        self.kdf = kdf or None
+        if self.kdf and self.kdf not in KDFS:
+            raise ValueError(f"Dérivation de clé inconnue: {self.kdf}")
+        if self.mode == 'LEGACY':
+            self.kdf = None
+        self.kdf_cost = None
+        if self.kdf:
+            self.kdf_cost = kdf_cost or getattr(settings, 'CRYPTO_KDF_COST', None) or DEFAULT_KDF_COSTS[self.kdf]
+            if not 0 < self.kdf_cost <= MAX_KDF_COSTS[self.kdf]:
+                raise ValueError(f"Coût de dérivation invalide: {self.kdf_cost}")
+        # Enveloppes fournies par un client (vues publiques, API) : coût KDF plafonné au coût configuré
+        self.untrusted = untrusted
     
-    def encrypt(self, data):
-        """Chiffre les données avec AES en mode CBC"""
+    def is_server_key(self):
+        """Indique si le chiffreur utilise la clé du serveur (settings.AES_SECRET_KEY)"""
+        server_key = settings.AES_SECRET_KEY
+        if isinstance(server_key, str):
+            server_key = server_key.encode('utf-8')
+        return self.password == server_key
+    
+    def _with_key(self, key):
+        """Copie du chiffreur utilisant une clé dérivée.
+
+        Son identifiant d'enveloppe est l'empreinte de la clé dérivée : le
+        vérifier impose la dérivation, un en-tête ne permet pas de tester des
+        mots de passe sans payer le KDF.
+        """
+        keyed = copy.copy(self)
+        keyed.key = key
+        keyed.key_id = key_fingerprint(key)
+        return keyed
+    
+    def _encryption_cipher(self):
+        """(chiffreur, paramètres KDF de l'enveloppe) à utiliser pour chiffrer"""
+        if not self.kdf:
+            return self, b''
+        salt, key = encryption_kdf_key(self.kdf, self.kdf_cost, self.password)
+        return self._with_key(key), KDF_HEADER.pack(KDFS[self.kdf], self.kdf_cost, salt)
+    
+    def _kdf_params(self, source):
+        """Paramètres KDF (octets) de l'enveloppe, None s'ils sont invalides ou trop coûteux"""
+        if len(source) < ENVELOPE_PREFIX_SIZE:
+            return None
+        algorithm, cost, _ = KDF_HEADER.unpack_from(source, ENVELOPE_HEADER.size)
+        name = KDF_NAMES.get(algorithm)
+        if name is None or not 0 < cost <= self._accepted_kdf_cost(name):
+            return None
+        return bytes(source[ENVELOPE_HEADER.size:ENVELOPE_PREFIX_SIZE])
+    
+    def _accepted_kdf_cost(self, algorithm):
+        if not self.untrusted:
+            return MAX_KDF_COSTS[algorithm]
+        if algorithm == self.kdf:
+            return max(accepted_kdf_cost(algorithm), self.kdf_cost)
+        return accepted_kdf_cost(algorithm)
+    
+    def _envelope_cipher(self, source, flags):
+        """(chiffreur, position des données) pour cette enveloppe, (None, None) si ses paramètres KDF sont invalides.
+        
+        Avec FLAG_SALT, la clé est dérivée avec le sel de l'enveloppe (en cache
+        après le premier message) avant que son identifiant puisse être comparé.
+        """
+        if not flags & FLAG_SALT:
+            return self, ENVELOPE_HEADER.size
+        kdf_params = self._kdf_params(source)
+        if kdf_params is None:
+            return None, None
+        algorithm, cost, salt = KDF_HEADER.unpack(kdf_params)
+        return self._with_key(derive_kdf_key(KDF_NAMES[algorithm], cost, self.password, salt)), ENVELOPE_PREFIX_SIZE
+    
+    def is_encrypted_with(self, data):
+        """Indique si l'enveloppe `data` (au moins ENVELOPE_PREFIX_SIZE octets) a été chiffrée avec cette clé.
+        
+        Une enveloppe à clé dérivée coûte une dérivation par sel distinct (en cache ensuite).
+        """
+        source = memoryview(data).cast('B')
+        envelope = parse_envelope_header(source)
+        if envelope is None or envelope[1] & ~KNOWN_FLAGS:
+            return False
+        keyed, _ = self._envelope_cipher(source, envelope[1])
+        return keyed is not None and keyed.key_id == envelope[2]
+    
+    def _header(self, flags=0):
+        return ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, MODES[self.mode], flags, self.key_id)
+    
+    def _new_cipher(self, mode, nonce):
+        if mode in ('LEGACY', 'CBC'):
+            return AES.new(self.key, AES.MODE_CBC, nonce)
+        if mode == 'CTR':
+            return AES.new(self.key, AES.MODE_CTR, nonce=nonce)
+        return AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+    
+    def _ctr(self, nonce, data, output):
+        """Applique le flux CTR dans `output` ; les gros volumes sont découpés en segments parallèles"""
+        if len(data) < PARALLEL_THRESHOLD:
+            AES.new(self.key, AES.MODE_CTR, nonce=nonce).encrypt(data, output=output)
+            return
+        
+        from .pool import get_executor
+        
+        def process_segment(start):
+            end = min(start + PARALLEL_SEGMENT_SIZE, len(data))
+            # Chaque segment reprend le compteur à son numéro de bloc
+            cipher = AES.new(self.key, AES.MODE_CTR, nonce=nonce, initial_value=start // AES.block_size)
+            cipher.encrypt(data[start:end], output=output[start:end])
+        
+        list(get_executor('segment').map(process_segment, range(0, len(data), PARALLEL_SEGMENT_SIZE)))
+    
+    def encrypt_into(self, data, out=None):
+        """Chiffre un buffer directement dans `out`, sans copie intermédiaire.
+
+        `data` est un objet bytes-like (bytes, bytearray, memoryview) ; `out`
+        un bytearray d'au moins encrypted_size(len(data)) octets, alloué si
+        absent. Retourne une memoryview sur l'enveloppe écrite dans `out`.
+        Avec la compression, l'enveloppe peut être plus courte que prévu.
+        """
+        source = memoryview(data).cast('B')
+        keyed, kdf_header = self._encryption_cipher()
+        flags = FLAG_SALT if kdf_header else 0
+        # Au-delà de max_decompressed_size(), l'enveloppe compressée serait refusée au déchiffrement
+        if self.compression and COMPRESSION_MIN_SIZE <= len(source) <= max_decompressed_size():
+            compressed = _compress(self.compression, source)
+            # Données peu compressibles : chiffrées telles quelles
+            if len(compressed) < len(source):
+                source = memoryview(compressed)
+                flags |= COMPRESSION_FLAGS[self.compression]
+        size = self.encrypted_size(len(source))
+        if out is None:
+            out = bytearray(size)
+        target = memoryview(out)
+        if len(target) < size:
+            raise ValueError(f"Buffer de sortie trop petit: {len(target)} octets pour {size}")
+        
         try:
-            # Convertir en bytes si nécessaire
-            if isinstance(data, str):
-                data = data.encode('utf-8')
-            
-            # Générer un IV aléatoire
-            iv = os.urandom(16)
+            pos = 0
+            if self.mode != 'LEGACY':
+                ENVELOPE_HEADER.pack_into(target, 0, ENVELOPE_MAGIC, ENVELOPE_VERSION, MODES[self.mode], flags, keyed.key_id)
+                target[ENVELOPE_HEADER.size:ENVELOPE_HEADER.size + len(kdf_header)] = kdf_header
+                pos = ENVELOPE_HEADER.size + len(kdf_header)
+            header_size = pos
             
-            # Créer le cipher
-            cipher = AES.new(self.key, AES.MODE_CBC, iv)
+            # Générer un IV / nonce aléatoire
+            nonce = os.urandom(NONCE_SIZES[self.mode])
+            target[pos:pos + len(nonce)] = nonce
+            pos += len(nonce)
             
-            # Chiffrer les données - CORRECTION ICI
-            encrypted_data = cipher.encrypt(pad(data, AES.block_size))
+            if self.mode in ('LEGACY', 'CBC'):
+                cipher = keyed._new_cipher(self.mode, nonce)
+                # Blocs complets chiffrés sur place, seul le dernier bloc est complété
+                full = len(source) - len(source) % AES.block_size
+                if full:
+                    cipher.encrypt(source[:full], output=target[pos:pos + full])
+                    pos += full
+                last = pad(source[full:].tobytes(), AES.block_size)
+                cipher.encrypt(last, output=target[pos:pos + AES.block_size])
+            elif self.mode == 'CTR':
+                keyed._ctr(nonce, source, target[pos:pos + len(source)])
+            else:
+                cipher = keyed._new_cipher('GCM', nonce)
+                # L'en-tête (et les paramètres KDF) sont authentifiés avec les données
+                cipher.update(target[:header_size])
+                cipher.encrypt(source, output=target[pos:pos + len(source)])
+                pos += len(source)
+                target[pos:pos + TAG_SIZE] = cipher.digest()
             
-            # Combiner IV et données chiffrées
-            combined = iv + encrypted_data
-            
-            # Encoder en base64 pour stockage
-            return base64.b64encode(combined).decode('utf-8')
+            return target[:size]
             
         except Exception as e:
             raise Exception(f"Erreur lors du chiffrement: {str(e)}")
     
-    def decrypt(self, encrypted_data):
-        """Déchiffre les données avec AES en mode CBC"""
+    def encrypt_bytes(self, data):
+        """Chiffre les données et retourne l'enveloppe binaire (en-tête, nonce, données chiffrées)"""
+        # Convertir en bytes si nécessaire
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return bytes(self.encrypt_into(data))
+    
+    def encrypt(self, data):
+        """Chiffre les données et les encode en base64"""
+        # Convertir en bytes si nécessaire
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        # Encoder en base64 pour stockage
+        return base64.b64encode(self.encrypt_into(data)).decode('utf-8')
+    
+    def decrypt_from(self, buffer, out=None):
+        """Déchiffre une enveloppe (ou l'ancien format IV + CBC) à partir de tranches de memoryview.
+
+        `out` est un bytearray optionnel d'au moins la taille des données
+        chiffrées. Retourne une memoryview sur le texte clair écrit dans `out`,
+        ou sur un nouveau buffer si l'enveloppe était compressée.
+        """
+        source = memoryview(buffer).cast('B')
+        envelope = parse_envelope_header(source)
+        if envelope is None:
+            return self._decrypt_view('LEGACY', source, 0, out)
+        
+        mode, flags, key_id = envelope
+        keyed = offset = None
+        if not flags & ~KNOWN_FLAGS:
+            # Coût du KDF lu dans l'enveloppe : plafonné avant toute dérivation (voir _accepted_kdf_cost)
+            keyed, offset = self._envelope_cipher(source, flags)
+        if keyed is None or key_id != keyed.key_id:
+            # Un IV de l'ancien format peut ressembler à un en-tête : retenter en LEGACY
+            if len(source) % AES.block_size == 0:
+                try:
+                    return self._decrypt_view('LEGACY', source, 0, out)
+                except Exception:
+                    pass
+            if keyed is None:
+                raise Exception("Erreur lors du déchiffrement: format d'enveloppe non supporté")
+            raise Exception("Erreur lors du déchiffrement: clé incorrecte")
+        
+        plain = keyed._decrypt_view(mode, source, offset, out)
+        decompressor = _decompressor(flags)
+        if decompressor is None:
+            return plain
+        return memoryview(_decompress_bounded(decompressor, plain, max_decompressed_size()))
+    
+    def _decrypt_view(self, mode, source, offset, out):
         try:
-            # Décoder la base64
-            combined = base64.b64decode(encrypted_data)
+            tag_size = TAG_SIZE if mode == 'GCM' else 0
+            if len(source) < offset + NONCE_SIZES[mode] + tag_size:
+                raise ValueError("données chiffrées tronquées")
+            nonce = source[offset:offset + NONCE_SIZES[mode]]
+            body = source[offset + len(nonce):len(source) - tag_size]
             
-            # Extraire l'IV et les données chiffrées
-            iv = combined[:16]
-            encrypted_data = combined[16:]
+            if out is None:
+                out = bytearray(len(body))
+            target = memoryview(out)[:len(body)]
+            if len(target) < len(body):
+                raise ValueError(f"Buffer de sortie trop petit: {len(target)} octets pour {len(body)}")
             
-            # Créer le cipher
-            cipher = AES.new(self.key, AES.MODE_CBC, iv)
+            if mode == 'CTR':
+                self._ctr(nonce.tobytes(), body, target)
+                return target
             
-            # Déchiffrer les données - CORRECTION ICI
-            decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
+            cipher = self._new_cipher(mode, nonce.tobytes())
+            if mode == 'GCM':
+                # GCM : un tag invalide échoue ici, avant tout décodage
+                cipher.update(source[:offset])
+                cipher.decrypt(body, output=target)
+                cipher.verify(source[-TAG_SIZE:])
+                return target
             
-            return decrypted_data.decode('utf-8')
+            cipher.decrypt(body, output=target)
+            return _unpad_view(target)
             
         except Exception as e:
             raise Exception(f"Erreur lors du déchiffrement: {str(e)}")
+    
+    def decrypt_bytes(self, combined):
+        """Déchiffre une enveloppe (ou l'ancien format IV + CBC) et retourne les octets en clair"""
+        return bytes(self.decrypt_from(combined))
+    
+    def decrypt(self, encrypted_data):
+        """Déchiffre un texte chiffré encodé en base64"""
+        try:
+            # Décoder la base64
+            combined = base64.b64decode(encrypted_data)
+        except Exception as e:
+            raise Exception(f"Erreur lors du déchiffrement: {str(e)}")
+
+        decrypted_data = self.decrypt_from(combined)
+        try:
+            return str(decrypted_data, 'utf-8')
+        except UnicodeDecodeError as e:
+            raise Exception(f"Erreur lors du déchiffrement: {str(e)}")
+
+    def encrypt_stream(self, source, chunk_size=STREAM_CHUNK_SIZE):
+        """Chiffre un flux par blocs et produit l'enveloppe binaire au fil de l'eau.
+
+        La sortie est identique à celle d'encrypt_bytes, sans base64 : la
+        mémoire utilisée reste constante quelle que soit la taille du flux.
+        Pas de compression ici, pour que encrypted_size() reste exacte.
+        """
+        keyed, kdf_header = self._encryption_cipher()
+        nonce = os.urandom(NONCE_SIZES[self.mode])
+        cipher = keyed._new_cipher(self.mode, nonce)
+        if self.mode == 'LEGACY':
+            yield nonce
+        else:
+            header = keyed._header(FLAG_SALT if kdf_header else 0) + kdf_header
+            if self.mode == 'GCM':
+                cipher.update(header)
+            yield header + nonce
+
+        block_mode = self.mode in ('LEGACY', 'CBC')
+        pending = bytearray()
+        for chunk in _iter_chunks(source, chunk_size):
+            if not block_mode:
+                yield cipher.encrypt(chunk)
+                continue
+            pending += chunk
+            # Ne chiffrer que des blocs complets, le reste attend le bloc suivant
+            cut = len(pending) - len(pending) % AES.block_size
+            if cut:
+                yield cipher.encrypt(bytes(pending[:cut]))
+                del pending[:cut]
+
+        if block_mode:
+            yield cipher.encrypt(pad(bytes(pending), AES.block_size))
+        elif self.mode == 'GCM':
+            yield cipher.digest()
+
+    def decrypt_stream(self, source, chunk_size=STREAM_CHUNK_SIZE):
+        """Déchiffre un flux produit par encrypt_stream et produit le texte clair au fil de l'eau.
+
+        En GCM, le tag n'est vérifié qu'en fin de flux : une erreur est alors
+        levée après l'envoi des données, le client doit rejeter le résultat.
+        """
+        chunks = _iter_chunks(source, chunk_size)
+        pending = bytearray()
+        # Lire assez d'octets pour reconnaître le format
+        for chunk in chunks:
+            pending += chunk
+            if len(pending) >= ENVELOPE_PREFIX_SIZE + AES.block_size:
+                break
+
+        envelope = parse_envelope_header(pending)
+        flags = 0
+        keyed = self
+        if envelope is None:
+            mode, offset = 'LEGACY', 0
+        else:
+            mode, flags = envelope[0], envelope[1]
+            if flags & ~KNOWN_FLAGS:
+                raise Exception("Erreur lors du déchiffrement: format d'enveloppe non supporté")
+            keyed, offset = self._envelope_cipher(pending, flags)
+            if keyed is None:
+                raise Exception("Erreur lors du déchiffrement: format d'enveloppe non supporté")
+            if envelope[2] != keyed.key_id:
+                raise Exception("Erreur lors du déchiffrement: clé incorrecte")
+
+        plain = keyed._decrypt_stream_body(mode, offset, pending, chunks)
+        decompressor = _decompressor(flags)
+        if decompressor is None:
+            yield from plain
+            return
+        # Enveloppe compressée (produite par encrypt_bytes) : décompression au fil de l'eau,
+        # bornée sur l'ensemble du flux
+        remaining = max_decompressed_size()
+        for chunk in plain:
+            data = _decompress_bounded(decompressor, chunk, remaining) if chunk else b''
+            remaining -= len(data)
+            if data:
+                yield data
+
+    def _decrypt_stream_body(self, mode, offset, pending, chunks):
+        """Déchiffre le reste du flux, `pending` contenant déjà l'en-tête et le début"""
+        nonce = bytes(pending[offset:offset + NONCE_SIZES[mode]])
+        if len(nonce) < NONCE_SIZES[mode]:
+            raise Exception("Erreur lors du déchiffrement: flux chiffré tronqué ou invalide")
+        cipher = self._new_cipher(mode, nonce)
+        if mode == 'GCM':
+            cipher.update(bytes(pending[:offset]))
+        del pending[:offset + len(nonce)]
+
+        block_mode = mode in ('LEGACY', 'CBC')
+        # Garder le dernier bloc (padding) ou le tag GCM pour la fin du flux
+        keep = 0 if mode == 'CTR' else AES.block_size
+        for chunk in itertools.chain((b'',), chunks):
+            pending += chunk
+            if block_mode:
+                cut = len(pending) - len(pending) % AES.block_size
+                if cut == len(pending):
+                    cut -= AES.block_size
+            else:
+                cut = len(pending) - keep
+            if cut > 0:
+                yield cipher.decrypt(bytes(pending[:cut]))
+                del pending[:cut]
+
+        if len(pending) != keep:
+            raise Exception("Erreur lors du déchiffrement: flux chiffré tronqué ou invalide")
+        try:
+            if block_mode:
+                yield unpad(cipher.decrypt(bytes(pending)), AES.block_size)
+            elif mode == 'GCM':
+                cipher.verify(bytes(pending))
+        except ValueError as e:
+            raise Exception(f"Erreur lors du déchiffrement: {str(e)}")
+
+    def encrypted_size(self, size):
+        """Taille exacte de la sortie d'encrypt_stream pour une entrée de `size` octets"""
+        if self.mode in ('LEGACY', 'CBC'):
+            body = (size // AES.block_size + 1) * AES.block_size
+        else:
+            body = size + (TAG_SIZE if self.mode == 'GCM' else 0)
+        header = 0 if self.mode == 'LEGACY' else ENVELOPE_HEADER.size + (KDF_HEADER.size if self.kdf else 0)
+        return header + NONCE_SIZES[self.mode] + body
 
 # Fonctions utilitaires pour une utilisation facile
 def encrypt_text(text, key=None):
     cipher = AESCipher(key)
     return cipher.encrypt(text)
 
-def decrypt_text(encrypted_text, key=None):
+def decrypt_text(encrypted_text, key=None, untrusted=False):
+    cipher = AESCipher(key, untrusted=untrusted)
+    return cipher.decrypt(encrypted_text)
+
+def encrypt_bytes(data, key=None):
+    cipher = AESCipher(key)
+    return cipher.encrypt_bytes(data)
+
+def decrypt_bytes(combined, key=None):
+    cipher = AESCipher(key)
+    return cipher.decrypt_bytes(combined)
+
+def encrypt_stream(source, key=None, chunk_size=STREAM_CHUNK_SIZE):
     cipher = AESCipher(key)
-    return cipher.decrypt(encrypted_text)
\ No newline at end of file
+    return cipher.encrypt_stream(source, chunk_size)
+
+def decrypt_stream(source, key=None, chunk_size=STREAM_CHUNK_SIZE, untrusted=False):
+    cipher = AESCipher(key, untrusted=untrusted)
+    return cipher.decrypt_stream(source, chunk_size)
+
+
+def _run_batch(operation, key, mode, payloads, compression=None, kdf=None, kdf_cost=None, untrusted=False):
+    """Traite un lot de payloads sous une même clé (exécuté dans un worker)"""
+    cipher = AESCipher(key, mode, compression, kdf, kdf_cost, untrusted)
+    process = getattr(cipher, operation)
+    results = []
+    for payload in payloads:
+        try:
+            results.append(BatchResult(process(payload), None))
+        except Exception as e:
+            results.append(BatchResult(None, str(e)))
+    return results
+
+
+def _run_many(operation, items, executor, batch_size, mode, kdf=None, untrusted=False):
+    items = list(items)
+    results = [None] * len(items)
+
+    # Regrouper par clé : une seule préparation de clé par lot
+    groups = {}
+    for index, (payload, key) in enumerate(items):
+        groups.setdefault(key or None, []).append(index)
+
+    batches = []
+    for key, indexes in groups.items():
+        # Résoudre clé, mode, compression et KDF ici pour que les workers n'aient pas besoin des settings
+        cipher = AESCipher(key, mode, kdf=kdf)
+        for start in range(0, len(indexes), batch_size):
+            batch = indexes[start:start + batch_size]
+            batches.append((batch, [items[i][0] for i in batch], _cipher_arguments(cipher)))
+
+    outputs = _map_batches(
+        executor, _run_batch,
+        [(operation, key, mode, payloads, *options, untrusted) for _, payloads, (key, mode, *options) in batches]
+    )
+    for (indexes, *_), output in zip(batches, outputs):
+        for index, result in zip(indexes, output):
+            results[index] = result
+    return results
+
+
+def _cipher_arguments(cipher):
+    """(clé, mode, compression, kdf, coût) recréant `cipher` dans un worker ('' : désactivé)"""
+    return cipher.password, cipher.mode, cipher.compression or '', cipher.kdf or '', cipher.kdf_cost
+
+
+def _map_batches(executor, function, arguments):
+    """Exécute function(*args) pour chaque lot, dans le pool partagé s'il y a plusieurs lots"""
+    executor = executor or getattr(settings, 'CRYPTO_EXECUTOR', 'thread')
+    if executor == 'serial' or len(arguments) <= 1:
+        return (function(*args) for args in arguments)
+    from .pool import get_executor
+    pool = get_executor(executor)
+    futures = [pool.submit(function, *args) for args in arguments]
+    return (future.result() for future in futures)
+
+def encrypt_many(items, executor=None, batch_size=BATCH_SIZE, mode=None, binary=False, kdf=None):
+    """Chiffre une liste de paires (texte, clé) en parallèle.
+
+    Retourne une liste de BatchResult dans l'ordre d'entrée ; une erreur sur
+    un élément n'interrompt pas les autres. `executor` vaut 'thread',
+    'process' ou 'serial' (par défaut settings.CRYPTO_EXECUTOR, sinon 'thread').
+    Avec `binary`, les résultats sont des bytes (encrypt_bytes) et non de la base64.
+    `kdf` remplace CRYPTO_KDF ('' pour désactiver la dérivation).
+    """
+    return _run_many('encrypt_bytes' if binary else 'encrypt', items, executor, batch_size, mode, kdf)
+
+def decrypt_many(items, executor=None, batch_size=BATCH_SIZE, mode=None, binary=False, untrusted=False):
+    """Déchiffre une liste de paires (texte chiffré, clé) en parallèle, voir encrypt_many.
+
+    `untrusted` plafonne le coût KDF des enveloppes au coût configuré (données d'un client).
+    """
+    return _run_many('decrypt_bytes' if binary else 'decrypt', items, executor, batch_size, mode, untrusted=untrusted)
+
+
+def _run_reencrypt(old_key, payloads, new_key, mode, compression, kdf, kdf_cost):
+    """Déchiffre un lot avec l'ancienne clé et le rechiffre avec la nouvelle (exécuté dans un worker)"""
+    old_cipher = AESCipher(old_key, mode)
+    new_cipher = AESCipher(new_key, mode, compression, kdf, kdf_cost)
+    results = []
+    for payload in payloads:
+        try:
+            # Texte chiffré en base64 (encrypted_text) ou enveloppe binaire (encrypted_data)
+            binary = not isinstance(payload, str)
+            try:
+                data = payload if binary else base64.b64decode(payload)
+            except ValueError as e:
+                raise Exception(f"Erreur lors du déchiffrement: {str(e)}")
+            envelope = new_cipher.encrypt_into(old_cipher.decrypt_from(data))
+            value = bytes(envelope) if binary else base64.b64encode(envelope).decode('ascii')
+            results.append(BatchResult(value, None))
+        except Exception as e:
+            results.append(BatchResult(None, str(e)))
+    return results
+
+
+def reencrypt_many(payloads, old_key, new_key, executor=None, batch_size=BATCH_SIZE, mode=None, kdf=None):
+    """Rechiffre des textes chiffrés (base64 ou bytes) de `old_key` vers `new_key`, en parallèle.
+
+    Le texte clair ne quitte pas les workers. Retourne une liste de
+    BatchResult dans l'ordre d'entrée, chaque résultat ayant le type de son
+    payload ; le nouveau chiffrement utilise `mode` (par défaut AES_CIPHER_MODE)
+    et `kdf` (par défaut CRYPTO_KDF, '' pour désactiver la dérivation).
+    """
+    payloads = list(payloads)
+    old_cipher = AESCipher(old_key)
+    new_cipher = AESCipher(new_key, mode, kdf=kdf)
+    outputs = _map_batches(executor, _run_reencrypt, [
+        (old_cipher.password, payloads[start:start + batch_size], *_cipher_arguments(new_cipher))
+        for start in range(0, len(payloads), batch_size)
+    ])
+    return [result for output in outputs for result in output]
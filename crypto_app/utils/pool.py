@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_max_workers():
+    """Nombre de workers des pools partagés (CRYPTO_MAX_WORKERS, sinon un par cœur)"""
+    return getattr(settings, 'CRYPTO_MAX_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_executor(kind='thread'):
+    """Retourne le pool partagé du processus, créé à la demande.
+
+    'thread' et 'process' servent aux traitements par lot ; 'segment' est un
+    pool de threads séparé pour les segments CTR, afin qu'une tâche d'un pool
+    n'attende jamais une autre tâche du même pool.
+    """
+    if kind not in ('thread', 'process', 'segment'):
+        raise ValueError(f"Type de pool inconnu: {kind}")
+
+    with _lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            if kind == 'process':
+                executor = ProcessPoolExecutor(max_workers=get_max_workers())
+            else:
+                executor = ThreadPoolExecutor(
+                    max_workers=get_max_workers(),
+                    thread_name_prefix=f'crypto-{kind}'
+                )
+            _executors[kind] = executor
+        return executor
+
+
+async def run_in_executor(func, *args, kind='thread', **kwargs):
+    """Exécute une fonction bloquante (chiffrement...) dans le pool partagé depuis une vue async"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(kind), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executors(wait=True):
+    """Arrête les pools partagés (utile en fin de commande ou de tests)"""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
@@ -0,0 +1,122 @@
+import csv
+import json
+import re
+
+# Taille des lectures lors de l'analyse d'un tableau JSON en flux
+READ_SIZE = 64 * 1024
+
+# Fin possible d'un élément JSON scalaire
+_TOKEN_END = re.compile(r'[\s,\]]')
+
+
+def chunked(iterable, size):
+    """Découpe un itérable en listes d'au plus `size` éléments, sans tout charger"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_ndjson(fileobj):
+    """Produit les objets d'un fichier NDJSON (un document JSON par ligne)"""
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array(fileobj, read_size=READ_SIZE):
+    """Produit un à un les éléments d'un tableau JSON, en lisant le fichier par blocs.
+
+    Un élément n'est produit qu'une fois son délimiteur (',' ou ']') présent
+    dans le tampon : un nombre coupé en fin de bloc (`12` lu `1` puis `2`)
+    n'est pas décodé trop tôt. Les virgules en trop (`[,1]`, `[1,,2]`, `[1,]`)
+    sont refusées.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    # Attendu : '[' (start), un élément ou ']' (first), un élément (item), ',' ou ']' (separator)
+    expected = 'start'
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+
+        if pos < len(buffer):
+            char = buffer[pos]
+            if expected == 'start':
+                if char != '[':
+                    raise ValueError("Un tableau JSON est attendu")
+                expected = 'first'
+                pos += 1
+                continue
+            if expected == 'separator' or (expected == 'first' and char == ']'):
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ValueError(f"',' ou ']' attendu après un élément, trouvé {char!r}")
+                expected = 'item'
+                pos += 1
+                continue
+            if char in ',]':
+                raise ValueError(f"Élément attendu, trouvé {char!r}")
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Élément coupé en fin de bloc : lire la suite
+                if eof:
+                    raise
+            else:
+                following = end
+                while following < len(buffer) and buffer[following].isspace():
+                    following += 1
+                if following < len(buffer) and buffer[following] in ',]':
+                    yield item
+                    expected = 'separator'
+                    pos = end
+                    continue
+                # Un nombre peut continuer dans le bloc suivant (`-6.` puis `5`) : relire
+                if following < len(buffer) and (eof or _TOKEN_END.search(buffer, end)):
+                    raise ValueError(f"',' ou ']' attendu après un élément, trouvé {buffer[following]!r}")
+
+        if eof:
+            raise ValueError("Tableau JSON incomplet")
+        chunk = fileobj.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def json_array_lines(objects, indent=None):
+    """Écrit un tableau JSON élément par élément (pour StreamingHttpResponse)"""
+    yield '['
+    separator = '\n'
+    for obj in objects:
+        yield separator + json.dumps(obj, ensure_ascii=False, indent=indent)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def ndjson_lines(objects):
+    """Écrit un document JSON par ligne"""
+    for obj in objects:
+        yield json.dumps(obj, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Pseudo-fichier dont write() retourne la ligne au lieu de la stocker"""
+    def write(self, value):
+        return value
+
+
+def csv_lines(objects, fieldnames):
+    """Écrit un CSV (ligne d'en-tête puis une ligne par dict) sans tampon complet"""
+    writer = csv.DictWriter(_Echo(), fieldnames=fieldnames)
+    yield writer.writeheader()
+    for obj in objects:
+        yield writer.writerow(obj)
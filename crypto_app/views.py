@@ -1,9 +1,22 @@
+import tempfile
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.views.generic import TemplateView
-from .forms import EncryptionForm, DecryptionForm
-from .models import EncryptedMessage
-from .utils.crypto import encrypt_text, decrypt_text
+from .accounting import QuotaExceeded, aget_message_stats, get_message_stats, reserve_quota
+from .forms import EncryptionForm, DecryptionForm, FileEncryptionForm
+from .models import EncryptedMessage, EncryptionKey
+from .pagination import KeysetPaginator
+from .search import search_messages
+from .utils.crypto import AESCipher, encrypt_text, decrypt_text
+from .utils.pool import run_in_executor
+from .writebehind import asave_message, save_message
+
+# Fichier déchiffré gardé en mémoire jusqu'à cette taille, puis sur disque (file_view)
+FILE_SPOOL_SIZE = 8 * 1024 * 1024
 
 class HomeView(TemplateView):
     template_name = 'crypto_app/index.html'
@@ -23,12 +36,19 @@ def encrypt_view(request):
                 
                 # Sauvegarder en base si l'utilisateur est connecté
                 if request.user.is_authenticated:
-                    EncryptedMessage.objects.create(
+                    message = EncryptedMessage(
                         user=request.user,
                         original_text=text,
                         encrypted_text=encrypted_text,
-                        encryption_key=custom_key or ''
+                        key=EncryptionKey.objects.for_secret(custom_key) if custom_key else None
                     )
+                    message.prepare_ciphertext()
+                    try:
+                        # Place réservée avant l'écriture (éventuellement différée)
+                        reserve_quota(message)
+                        save_message(message)
+                    except QuotaExceeded as e:
+                        messages.warning(request, f"Message non enregistré: {str(e)}")
                 
                 context['encrypted_text'] = encrypted_text
                 context['original_text'] = text
@@ -53,7 +73,7 @@ def decrypt_view(request):
                 decryption_key = form.cleaned_data['decryption_key']
                 
                 # Déchiffrer le texte
-                decrypted_text = decrypt_text(encrypted_text, decryption_key or None)
+                decrypted_text = decrypt_text(encrypted_text, decryption_key or None, untrusted=True)
                 
                 context['decrypted_text'] = decrypted_text
                 context['encrypted_text'] = encrypted_text
@@ -67,11 +87,56 @@ def decrypt_view(request):
     context['form'] = form
     return render(request, 'crypto_app/decrypt.html', context)
 
+def decrypt_upload(cipher, uploaded):
+    """Déchiffre un fichier dans un fichier temporaire (mémoire puis disque au-delà de FILE_SPOOL_SIZE).
+
+    Rien n'est envoyé avant la fin du déchiffrement : le tag GCM (ou le padding)
+    est vérifié sur tout le fichier, une clé incorrecte ou un fichier altéré
+    lève une exception au lieu de produire un téléchargement tronqué.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=FILE_SPOOL_SIZE)
+    try:
+        for chunk in cipher.decrypt_stream(uploaded):
+            output.write(chunk)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+def file_view(request):
+    """Chiffre un fichier en flux, ou le déchiffre et ne l'envoie qu'une fois authentifié"""
+    if request.method == 'POST':
+        form = FileEncryptionForm(request.POST, request.FILES)
+        if form.is_valid():
+            uploaded = form.cleaned_data['file']
+            cipher = AESCipher(form.cleaned_data['key'] or None, untrusted=True)
+
+            if form.cleaned_data['operation'] == 'encrypt':
+                response = StreamingHttpResponse(
+                    cipher.encrypt_stream(uploaded),
+                    content_type='application/octet-stream'
+                )
+                response['Content-Length'] = cipher.encrypted_size(uploaded.size)
+                response['Content-Disposition'] = content_disposition_header(True, f"{uploaded.name}.aes")
+                return response
+
+            try:
+                decrypted = decrypt_upload(cipher, uploaded)
+            except Exception as e:
+                messages.error(request, str(e))
+            else:
+                return FileResponse(
+                    decrypted,
+                    as_attachment=True,
+                    filename=uploaded.name.removesuffix('.aes') or 'dechiffre.bin',
+                    content_type='application/octet-stream'
+                )
+    else:
+        form = FileEncryptionForm()
+
+    return render(request, 'crypto_app/file.html', {'form': form})
 
-# crypto_app/views.py
-from django.utils import timezone
-from datetime import timedelta
-from django.core.paginator import Paginator
 
 def messages_view(request):
     """Affiche les messages chiffrés de l'utilisateur"""
@@ -79,26 +144,133 @@ def messages_view(request):
         messages.warning(request, "Veuillez vous connecter pour voir vos messages.")
         return redirect('admin:login')
     
-    user_messages = EncryptedMessage.objects.filter(user=request.user).order_by('-created_at')
+    user_messages = EncryptedMessage.objects.filter(user=request.user).defer(*EncryptedMessage.LARGE_FIELDS)
+    
+    # Recherche plein texte (?q=)
+    query = request.GET.get('q', '').strip()
+    user_messages = search_messages(user_messages, query)
+    
+    # Statistiques (compteurs maintenus à l'écriture, voir accounting.py)
+    stats = get_message_stats(request.user)
+    
+    # Pagination par curseur (?after= / ?before=)
+    paginator = KeysetPaginator(user_messages, 10)  # 10 messages par page
+    page_obj = paginator.get_page(request.GET.get('after'), request.GET.get('before'))
+    
+    context = {
+        'messages': page_obj,
+        'query': query,
+        **stats,
+    }
+    
+    return render(request, 'crypto_app/messages.html', context)
+
+def message_ciphertext_view(request, pk):
+    """Texte chiffré complet d'un message (bouton Copier, la liste n'en charge qu'un aperçu)"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentification requise"}, status=401)
+    
+    message = EncryptedMessage.objects.filter(user=request.user, pk=pk).only(
+        'encrypted_text', 'encrypted_data'
+    ).first()
+    if message is None:
+        return JsonResponse({'error': "Message introuvable"}, status=404)
+    return JsonResponse({'encrypted_text': message.get_encrypted_text()})
+
+
+# Variantes asynchrones pour le déploiement ASGI (settings.CRYPTO_ASYNC_VIEWS) :
+# le chiffrement part dans le pool de threads partagé et l'ORM est utilisé en
+# async, le rendu des templates (session, messages) reste synchrone.
+async def encrypt_view_async(request):
+    context = {}
+    
+    if request.method == 'POST':
+        form = EncryptionForm(request.POST)
+        if form.is_valid():
+            try:
+                text = form.cleaned_data['text']
+                custom_key = form.cleaned_data['custom_key']
+                
+                # Chiffrer le texte hors de la boucle d'événements
+                encrypted_text = await run_in_executor(encrypt_text, text, custom_key or None)
+                
+                # Sauvegarder en base si l'utilisateur est connecté
+                user = await request.auser()
+                if user.is_authenticated:
+                    message = EncryptedMessage(
+                        user=user,
+                        original_text=text,
+                        encrypted_text=encrypted_text,
+                        key=await EncryptionKey.objects.afor_secret(custom_key) if custom_key else None
+                    )
+                    message.prepare_ciphertext()
+                    try:
+                        await sync_to_async(reserve_quota)(message)
+                        await asave_message(message)
+                    except QuotaExceeded as e:
+                        messages.warning(request, f"Message non enregistré: {str(e)}")
+                
+                context['encrypted_text'] = encrypted_text
+                context['original_text'] = text
+                messages.success(request, "Texte chiffré avec succès !")
+                
+            except Exception as e:
+                messages.error(request, f"Erreur lors du chiffrement: {str(e)}")
+    else:
+        form = EncryptionForm()
+    
+    context['form'] = form
+    return await sync_to_async(render)(request, 'crypto_app/encrypt.html', context)
+
+async def decrypt_view_async(request):
+    context = {}
+    
+    if request.method == 'POST':
+        form = DecryptionForm(request.POST)
+        if form.is_valid():
+            try:
+                encrypted_text = form.cleaned_data['encrypted_text']
+                decryption_key = form.cleaned_data['decryption_key']
+                
+                # Déchiffrer le texte hors de la boucle d'événements
+                decrypted_text = await run_in_executor(decrypt_text, encrypted_text, decryption_key or None, untrusted=True)
+                
+                context['decrypted_text'] = decrypted_text
+                context['encrypted_text'] = encrypted_text
+                messages.success(request, "Texte déchiffré avec succès !")
+                
+            except Exception as e:
+                messages.error(request, f"Erreur lors du déchiffrement: {str(e)}")
+    else:
+        form = DecryptionForm()
+    
+    context['form'] = form
+    return await sync_to_async(render)(request, 'crypto_app/decrypt.html', context)
+
+async def messages_view_async(request):
+    """Affiche les messages chiffrés de l'utilisateur (version async)"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        messages.warning(request, "Veuillez vous connecter pour voir vos messages.")
+        return redirect('admin:login')
+    
+    user_messages = EncryptedMessage.objects.filter(user=user).defer(*EncryptedMessage.LARGE_FIELDS)
     
-    # Statistiques
-    today = timezone.now().date()
-    month_start = today.replace(day=1)
+    # Recherche plein texte (?q=) ; fts_available peut interroger la base une fois
+    query = request.GET.get('q', '').strip()
+    user_messages = await sync_to_async(search_messages)(user_messages, query)
     
-    messages_this_month = user_messages.filter(created_at__gte=month_start).count()
-    messages_today = user_messages.filter(created_at__date=today).count()
-    unique_keys = user_messages.exclude(encryption_key='').values('encryption_key').distinct().count()
+    # Statistiques (compteurs maintenus à l'écriture, voir accounting.py)
+    stats = await aget_message_stats(user)
     
-    # Pagination
-    paginator = Paginator(user_messages, 10)  # 10 messages par page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination par curseur (?after= / ?before=)
+    paginator = KeysetPaginator(user_messages, 10)  # 10 messages par page
+    page_obj = await sync_to_async(paginator.get_page)(request.GET.get('after'), request.GET.get('before'))
     
     context = {
         'messages': page_obj,
-        'messages_this_month': messages_this_month,
-        'messages_today': messages_today,
-        'unique_keys': unique_keys,
+        'query': query,
+        **stats,
     }
     
-    return render(request, 'crypto_app/messages.html', context)
\ No newline at end of file
+    return await sync_to_async(render)(request, 'crypto_app/messages.html', context)
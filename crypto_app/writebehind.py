@@ -0,0 +1,172 @@
+# crypto_app/writebehind.py
+"""Écriture différée des messages (settings.CRYPTO_WRITE_BEHIND).
+
+Les vues déposent les messages dans une file en mémoire et répondent sans
+attendre la base ; un unique thread d'écriture vide la file par lots, un
+bulk_create par transaction. SQLite n'acceptant qu'un écrivain à la fois,
+les requêtes concurrentes ne se disputent plus le verrou d'écriture.
+
+Les messages encore en file sont perdus si le processus est tué (SIGKILL) :
+la file est vidée à l'arrêt normal (atexit) ou via flush().
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import EncryptedMessage
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de messages écrits par transaction
+WRITE_BATCH_SIZE = 500
+
+
+class WriteBehindQueue:
+    def __init__(self, maxsize=10000, batch_size=WRITE_BATCH_SIZE):
+        # File bornée : si l'écriture prend du retard, put() bloque (contre-pression)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.written = 0
+        self.failed = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        """Dépose un message non enregistré ; il sera écrit par le thread d'écriture"""
+        self._ensure_writer()
+        self._queue.put(message)
+
+    def depth(self):
+        """Nombre de messages en attente d'écriture (y compris le lot en cours)"""
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout=None):
+        """Attend que tous les messages déposés soient écrits ; retourne False si le délai expire"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if self._thread is None or not self._thread.is_alive():
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='crypto-write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Regrouper tout ce qui est arrivé entre-temps, dans la limite d'un lot
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _release(message):
+        from .accounting import release_quota
+        try:
+            release_quota([message])
+        except Exception:
+            logger.exception("Écriture différée: quota réservé non rendu")
+
+    def _write(self, batch):
+        from .accounting import record_created
+        try:
+            for message in batch:
+                message.prepare_ciphertext()
+            with transaction.atomic():
+                EncryptedMessage.objects.bulk_create(batch)
+                record_created(batch)
+            self.written += len(batch)
+        except Exception:
+            # Lot rejeté (ex: utilisateur supprimé entre-temps) : écriture une à une
+            logger.exception("Écriture différée: échec du lot de %d messages", len(batch))
+            for message in batch:
+                message.pk = None
+                message._state.adding = True
+                try:
+                    message.save()
+                    self.written += 1
+                except Exception:
+                    logger.exception("Écriture différée: message abandonné")
+                    self.failed += 1
+                    self._release(message)
+        finally:
+            connection.close_if_unusable_or_obsolete()
+
+
+_write_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """File d'écriture partagée du processus, créée à la demande"""
+    global _write_queue
+    with _queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteBehindQueue(
+                maxsize=getattr(settings, 'CRYPTO_WRITE_BEHIND_MAX_SIZE', 10000)
+            )
+        return _write_queue
+
+
+def is_enabled():
+    return getattr(settings, 'CRYPTO_WRITE_BEHIND', False)
+
+
+def save_message(message):
+    """Enregistre un nouveau message, en différé si CRYPTO_WRITE_BEHIND est activé.
+
+    Le quota réservé pour le message (accounting.reserve_quota) est rendu si l'écriture échoue.
+    """
+    from .accounting import release_quota
+    if is_enabled():
+        get_write_queue().put(message)
+        return
+    try:
+        message.save()
+    except Exception:
+        release_quota([message])
+        raise
+
+
+async def asave_message(message):
+    """Version async de save_message"""
+    if is_enabled():
+        await sync_to_async(get_write_queue().put, thread_sensitive=False)(message)
+    else:
+        await sync_to_async(save_message)(message)
+
+
+def queue_stats():
+    """État de la file : activation, profondeur et compteurs d'écriture"""
+    write_queue = _write_queue
+    return {
+        'enabled': is_enabled(),
+        'depth': write_queue.depth() if write_queue else 0,
+        'written': write_queue.written if write_queue else 0,
+        'failed': write_queue.failed if write_queue else 0,
+    }
+
+
+@atexit.register
+def _flush_on_exit():
+    if _write_queue is not None:
+        _write_queue.flush(timeout=getattr(settings, 'CRYPTO_WRITE_BEHIND_FLUSH_TIMEOUT', 30))